@@ -1386,6 +1386,16 @@ c.add_valid("--osinfo list", grep="osinfo-query os")  # --osinfo list
 c.add_valid(
     f"--cdrom {MEDIA_DIR}/fake-win-multi.iso --disk none "
 )  # verify media that matches multi OS doesn't blow up.
+c.add_valid(
+    "--fleet %(XMLDIR)s/fleet/fleet.json --dry-run", grep="Fleet finished: 3 succeeded, 0 failed"
+)  # --fleet with shared media and generated name
+c.add_invalid(
+    "--fleet %(XMLDIR)s/fleet/fleet-dup.json --dry-run", grep="is used more than once in the fleet"
+)
+c.add_invalid("--fleet /idontexist.json", grep="Error reading fleet manifest")
+c.add_valid(
+    "--location http://example.com --dry-run --cache-stats", grep="Install media cache is disabled"
+)  # --cache-stats without the cache enabled
 
 
 ####################
@@ -2114,6 +2124,30 @@ c.add_invalid("test --add-device --xml ./@foo=bar", grep="Cannot use --add-devic
 c.add_invalid(
     "test-for-virtxml --edit --boot refresh-machine-type=yes", grep="Don't know how to refresh"
 )
+c.add_valid(
+    "--domains-matching 'test-state-*' --jobs 2 --print-diff --edit --cpu host-passthrough",
+    grep="6 succeeded, 0 failed",
+)  # batch mode
+c.add_invalid(
+    "--domains-from %s/virtxml-batch-domains.txt --print-diff --edit --cpu host-passthrough"
+    % _VIRTXMLDIR,
+    grep="2 succeeded, 1 failed",
+)  # batch mode, skips comments and dups, reports failures
+c.add_invalid(
+    "--domains-matching 'idontexist*' --edit --cpu host-passthrough",
+    grep="No domains matched",
+)
+c.add_invalid(
+    "test --domains-matching 'test*' --edit --cpu host-passthrough",
+    grep="A domain can not be specified",
+)
+c.add_invalid(
+    "--domains-matching 'test*' --confirm --edit --cpu host-passthrough",
+    grep="Can't use --confirm with batch",
+)
+c.add_invalid(
+    "--domains-from /idontexist --edit --cpu host-passthrough", grep="Error reading domain list"
+)
 c.add_compare("test --print-xml --edit --vcpus 7", "print-xml")  # test --print-xml
 c.add_compare(
     "--edit --cpu host-passthrough",
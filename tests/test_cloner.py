@@ -6,9 +6,12 @@
 import os
 import tempfile
 
+import pytest
+
 from tests import utils
 
 from virtinst import Cloner
+from virtinst import progress
 
 
 CLI_XMLDIR = utils.DATADIR + "/cli/virtclone/"
@@ -44,6 +47,91 @@ def test_clone_unmanaged():
     assert open(tmp2.name).read() == open(inp2).read()
 
 
+def test_clone_unmanaged_parallel():
+    """
+    Test cloning multiple disks concurrently, with combined progress,
+    and cleanup of cloned disks if one fails
+    """
+    xmlpath = CLI_XMLDIR + "clone-disk.xml"
+    conn = utils.URIs.open_testdefault_cached()
+    xml = open(xmlpath).read()
+    inp1 = os.path.abspath(__file__)
+    inp2 = xmlpath
+    xml = xml.replace("/tmp/__virtinst_cli_exist1.img", inp1)
+    xml = xml.replace("/tmp/__virtinst_cli_exist2.img", inp2)
+
+    class _TestMeter(progress.Meter):
+        def __init__(self):
+            progress.Meter.__init__(self, quiet=True)
+            self.starts = []
+            self.totals = []
+
+        def start(self, text, size):
+            self.starts.append(text)
+            progress.Meter.start(self, text, size)
+
+        def update(self, new_total):
+            self.totals.append(new_total)
+            progress.Meter.update(self, new_total)
+
+    def _make_cloner(tmp1, tmp2):
+        cloner = Cloner(conn, src_xml=xml)
+        cloner.set_clone_jobs(2)
+        diskinfos = cloner.get_nonshare_diskinfos()
+        diskinfos[0].set_new_path(tmp1.name, False)
+        diskinfos[1].set_new_path(tmp2.name, False)
+        cloner.prepare()
+        return cloner, diskinfos
+
+    tmp1 = tempfile.NamedTemporaryFile()
+    tmp2 = tempfile.NamedTemporaryFile()
+    cloner, dummy = _make_cloner(tmp1, tmp2)
+    meter = _TestMeter()
+    cloner.start_duplicate(meter)
+    assert open(tmp1.name).read() == open(inp1).read()
+    assert open(tmp2.name).read() == open(inp2).read()
+    assert meter.starts == ["Cloning 2 disks"]
+    assert meter.totals[-1] > max(os.path.getsize(inp1), os.path.getsize(inp2))
+    conn.lookupByName(cloner.new_guest.name).undefine()
+
+    # If one disk fails, pre-existing destinations are left alone
+    tmp1 = tempfile.NamedTemporaryFile()
+    tmp2 = tempfile.NamedTemporaryFile()
+    cloner, diskinfos = _make_cloner(tmp1, tmp2)
+
+    def _fail(meter):
+        raise RuntimeError("clone failure")
+
+    diskinfos[1].new_disk.build_storage = _fail
+    with pytest.raises(RuntimeError, match="clone failure"):
+        cloner.start_duplicate(None)
+    assert os.path.exists(tmp1.name)
+    assert os.path.exists(tmp2.name)
+
+    # Destinations this run created are removed, including the
+    # partially written failing one, with and without parallel jobs
+    for jobs in [1, 2]:
+        tmpdir = tempfile.TemporaryDirectory()
+        new1 = tempfile.NamedTemporaryFile(dir=tmpdir.name)
+        new2 = tempfile.NamedTemporaryFile(dir=tmpdir.name)
+        new1.close()
+        new2.close()
+        cloner, diskinfos = _make_cloner(new1, new2)
+        cloner.set_clone_jobs(jobs)
+
+        def _partial_fail(meter):
+            with open(new2.name, "w") as fileobj:
+                fileobj.write("partial")
+            raise RuntimeError("clone failure")
+
+        diskinfos[1].new_disk.build_storage = _partial_fail
+        with pytest.raises(RuntimeError, match="clone failure"):
+            cloner.start_duplicate(None)
+        assert not os.path.exists(new1.name)
+        assert not os.path.exists(new2.name)
+        tmpdir.cleanup()
+
+
 def test_generate_name():
     conn = utils.URIs.open_testdriver_cached()
 
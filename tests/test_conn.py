@@ -2,14 +2,19 @@
 # See the COPYING file in the top-level directory.
 
 import os
+import threading
 
 import pytest
 
 from virtinst import cli
+from virtinst import diskbackend
 from virtinst import pollhelpers
 from virtinst import StoragePool
+from virtinst import StorageVolume
 from virtinst import URI
 
+from tests import utils
+
 
 ############################
 # VirtinstConnection tests #
@@ -94,3 +99,139 @@ def test_poll():
     poolobj1.undefine()
     poolobj2.destroy()
     poolobj2.undefine()
+
+
+def test_fetch_cache():
+    # Coverage for fetch cache TTL, invalidation and indexed lookups
+    # pylint: disable=protected-access
+    conn = cli.getConnection("test:///default")
+
+    guest = conn.fetch_domain_by_name("test")
+    assert guest.name == "test"
+    assert conn.fetch_domain_by_uuid(guest.uuid.upper()) is guest
+    assert conn.fetch_domain_by_name("idontexist") is None
+    assert conn.fetch_pool_by_name("default-pool").name == "default-pool"
+    assert conn.fetch_nodedev_by_name("computer").name == "computer"
+    assert conn.fetch_vol_by_path("/idontexist") is None
+
+    # Installing a volume drops the cached volume list
+    volxml = StorageVolume(conn)
+    volxml.pool = conn.storagePoolLookupByName("default-pool")
+    volxml.name = "fetchcache.img"
+    volxml.capacity = 1024 * 1024
+    volobj = volxml.install()
+    volpath = volobj.path()
+    volcache = conn.fetch_vol_by_path(volpath)
+    assert volcache.name == "fetchcache.img"
+    assert volcache.pool_name == "default-pool"
+
+    # Pool refresh only refetches that pool's volumes
+    poolxml = conn.fetch_pool_by_name("default-pool")
+    assert conn.fetch_pool_by_path(poolxml.target_path) is poolxml
+    volobj.delete(0)
+    conn.cache_pool_refresh(volxml.pool)
+    assert conn.fetch_vol_by_path(volpath) is None
+
+    # A volume created behind our back is looked up and indexed on its
+    # own, later lookups are answered from the cached XML
+    volxml.name = "fetchcache2.img"
+    volobj = volxml.pool.createXML(volxml.get_xml(), 0)
+    volpath = volobj.path()
+    assert conn.fetch_vol_by_path(volpath) is None
+    vol, pool = diskbackend._check_if_path_managed(conn, volpath)
+    assert vol.name() == "fetchcache2.img"
+    assert conn.fetch_vol_by_path(volpath).name == "fetchcache2.img"
+    vol, pool = diskbackend._check_if_path_managed(conn, volpath)
+    assert pool.name() == "default-pool"
+    assert vol.storagePoolLookupByVolume() is pool
+    assert StorageVolume(conn, parsexml=vol.XMLDesc(0)).name == "fetchcache2.img"
+    assert "default-pool" in pool.XMLDesc(0)
+    assert vol.key() == volobj.key()
+    vol.delete(0)
+    assert conn.fetch_vol_by_path(volpath) is None
+
+    # Lookups reuse the cached list rather than refetching
+    assert conn.fetch_domain_by_name("test") is guest
+
+    # Defining a domain drops the cached domain list
+    newxml = guest.get_xml().replace(">test<", ">fetchcachetest<")
+    newxml = newxml.replace(guest.uuid, "11111111-2222-3333-4444-555555555555")
+    dom = conn.defineXML(newxml)
+    assert conn.fetch_domain_by_name("fetchcachetest")
+    assert conn.fetch_domain_by_name("test") is not guest
+    dom.undefine()
+
+    # Explicit invalidation, and TTL expiry
+    guest = conn.fetch_domain_by_name("test")
+    conn.invalidate_fetch_cache(pools=True, vols=True, nodedevs=True)
+    assert conn.fetch_domain_by_name("test") is guest
+    conn.invalidate_fetch_cache()
+    assert conn.fetch_domain_by_name("test") is not guest
+
+    guest = conn.fetch_domain_by_name("test")
+    conn._fetch_cache._ttls = {"vms": -1}
+    assert conn.fetch_domain_by_name("test") is not guest
+    conn.close()
+
+
+def test_fetch_cache_threaded(monkeypatch):
+    # Fetching and index lookups stay consistent while other threads
+    # invalidate the cache, like concurrent virt-xml/clone jobs do
+    conn = cli.getConnection("test:///default")
+    guest = conn.fetch_domain_by_name("test")
+    monkeypatch.setattr(conn, "_fetch_all_domains_raw", lambda: [guest])
+
+    stop = threading.Event()
+    errors = []
+
+    def _invalidate():
+        while not stop.is_set():
+            conn.invalidate_fetch_cache(domains=True)
+
+    def _fetch():
+        try:
+            for dummy in range(2000):
+                assert conn.fetch_domain_by_name("test") is guest
+                assert conn.fetch_all_domains() == [guest]
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    invalidator = threading.Thread(target=_invalidate)
+    fetchers = [threading.Thread(target=_fetch) for dummy in range(4)]
+    invalidator.start()
+    for thread in fetchers:
+        thread.start()
+    for thread in fetchers:
+        thread.join()
+    stop.set()
+    invalidator.join()
+    conn.close()
+    assert not errors
+
+
+def test_caps_cache(monkeypatch, tmp_path):
+    # Repeated domcaps/caps fetches are served from the connection cache
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setenv("VIRTINST_CAPS_CACHE", "1")
+    conn = cli.getConnection(utils.URIs.kvm_x86)
+    args = ("/usr/bin/qemu-system-x86_64", "x86_64", "q35", "kvm")
+    xml1 = conn.getDomainCapabilities(*args)
+    xml2 = conn.getDomainCapabilities(*args)
+    assert xml1 == xml2
+    stats = conn.get_caps_cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+    # Invalidating drops the disk copy too, so caps are fetched live
+    conn.invalidate_caps()
+    assert conn.caps
+    stats = conn.get_caps_cache_stats()
+    assert stats["disk_hits"] == 0
+    assert stats["misses"] == 3
+    conn.close()
+
+    # A new connection picks the XML up from disk
+    conn = cli.getConnection(utils.URIs.kvm_x86)
+    assert conn.getDomainCapabilities(*args) == xml1
+    assert conn.get_caps_cache_stats()["disk_hits"] == 2
+    conn.close()
@@ -3,6 +3,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import errno
 import os
 import tempfile
 
@@ -118,6 +119,12 @@ def test_disk_paths_in_use():
     )
     assert vms == [["test-arm-kernel"], ["test-arm-kernel"]]
 
+    # The index is reused until the domain list changes
+    index = virtinst.DeviceDisk.get_path_index(conn)
+    assert virtinst.DeviceDisk.get_path_index(conn) is index
+    conn.invalidate_fetch_cache(domains=True)
+    assert virtinst.DeviceDisk.get_path_index(conn) is not index
+
 
 def test_disk_diskbackend_misc():
     # Test get_size() with vol_install
@@ -176,6 +183,44 @@ def test_disk_diskbackend_misc():
         assert "StoragePool.install testsuite mocked failure" in str(e)
 
 
+def test_disk_clone_sparse(monkeypatch):
+    # Cloning a file with holes and data needs to preserve content,
+    # with and without the reflink/copy_file_range fast paths
+    conn = utils.URIs.openconn("test:///default")
+    tmpinput = tempfile.NamedTemporaryFile()
+    with open(tmpinput.name, "wb") as f:
+        f.truncate(8 * 1024 * 1024)
+        f.seek(1024 * 1024 + 17)
+        f.write(b"virtinst" * 1000)
+        f.seek(5 * 1024 * 1024)
+        f.write(b"\0" * 8192 + b"virtinst")
+    origdata = open(tmpinput.name, "rb").read()
+
+    srcdisk = virtinst.DeviceDisk(conn)
+    srcdisk.set_source_path(tmpinput.name)
+
+    def _clone(sparse):
+        tmpoutput = tempfile.NamedTemporaryFile()
+        os.unlink(tmpoutput.name)
+        newdisk = virtinst.DeviceDisk(conn)
+        newdisk.set_source_path(tmpoutput.name)
+        newdisk.set_local_disk_to_clone(srcdisk, sparse)
+        newdisk.build_storage(None)
+        newdata = open(tmpoutput.name, "rb").read()
+        assert newdata[: len(origdata)] == origdata
+
+    _clone(True)
+    _clone(False)
+
+    def _fail(*args, **kwargs):
+        raise OSError(errno.EXDEV, "mocked failure")
+
+    monkeypatch.setattr("fcntl.ioctl", _fail)
+    monkeypatch.setattr("os.copy_file_range", _fail)
+    _clone(True)
+    _clone(False)
+
+
 def test_disk_diskbackend_parse():
     # Test that calling validate() on parsed disk XML doesn't attempt
     # to verify the path exists. Assume it's a working config
@@ -5,6 +5,7 @@
 
 import io
 import os
+import re
 import unittest
 
 import virtinst
@@ -118,6 +119,123 @@ def test_misc_nonpredicatble_generate():
     virtinst.DeviceInterface.check_mac_in_use(predconn, None)
 
 
+def test_misc_mac_registry():
+    """
+    Test MAC normalization and the network entries in the MAC registry
+    """
+    # pylint: disable=protected-access
+    import pytest
+
+    from virtinst import cli
+    from virtinst.devices import interface
+
+    conn = utils.URIs.open_testdefault_cached()
+    with pytest.raises(RuntimeError, match="in use by another"):
+        virtinst.DeviceInterface.check_mac_in_use(conn, "22-22-33-44-aa-bb")
+    virtinst.DeviceInterface.check_mac_in_use(conn, "not-a-mac")
+
+    testconn = cli.getConnection("test:///default")
+    macs = virtinst.DeviceInterface.generate_macs(testconn, 50)
+    assert len(set(macs)) == 50
+
+    netxml = """
+<network>
+  <name>foo</name>
+  <mac address='52:54:00:00:00:01'/>
+  <ip address='192.168.100.1' netmask='255.255.255.0'>
+    <dhcp>
+      <host mac='52:54:00:AA:BB:CC' ip='192.168.100.2'/>
+    </dhcp>
+  </ip>
+</network>
+"""
+    net = virtinst.Network(conn, parsexml=netxml)
+    registry = interface._MACRegistry([], [net])
+    assert registry.is_taken(interface._mac_to_int("52:54:00:aa:bb:cc"))
+    assert registry.is_taken(interface._mac_to_int("52:54:00:00:00:01"))
+    assert not registry.vm_has(interface._mac_to_int("52:54:00:aa:bb:cc"))
+    assert interface._mac_to_int("52:54:00:aa:bb") is None
+
+
+def test_misc_generatename_existing():
+    """
+    generate_name with an 'existing' snapshot should pick the same name
+    as plain callback checking, only confirming the final pick
+    """
+    from virtinst import generatename
+
+    existing = set(["foo", "foo-1", "foo-2", "foo-4", "foo-02", "bar.img"])
+    checked = []
+
+    def cb(n):
+        checked.append(n)
+        return n in existing
+
+    assert generatename.generate_name("foo", cb) == "foo-3"
+    checked.clear()
+    assert generatename.generate_name("foo", cb, existing=existing) == "foo-3"
+    assert checked == ["foo-3"]
+    assert generatename.generate_name("bar", cb, suffix=".img", existing=existing) == "bar-1.img"
+    assert generatename.generate_name("baz", cb, existing=existing) == "baz"
+
+    # Stale snapshot, the callback still has the final say
+    checked.clear()
+    ret = generatename.generate_name("foo", cb, existing=set(), force_num=True)
+    assert ret == "foo-3"
+    assert checked == ["foo-1", "foo-2", "foo-3"]
+
+    conn = utils.URIs.open_testdefault_cached()
+    names = generatename.list_existing(conn.listAllDomains, lambda d: d.name())
+    assert "test" in names
+
+
+def test_misc_cli_optstr_parsing():
+    """
+    Check the cli suboption fast paths match the slow generic handling
+    """
+    import shlex
+    from virtinst import cli
+
+    def _shlex_split(optstr):
+        argsplitter = shlex.shlex(optstr, posix=True)
+        argsplitter.commenters = ""
+        argsplitter.whitespace = ","
+        argsplitter.whitespace_split = True
+        return list(argsplitter)
+
+    for optstr in [
+        "",
+        "path=foo,size=5,path=bar",
+        ",,bus=virtio,,,cache=none,",
+        "xpath.set=./foo[@bar='baz'],model=virtio",
+        'xpath.set="a,b",foo=bar',
+        r"path=/tmp/foo\,bar,size=1",
+        "name=spa ce#hash,=noname,novalue",
+    ]:
+        expect = [(o.split("=", 1) + [None])[:2] for o in _shlex_split(optstr)]
+        assert [list(t) for t in cli.parse_optstr_tuples(optstr)] == expect
+
+    # Name lookups match registration order, including regex clinames
+    table = cli.ParserDisk._get_virtarg_table()
+    for name in ["path", "seclabel0.model", "seclabel12.label", "driver.name", "notreal"]:
+        expect = None
+        for argidx, virtarg in enumerate(cli.ParserDisk._virtargs):
+            for cliname in virtarg.all_clinames():
+                regex = "%s$" % cliname.replace(".", r"\.")
+                if re.match(regex, name) and expect is None:
+                    expect = argidx
+        assert table.lookup(name) == expect
+    assert table.lookup("notreal") is None
+    assert cli.ParserDisk._get_virtarg_table() is table
+
+    # Params are handed back in virtarg order, keeping key order
+    parser = cli.ParserDisk("seclabel1.model=b,size=5,path=/foo,seclabel0.model=a")
+    optdict = parser.optdict.copy()
+    params = parser._optdict_to_param_list(optdict)
+    assert [p.key for p in params] == ["size", "seclabel1.model", "seclabel0.model", "path"]
+    assert not optdict
+
+
 def test_misc_support_cornercases():
     """
     Test support.py corner cases
@@ -242,3 +360,211 @@ def test_misc_meter():
     # BaseMeter coverage
     meter = _progresspriv.BaseMeter()
     _test_meter_values(meter)
+
+
+def test_misc_urlfetcher_resume_verify():
+    """
+    Test HTTP download resume from a .part file, and checksum verification
+    """
+    # pylint: disable=protected-access
+    import hashlib
+    import tempfile
+
+    import pytest
+
+    from virtinst import progress
+    from virtinst.install import urlfetcher
+
+    content = b"0123456789" * 1000
+    requests_seen = []
+
+    class _Response:
+        def __init__(self, headers):
+            self.headers = {"etag": '"abc"'}
+            start = 0
+            if headers.get("If-Range") == '"abc"':
+                start = int(headers["Range"][len("bytes=") : -1])
+            self.status_code = start and 206 or 200
+            self._data = content[start:]
+            self.headers["content-length"] = len(self._data)
+
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, chunk_size):
+            dummy = chunk_size
+            return [self._data]
+
+    class _Session:
+        failures = 0
+
+        def get(self, url, stream, headers):
+            dummy = stream
+            requests_seen.append((url, headers))
+            if self.failures:
+                self.failures -= 1
+                raise urlfetcher.requests.exceptions.ConnectionError("connection reset")
+            return _Response(headers)
+
+        def close(self):
+            pass
+
+    url = "https://example.com/tree/images/pxeboot/initrd.img"
+    with tempfile.TemporaryDirectory() as scratchdir:
+        fetcher = urlfetcher.fetcherForURI(
+            "https://example.com/tree", scratchdir, progress.make_meter(quiet=True)
+        )
+        fetcher._session = _Session()
+        fetcher._verify_checksums = True
+        fetcher.set_checksums(
+            {"images/pxeboot/initrd.img": "sha256:" + hashlib.sha256(content).hexdigest()}
+        )
+
+        # Fake an interrupted earlier download
+        partfn = fetcher._get_partial_path(url, "images/pxeboot/initrd.img")
+        with open(partfn, "wb") as f:
+            f.write(content[:4000])
+        with open(partfn + ".meta", "w") as f:
+            f.write('"abc"')
+
+        fn = fetcher.acquireFile("images/pxeboot/initrd.img")
+        assert requests_seen[-1][1]["Range"] == "bytes=4000-"
+        assert open(fn, "rb").read() == content
+        assert not os.path.exists(partfn)
+        assert not os.path.exists(partfn + ".meta")
+        os.unlink(fn)
+
+        # A connection error opening the request is retried, and the
+        # retry still resumes from the .part file
+        with open(partfn, "wb") as f:
+            f.write(content[:4000])
+        with open(partfn + ".meta", "w") as f:
+            f.write('"abc"')
+        fetcher._session.failures = 1
+        del requests_seen[:]
+        fn = fetcher.acquireFile("images/pxeboot/initrd.img")
+        assert len(requests_seen) == 2
+        assert requests_seen[-1][1]["Range"] == "bytes=4000-"
+        assert open(fn, "rb").read() == content
+        assert not os.path.exists(partfn)
+        os.unlink(fn)
+
+        # While another download holds the .part file, we use a private
+        # file and leave the shared one alone
+        with open(partfn, "wb") as f:
+            f.write(content[:4000])
+        with open(partfn + ".meta", "w") as f:
+            f.write('"abc"')
+        with fetcher._locked_partial(partfn) as lockedfn:
+            assert lockedfn == partfn
+            fn = fetcher.acquireFile("images/pxeboot/initrd.img")
+            assert "Range" not in requests_seen[-1][1]
+            assert open(fn, "rb").read() == content
+            assert open(partfn, "rb").read() == content[:4000]
+            os.unlink(fn)
+        fetcher._discard_partial(partfn)
+
+        # Checksum mismatch removes the downloaded file
+        fetcher.set_checksums({"images/pxeboot/initrd.img": "sha256:" + "0" * 64})
+        with pytest.raises(ValueError, match="Checksum mismatch"):
+            fetcher.acquireFile("images/pxeboot/initrd.img")
+        assert os.listdir(scratchdir) == []
+
+    sums = urlfetcher._parse_sha256sums(
+        "%s  boot.iso\nSHA256 (other.iso) = %s\n" % ("a" * 64, "B" * 64)
+    )
+    assert sums == {"boot.iso": "sha256:" + "a" * 64, "other.iso": "sha256:" + "b" * 64}
+
+
+def test_misc_media_cache():
+    """
+    Test the persistent install media cache, and fetcher use of it
+    """
+    # pylint: disable=protected-access
+    import hashlib
+    import tempfile
+
+    from virtinst import progress
+    from virtinst.install import urlfetcher
+    from virtinst.install.mediacache import MediaCache
+
+    with tempfile.TemporaryDirectory() as cachedir:
+        cache = MediaCache(cachedir, 25000)
+        data1 = b"1" * 10000
+        cache.add_data("https://example.com/a", '"v1"', data1)
+        with cache.lookup("https://example.com/a", '"v1"') as fileobj:
+            assert fileobj.read() == data1
+        assert cache.lookup("https://example.com/a", '"v2"') is None
+        assert cache.lookup("https://example.com/a") is None
+        checksum = "sha256:" + hashlib.sha256(data1).hexdigest()
+        cache.lookup("https://example.com/other", checksum=checksum).close()
+
+        # Going over the size limit evicts the oldest entry
+        cache.add_data("https://example.com/b", '"v1"', b"2" * 10000)
+        cache.add_data("https://example.com/c", '"v1"', b"3" * 10000)
+        stats = cache.get_stats()
+        assert stats["entries"] == 2
+        assert stats["size"] == 20000
+        assert stats["hits"] == 2
+        assert stats["misses"] == 2
+        assert stats["bytes_saved"] == 20000
+
+        # Index is shared with a new instance, like a later process
+        cache = MediaCache(cachedir, 25000)
+        cache.lookup("https://example.com/c", '"v1"').close()
+
+        # An entry evicted by another process right after lookup is
+        # still readable through the returned file
+        fileobj = cache.lookup("https://example.com/c", '"v1"')
+        for objname in os.listdir(os.path.join(cachedir, "objects")):
+            os.unlink(os.path.join(cachedir, "objects", objname))
+        assert fileobj.read() == b"3" * 10000
+        fileobj.close()
+        assert cache.lookup("https://example.com/c", '"v1"') is None
+
+        parsed = []
+        for dummy in range(2):
+            cache.memoize("test", "foo", lambda c: parsed.append(c) or c)
+        assert parsed == ["foo"]
+
+        # Second fetch of the same file is served from the cache
+        content = b"kernel" * 1000
+        gets = []
+
+        class _Response:
+            status_code = 200
+            headers = {"etag": '"k1"', "content-length": len(content)}
+
+            def raise_for_status(self):
+                pass
+
+            def iter_content(self, chunk_size):
+                dummy = chunk_size
+                return [content]
+
+        class _Session:
+            def head(self, url, allow_redirects):
+                dummy = allow_redirects
+                return _Response()
+
+            def get(self, url, stream, headers):
+                dummy = stream
+                dummy = headers
+                gets.append(url)
+                return _Response()
+
+            def close(self):
+                pass
+
+        scratchdir = os.path.join(cachedir, "scratch")
+        os.mkdir(scratchdir)
+        fetcher = urlfetcher.fetcherForURI(
+            "https://example.com/tree", scratchdir, progress.make_meter(quiet=True)
+        )
+        fetcher._session = _Session()
+        fetcher.set_media_cache(cache)
+        for dummy in range(2):
+            fn = fetcher.acquireFile("images/vmlinuz")
+            assert open(fn, "rb").read() == content
+            os.unlink(fn)
+        assert len(gets) == 1
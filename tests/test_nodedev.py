@@ -206,6 +206,23 @@ def testNodeDev2PCI():
     _testNode2DeviceCompare(conn, nodename, devfile)
 
 
+def testHostdevInUseBy():
+    conn = utils.URIs.open_testdriver_cached()
+
+    # The index must agree with comparing every hostdev of every VM
+    for nodedev in conn.fetch_all_nodedevs():
+        expected = []
+        for vm in conn.fetch_all_domains():
+            if any(nodedev.compare_to_hostdev(h) for h in vm.devices.hostdev):
+                expected.append(vm.name)
+        assert NodeDevice.hostdev_in_use_by(conn, nodedev) == expected
+
+    # USB hostdev with only vendor/product matches both duplicate devices
+    for nodename in ["usb_5_20", "usb_5_21"]:
+        nodedev = _nodeDevFromName(conn, nodename)
+        assert "test-many-devices" in NodeDevice.hostdev_in_use_by(conn, nodedev)
+
+
 def testNodeDevFail():
     conn = utils.URIs.open_testdriver_cached()
     nodename = "usb_device_1d6b_1_0000_00_1d_1_if0"
@@ -110,3 +110,62 @@ def test_drivers():
     assert win7.supports_unattended_drivers("x86_64") is True
     assert win7.supports_unattended_drivers("fakearch") is False
     assert win7.get_pre_installable_drivers_location("x86_64")
+
+
+def test_os_catalog():
+    # Lookups are answered from the shared catalog
+    assert OSDB.lookup_os("fedora29") is OSDB.lookup_os("fedora29")
+    f29 = OSDB.lookup_os("fedora29")
+    assert OSDB.lookup_os_by_full_id(f29.full_id) is f29
+    assert OSDB.lookup_os("idontexist") is None
+    assert OSDB.lookup_os_by_full_id("http://idontexist") is None
+
+    # list_os hands out a copy of the presorted list
+    oslist = OSDB.list_os()
+    oslist.pop()
+    assert len(OSDB.list_os()) == len(oslist) + 1
+    labels = OSDB.list_os(sortkey="label")
+    assert len(labels) == len(oslist) + 1
+
+    # Relationship checks, including the memoized path
+    # pylint: disable=protected-access
+    centos = OSDB.lookup_os("centos6.0")
+    assert centos._is_related_to("rhel6.0")
+    assert centos._is_related_to(["fedora10", "rhel6.0"])
+    assert not centos._is_related_to("win7")
+    assert not OSDB.lookup_os("win7")._is_related_to("rhel6.0")
+
+
+def test_os_snapshot(monkeypatch, tmp_path):
+    # pylint: disable=protected-access
+    from virtinst import osdict
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setenv("VIRTINST_OSINFO_SNAPSHOT", "1")
+    snappath = tmp_path / "virt-manager" / "osinfo-snapshot.json"
+
+    # First use writes the snapshot
+    osdb1 = osdict._OSDB()
+    f29 = osdb1.lookup_os("fedora29")
+    assert snappath.exists()
+
+    # Second use is served from it, without touching libosinfo
+    osdb2 = osdict._OSDB()
+    snapf29 = osdb2.lookup_os("fedora29")
+    assert osdb2._OSDB__os_loader is None
+    assert snapf29.full_id == f29.full_id
+    assert snapf29.label == f29.label
+    assert snapf29.eol == f29.eol
+    assert snapf29.supports_virtionet() == f29.supports_virtionet()
+    assert snapf29.get_location("x86_64") == f29.get_location("x86_64")
+    assert snapf29.get_kernel_url_arg() == f29.get_kernel_url_arg()
+    assert osdb2.lookup_os("centos6.0")._is_related_to("rhel6.0")
+    ram = f29.get_recommended_resources().get_recommended_ram("x86_64")
+    assert snapf29.get_recommended_resources().get_recommended_ram("x86_64") == ram
+    assert snapf29.get_handle().get_id() == f29.full_id
+
+    # A changed stamp or version invalidates the snapshot
+    monkeypatch.setattr(osdict, "_SNAPSHOT_VERSION", -1)
+    assert osdict._OsinfoSnapshot(str(snappath)).load() is None
+    snappath.write_text("not json")
+    assert osdict._OsinfoSnapshot(str(snappath)).load() is None
@@ -0,0 +1,171 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import threading
+import time
+
+from virtManager.lib.tickscheduler import TickScheduler
+
+
+class _FakeConn:
+    """
+    Minimal stand-in for vmmConnection, recording every tick
+    """
+
+    def __init__(self, uri, delay=0, fail=False):
+        self.uri = uri
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.started = threading.Event()
+        self.gate = None
+        self._lock = threading.Lock()
+
+    def get_uri(self):
+        return self.uri
+
+    def tick_from_engine(self, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.calls.append(kwargs)
+        self.started.set()
+        try:
+            if self.gate:
+                self.gate.wait(5)
+            time.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("tick failed")
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _wait(cb, timeout=5):
+    end = time.monotonic() + timeout
+    while not cb():
+        assert time.monotonic() < end, "timed out waiting"
+        time.sleep(0.005)
+
+
+def _idle(scheduler):
+    # pylint: disable=protected-access
+    def cb():
+        with scheduler._cond:
+            return not scheduler._queue and not any(s.running for s in scheduler._states.values())
+
+    return cb
+
+
+def test_tick_priority_merge():
+    # Priority ticks requested while one is pending are merged
+    scheduler = TickScheduler(60)
+    conn = _FakeConn("test:///a")
+    conn.gate = threading.Event()
+    scheduler.schedule_priority(conn, {"pollvm": True})
+    assert conn.started.wait(5)
+
+    scheduler.schedule_priority(conn, {"pollnet": True})
+    scheduler.schedule_priority(conn, {"pollpool": True, "force": True})
+    scheduler.schedule_priority(conn, {"pollnet": False})
+    conn.gate.set()
+    _wait(_idle(scheduler))
+
+    assert conn.calls == [
+        {"pollvm": True},
+        {"pollnet": True, "pollpool": True, "force": True},
+    ]
+
+
+def test_tick_serialized_per_conn():
+    # A connection is never ticked concurrently, but others still run
+    scheduler = TickScheduler(0.001)
+    conn1 = _FakeConn("test:///a", delay=0.005)
+    for dummy in range(20):
+        scheduler.schedule_priority(conn1, {"pollvm": True})
+        scheduler.schedule_regular([conn1], {"stats_update": True})
+        time.sleep(0.002)
+    _wait(_idle(scheduler))
+    assert len(conn1.calls) > 1
+    assert conn1.max_active == 1
+
+    # A blocked connection doesn't hold up another one
+    gate = threading.Event()
+    slow = _FakeConn("test:///slow")
+    slow.gate = gate
+    fast = _FakeConn("test:///fast")
+    scheduler.schedule_priority(slow, {"pollvm": True})
+    assert slow.started.wait(5)
+    scheduler.schedule_priority(fast, {"pollvm": True})
+    assert fast.started.wait(5)
+    gate.set()
+    _wait(_idle(scheduler))
+
+
+def test_tick_interval_stretch():
+    # A slow regular tick stretches that connection's interval
+    # pylint: disable=protected-access
+    scheduler = TickScheduler(0.01)
+    slow = _FakeConn("test:///slow", delay=0.1)
+    fast = _FakeConn("test:///fast")
+    scheduler.schedule_regular([slow, fast], {"stats_update": True})
+    _wait(_idle(scheduler))
+
+    stats = scheduler.get_stats()
+    assert stats["test:///slow"]["interval"] >= 0.2
+    assert stats["test:///fast"]["interval"] == 0.01
+    assert stats["test:///slow"]["count"] == 1
+    assert stats["test:///slow"]["last"] >= 0.1
+
+    state = scheduler._states["test:///slow"]
+    assert state.next_due - time.monotonic() > 0.05
+    scheduler.schedule_regular([slow, fast], {"stats_update": True})
+    _wait(_idle(scheduler))
+    assert len(slow.calls) == 1
+
+    _wait(lambda: time.monotonic() >= state.next_due)
+    scheduler.schedule_regular([slow, fast], {"stats_update": True})
+    _wait(_idle(scheduler))
+    assert len(slow.calls) == 2
+
+
+def test_tick_failure_backoff():
+    # A failing tick backs off exponentially, success resets it
+    scheduler = TickScheduler(0.01)
+    conn = _FakeConn("test:///bad", fail=True)
+
+    intervals = []
+    for dummy in range(3):
+        stats = scheduler.get_stats().get(conn.uri)
+        if stats:
+            time.sleep(stats["interval"])
+        scheduler.schedule_regular([conn], {"stats_update": True})
+        _wait(_idle(scheduler))
+        intervals.append(scheduler.get_stats()[conn.uri]["interval"])
+    assert intervals == [0.02, 0.04, 0.08]
+    assert scheduler.get_stats()[conn.uri]["failed"] == 3
+
+    conn.fail = False
+    time.sleep(0.08)
+    scheduler.schedule_regular([conn], {"stats_update": True})
+    _wait(_idle(scheduler))
+    assert scheduler.get_stats()[conn.uri]["interval"] == 0.01
+
+
+def test_tick_forget_removed_conns():
+    # Connections missing from schedule_regular are dropped, along
+    # with our reference to them
+    # pylint: disable=protected-access
+    scheduler = TickScheduler(60)
+    conn1 = _FakeConn("test:///a")
+    conn2 = _FakeConn("test:///b")
+    scheduler.schedule_regular([conn1, conn2], {"stats_update": True})
+    _wait(_idle(scheduler))
+    assert sorted(scheduler.get_stats()) == ["test:///a", "test:///b"]
+    assert all(s.conn is None for s in scheduler._states.values())
+
+    scheduler.schedule_regular([conn1], {"stats_update": True})
+    assert sorted(scheduler.get_stats()) == ["test:///a"]
+    assert len(conn1.calls) == 1
@@ -0,0 +1,95 @@
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+from virtManager.lib.xmlcache import XMLCache
+
+
+class _Parser:
+    """
+    parsecb stand-in that records every parse
+    """
+
+    def __init__(self):
+        self.parsed = []
+
+    def __call__(self, xml):
+        self.parsed.append(xml)
+        return {"xml": xml}
+
+
+def test_xmlcache_refresh():
+    # Identical XML reuses the cached parse
+    cache = XMLCache()
+    parser = _Parser()
+    xmlobj, changed = cache.refresh("uuid1", "<domain/>", parser)
+    assert changed
+    assert xmlobj == {"xml": "<domain/>"}
+
+    xmlobj2, changed = cache.refresh("uuid1", "<domain/>", parser)
+    assert not changed
+    assert xmlobj2 is xmlobj
+    assert parser.parsed == ["<domain/>"]
+
+    # Changed XML is parsed again
+    xmlobj3, changed = cache.refresh("uuid1", "<domain><name/></domain>", parser)
+    assert changed
+    assert xmlobj3 == {"xml": "<domain><name/></domain>"}
+    assert len(parser.parsed) == 2
+    assert not cache.refresh("uuid1", "<domain><name/></domain>", parser)[1]
+
+    # An event makes the cached parse stale, even if the XML is the same
+    generation = cache.get_generation("uuid1")
+    cache.bump_generation("uuid1")
+    assert cache.get_generation("uuid1") > generation
+    xmlobj4, changed = cache.refresh("uuid1", "<domain><name/></domain>", parser)
+    assert changed
+    assert xmlobj4 is not xmlobj3
+    assert len(parser.parsed) == 3
+    assert not cache.refresh("uuid1", "<domain><name/></domain>", parser)[1]
+
+    # Keys are independent
+    assert cache.refresh("uuid2", "<domain/>", parser)[1]
+    assert not cache.refresh("uuid1", "<domain><name/></domain>", parser)[1]
+
+
+def test_xmlcache_remove_clear():
+    cache = XMLCache()
+    parser = _Parser()
+    cache.refresh("uuid1", "<domain/>", parser)
+    cache.refresh("uuid2", "<domain/>", parser)
+    cache.bump_generation("uuid1")
+    assert cache.get_stats()["entries"] == 2
+
+    cache.remove("uuid1")
+    cache.remove("missing")
+    assert cache.get_stats()["entries"] == 1
+    assert cache.get_generation("uuid1") == 0
+    assert cache.refresh("uuid1", "<domain/>", parser)[1]
+    assert not cache.refresh("uuid2", "<domain/>", parser)[1]
+
+    cache.clear()
+    assert cache.get_stats()["entries"] == 0
+    assert cache.get_generation("uuid1") == 0
+    assert cache.refresh("uuid2", "<domain/>", parser)[1]
+    assert len(parser.parsed) == 4
+
+
+def test_xmlcache_stats():
+    cache = XMLCache()
+    parser = _Parser()
+    stats = cache.get_stats()
+    assert stats == {"entries": 0, "hits": 0, "misses": 0, "parse_time": 0.0}
+
+    cache.refresh("uuid1", "<domain/>", parser)
+    cache.refresh("uuid1", "<domain/>", parser)
+    cache.refresh("uuid1", "<domain/>", parser)
+    cache.refresh("uuid1", "<domain><name/></domain>", parser)
+    cache.bump_generation("uuid1")
+    cache.refresh("uuid1", "<domain><name/></domain>", parser)
+
+    stats = cache.get_stats()
+    assert stats["entries"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+    assert stats["parse_time"] >= 0
+    assert len(parser.parsed) == stats["misses"]
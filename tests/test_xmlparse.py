@@ -1234,3 +1234,86 @@ def testConvertToVNC():
     _test("convert-to-vnc-spice-devices")
     _test("convert-to-vnc-spice-manyopts", qemu_vdagent=True)
     _test("convert-to-vnc-has-vnc", qemu_vdagent=True)
+
+
+def testXPathCompileCache():
+    # pylint: disable=protected-access
+    xmlapi = virtinst.xmlapi
+    xpathobj = xmlapi._compile_xpath("./devices/disk[2]/source/@file")
+    assert xpathobj is xmlapi._compile_xpath("./devices/disk[2]/source/@file")
+    assert xpathobj.is_prop
+    assert xpathobj.propname == "file"
+    assert xpathobj.xpath == "./devices/disk[2]/source"
+    assert xpathobj.segments[2].condition_num == 2
+
+    # Segments are shared between xpaths that contain them
+    other = xmlapi._compile_xpath("./devices/disk[2]/target/@dev")
+    assert other.segments[2] is xpathobj.segments[2]
+
+    # Lookups through the cache still return correct content
+    conn = utils.URIs.open_testdefault_cached()
+    xml = "<disk type='file'><driver cache='none'/></disk>"
+    disk = virtinst.DeviceDisk(conn, parsexml=xml)
+    assert disk.driver_cache == "none"
+    disk.driver_cache = "writeback"
+    assert 'cache="writeback"' in disk.get_xml()
+
+
+def testLazyChildParse():
+    # pylint: disable=protected-access
+    conn = utils.URIs.open_testdefault_cached()
+    guest = _get_test_content(conn, "add-devices")[0]
+    origxml = guest.get_xml()
+
+    # Child objects are only built when their property is accessed
+    guest = virtinst.Guest(conn, parsexml=origxml)
+    assert guest.name
+    assert "devices" not in guest._propstore
+    devices = guest.devices
+    assert "devices" in guest._propstore
+    assert "disk" not in devices._propstore
+    assert "interface" not in devices._propstore
+    assert len(devices.disk) == 4
+    assert "disk" in devices._propstore
+    assert "interface" not in devices._propstore
+
+    # Removing a device before its siblings are parsed keeps xpaths right
+    rmdev = guest.devices.disk[2]
+    guest.remove_device(rmdev)
+    assert [d.get_xml_id() for d in guest.devices.disk] == [
+        "./devices/disk[1]",
+        "./devices/disk[2]",
+        "./devices/disk[3]",
+    ]
+    assert guest.devices.interface[0].get_xml_id() == "./devices/interface[1]"
+
+    # Unaccessed children don't change the generated XML
+    guest = virtinst.Guest(conn, parsexml=origxml)
+    assert guest.get_xml() == origxml
+    guest = virtinst.Guest(conn, parsexml=origxml)
+    guest.remove_device(guest.devices.disk[2])
+    otherguest = virtinst.Guest(conn, parsexml=origxml)
+    for dev in otherguest.devices.get_all():
+        ignore = dev.get_xml_id()
+    otherguest.remove_device(otherguest.devices.disk[2])
+    assert guest.get_xml() == otherguest.get_xml()
+
+
+def testXMLPropertyValueCache():
+    # pylint: disable=protected-access
+    conn = utils.URIs.open_testdefault_cached()
+    xml = "<disk type='file'><driver cache='none'/><target dev='vda'/></disk>"
+    disk = virtinst.DeviceDisk(conn, parsexml=xml)
+    assert disk.driver_cache == "none"
+    assert virtinst.DeviceDisk.driver_cache in disk._xmlstate.value_cache
+
+    # Altering the XML document invalidates cached values
+    disk._xmlstate.xmlapi.set_xpath_content("./driver/@cache", "unsafe")
+    assert disk.driver_cache == "unsafe"
+    disk._xmlstate.xmlapi.node_force_remove("./driver")
+    assert disk.driver_cache is None
+
+    # Values set through the API take precedence
+    disk.target = "vdb"
+    assert disk.target == "vdb"
+    assert "vdb" in disk.get_xml()
@@ -1,6 +1,8 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import json
+import tempfile
 import unittest.mock
 
 from . import lib
@@ -152,6 +154,27 @@ def testCLITraceLibvirt(app):
     lib.utils.check(lambda: app.topwin.active)
 
 
+def testCLITraceLibvirtProfile(app):
+    with tempfile.NamedTemporaryFile(suffix=".json") as tmpfile:
+        app.open(
+            keyfile="allstats.ini",
+            extra_opts=[
+                "--trace-libvirt=profile",
+                "--trace-libvirt-output=%s" % tmpfile.name,
+                "--test-options=short-poll",
+            ],
+        )
+        app.sleep(0.5)  # Give time for polling to trigger
+        app.topwin.window_close()
+        app.wait_for_exit()
+
+        with open(tmpfile.name) as fileobj:
+            stats = json.load(fileobj)
+        callstats = list(stats["apis"]["virConnect.listAllDomains"].values())[0]
+        assert callstats["count"] > 0
+        assert callstats["p50"] <= callstats["p99"] <= callstats["max"]
+
+
 def testCLILeakDebug(app):
     # Just test this for code coverage
     app.open(
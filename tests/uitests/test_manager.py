@@ -217,6 +217,24 @@ def testManagerColumns(app):
     _test_column("Network I/O")
 
 
+def testManagerAllStats(app):
+    # Sample VM stats and state from getAllDomainStats with the test
+    # driver, without domain events so the cached state is used too
+    app.open(
+        keyfile="allstats.ini",
+        extra_opts=[
+            "--test-options=test-allstats",
+            "--test-options=no-events",
+            "--test-options=short-poll",
+        ],
+    )
+    manager = app.topwin
+    app.sleep(1)  # Give time for polling to trigger
+    manager.find("test-many-devices", "table cell")
+    manager.window_close()
+    app.wait_for_exit()
+
+
 def testManagerWindowReposition(app):
     """
     Restore previous position when window is reopened
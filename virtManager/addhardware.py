@@ -27,6 +27,7 @@ from virtinst import (
     DeviceVsock,
     DeviceWatchdog,
 )
+from virtinst import NodeDevice
 from virtinst import log
 
 from .lib import uiutil
@@ -781,7 +782,15 @@ class vmmAddHardware(vmmGObjectUI):
         model.clear()
 
         devs = self.conn.filter_nodedevs(devtype)
-        netdevs = self.conn.filter_nodedevs("net")
+        netdevs_by_parent = {}
+        if devtype == "pci":
+            for subdev in self.conn.filter_nodedevs("net"):
+                netdevs_by_parent.setdefault(subdev.xmlobj.parent, []).append(subdev)
+        nodedevs_by_name = {}
+        if devtype == "mdev":
+            for parentdev in self.conn.list_nodedevs():
+                nodedevs_by_name.setdefault(parentdev.xmlobj.name, []).append(parentdev)
+
         for dev in devs:
             if dev.xmlobj.is_usb_linux_root_hub():
                 continue
@@ -789,17 +798,14 @@ class vmmAddHardware(vmmGObjectUI):
                 continue
             prettyname = dev.pretty_name()
 
-            if devtype == "pci":
-                for subdev in netdevs:
-                    if dev.xmlobj.name == subdev.xmlobj.parent:
-                        prettyname += " (%s)" % subdev.pretty_name()
+            for subdev in netdevs_by_parent.get(dev.xmlobj.name, []):
+                prettyname += " (%s)" % subdev.pretty_name()
 
             # parent device names are appended with mdev names in
             # libvirt 7.8.0
             if devtype == "mdev" and len(prettyname) <= 41:
-                for parentdev in self.conn.list_nodedevs():
-                    if dev.xmlobj.parent == parentdev.xmlobj.name:
-                        prettyname = "%s %s" % (parentdev.pretty_name(), prettyname)
+                for parentdev in nodedevs_by_name.get(dev.xmlobj.parent, []):
+                    prettyname = "%s %s" % (parentdev.pretty_name(), prettyname)
 
             tooltip = None
             sensitive = dev.is_active()
@@ -1311,15 +1317,11 @@ class vmmAddHardware(vmmGObjectUI):
     ###########################
 
     def _validate_hostdev_collision(self, dev):
-        names = []
         nodedev = getattr(dev, "vmm_nodedev", None)
         if not nodedev:
             return  # pragma: no cover
 
-        for vm in self.conn.list_vms():
-            for hostdev in vm.xmlobj.devices.hostdev:
-                if nodedev.compare_to_hostdev(hostdev):
-                    names.append(vm.get_name())
+        names = NodeDevice.hostdev_in_use_by(self.conn.get_backend(), nodedev)
         if names:
             res = self.err.yes_no(
                 _("The device is already in use by other guests %s") % (names),
@@ -5,6 +5,7 @@
 # See the COPYING file in the top-level directory.
 
 import os
+import queue
 import threading
 import time
 import traceback
@@ -23,7 +24,8 @@ from .object.domain import vmmDomain
 from .object.network import vmmNetwork
 from .object.nodedev import vmmNodeDevice
 from .object.storagepool import vmmStoragePool
-from .lib.statsmanager import vmmStatsManager
+from .lib.statsmanager import StatsHistory, vmmStatsManager
+from .lib.xmlcache import XMLCache
 
 
 class _ObjectList(vmmGObject):
@@ -155,6 +157,20 @@ class vmmConnection(vmmGObject):
 
     (_STATE_DISCONNECTED, _STATE_CONNECTING, _STATE_ACTIVE) = range(1, 4)
 
+    _STATS_FIELDS = [
+        "timestamp",
+        "memory",
+        "memoryPercent",
+        "cpuTime",
+        "cpuHostPercent",
+        "diskRdRate",
+        "diskWrRate",
+        "netRxRate",
+        "netTxRate",
+        "diskMaxRate",
+        "netMaxRate",
+    ]
+
     def __init__(self, uri):
         self._uri = uri
         vmmGObject.__init__(self)
@@ -181,9 +197,11 @@ class vmmConnection(vmmGObject):
         self._xml_flags = {}
 
         self._objects = _ObjectList()
+        self._nodedev_lists = None
         self.statsmanager = vmmStatsManager()
+        self.xmlcache = XMLCache()
 
-        self._stats = []
+        self._stats = StatsHistory(self._STATS_FIELDS, self.config.get_stats_history_length() + 1)
         self._hostinfo = None
 
         self.add_gsettings_handle(
@@ -264,6 +282,9 @@ class vmmConnection(vmmGObject):
         self._backend.cb_fetch_all_nodedevs = lambda: [
             obj.get_xmlobj(refresh_if_nec=False) for obj in self.list_nodedevs()
         ]
+        self._backend.cb_fetch_all_networks = lambda: [
+            obj.get_xmlobj(refresh_if_nec=False) for obj in self.list_nets()
+        ]
 
         def fetch_all_vols():
             ret = []
@@ -522,8 +543,14 @@ class vmmConnection(vmmGObject):
     # nodedev helper functions #
     ############################
 
-    def filter_nodedevs(self, devtype):
-        retdevs = []
+    def _build_nodedev_lists(self):
+        """
+        Return (alldevs, {devtype: devs}), both in list_nodedevs order,
+        and whether every nodedev XML could be fetched
+        """
+        alldevs = []
+        bytype = {}
+        complete = True
         for dev in self.list_nodedevs():
             try:
                 xmlobj = dev.get_xmlobj()
@@ -532,13 +559,29 @@ class vmmConnection(vmmGObject):
                 # https://bugzilla.redhat.com/show_bug.cgi?id=1225771
                 if e.get_error_code() != libvirt.VIR_ERR_NO_NODE_DEVICE:
                     log.debug("Error fetching nodedev XML", exc_info=True)
+                complete = False
                 continue
+            alldevs.append(dev)
+            bytype.setdefault(xmlobj.device_type, []).append(dev)
+        return (alldevs, bytype), complete
 
-            if devtype and xmlobj.device_type != devtype:
-                continue
+    def filter_nodedevs(self, devtype):
+        """
+        Return the nodedevs with capability type 'devtype', or all of
+        them if devtype is None. The per type lists are built once, and
+        dropped when a nodedev is added or removed. They aren't kept if
+        any nodedev XML failed to fetch, so that device is retried.
+        """
+        nodedevs = self._nodedev_lists
+        if nodedevs is None:
+            nodedevs, complete = self._build_nodedev_lists()
+            if complete:
+                self._nodedev_lists = nodedevs
 
-            retdevs.append(dev)
-        return retdevs
+        alldevs, bytype = nodedevs
+        if devtype:
+            return bytype.get(devtype, [])[:]
+        return alldevs[:]
 
     ###################################
     # Libvirt object creation methods #
@@ -876,7 +919,7 @@ class vmmConnection(vmmGObject):
             self._storage_pool_cb_ids = []
             self._node_device_cb_ids = []
 
-        self._stats = []
+        self._stats.clear()
 
         if self._init_object_event:
             self._init_object_event.clear()  # pragma: no cover
@@ -890,6 +933,19 @@ class vmmConnection(vmmGObject):
                 log.debug("Failed to cleanup %s: %s", obj, e)
         self._objects.cleanup()
         self._objects = _ObjectList()
+        self._nodedev_lists = None
+
+        if self.xmlcache.hits or self.xmlcache.misses:
+            log.debug("XML cache stats for uri=%s: %s", self.get_uri(), self.xmlcache.get_stats())
+        self.xmlcache.clear()
+
+        if self.statsmanager.rpcs_avoided:
+            log.debug(
+                "Stats RPCs answered by getAllDomainStats for uri=%s: %d",
+                self.get_uri(),
+                self.statsmanager.rpcs_avoided,
+            )
+            self.statsmanager.rpcs_avoided = 0
 
         closeret = self._backend.close()
         if closeret == 1:
@@ -907,6 +963,7 @@ class vmmConnection(vmmGObject):
         self._backend.cb_fetch_all_domains = None
         self._backend.cb_fetch_all_pools = None
         self._backend.cb_fetch_all_nodedevs = None
+        self._backend.cb_fetch_all_networks = None
         self._backend.cb_fetch_all_vols = None
         self._backend.cb_cache_new_pool = None
 
@@ -1072,6 +1129,8 @@ class vmmConnection(vmmGObject):
                 continue
 
             log.debug("%s=%s removed", class_name, name)
+            if obj.is_nodedev():
+                self._nodedev_lists = None
             self._remove_object_signal(obj)
             obj.cleanup()
 
@@ -1106,6 +1165,7 @@ class vmmConnection(vmmGObject):
             elif obj.is_pool():
                 self.emit("pool-added", obj)
             elif obj.is_nodedev():
+                self._nodedev_lists = None
                 self.emit("nodedev-added", obj)
         finally:
             if self._init_object_event:
@@ -1113,6 +1173,50 @@ class vmmConnection(vmmGObject):
                 if self._init_object_count <= 0:
                     self._init_object_event.set()
 
+    def _init_priority(self, obj):
+        """
+        Sort key for initializing new objects. Running VMs come first
+        since they are what the user is most likely to interact with,
+        then the rest of the VMs in manager list order, then everything
+        else.
+        """
+        if obj.is_domain():
+            state = self.statsmanager.get_cached_state(obj)
+            running = state in [libvirt.VIR_DOMAIN_RUNNING, libvirt.VIR_DOMAIN_PAUSED]
+            return (0 if running else 1, obj.get_name())
+        if obj.is_network():
+            return (2, obj.get_name())
+        if obj.is_pool():
+            return (3, obj.get_name())
+        return (4, obj.get_name())
+
+    def _init_new_objects(self, newobjs):
+        """
+        Fetch the initial XML and state for newly discovered objects,
+        using a bounded pool of worker threads. On remote connections
+        with many objects, the latency of the XMLDesc calls dominates,
+        so running a few of them concurrently speeds up startup a lot.
+        """
+        if not newobjs:
+            return
+
+        objqueue = queue.SimpleQueue()
+        for obj in sorted(newobjs, key=self._init_priority):
+            objqueue.put(obj)
+
+        def _worker():
+            while True:
+                try:
+                    obj = objqueue.get_nowait()
+                except queue.Empty:
+                    return
+                obj.connect_once("initialized", self._new_object_cb)
+                obj.init_libvirt_state()
+
+        workers = max(1, self.config.get_perconn(self.get_uri(), "/init-workers"))
+        for idx in range(min(workers, len(newobjs))):
+            self._start_thread(_worker, "initializing new objects %d" % idx)
+
     def _poll(self, initial_poll, pollvm, pollnet, pollpool, pollnodedev):
         """
         Helper called from tick() to do necessary polling and return
@@ -1166,10 +1270,6 @@ class vmmConnection(vmmGObject):
         new_pools = _process_objects("pools")
         new_nodedevs = _process_objects("nodedevs")
 
-        # Kick off one thread per object type to handle the initial
-        # XML fetching. Going any more fine grained then this probably
-        # won't be that useful due to libvirt's locking structure.
-        #
         # Would prefer to start refreshing some objects before all polling
         # is complete, but we need init_object_count to be fully accurate
         # before we start initializing objects
@@ -1179,18 +1279,7 @@ class vmmConnection(vmmGObject):
             # is never called and the event is never set, so let's do it here
             self._init_object_event.set()
 
-        for newlist in [new_vms, new_nets, new_pools, new_nodedevs]:
-            if not newlist:
-                continue
-
-            def cb(lst):
-                for obj in lst:
-                    obj.connect_once("initialized", self._new_object_cb)
-                    obj.init_libvirt_state()
-
-            self._start_thread(
-                cb, "refreshing xml for new %s" % newlist[0].class_name(), args=(newlist,)
-            )
+        self._init_new_objects(new_vms + new_nets + new_pools + new_nodedevs)
 
         return gone_objects, preexisting_objects
 
@@ -1284,10 +1373,7 @@ class vmmConnection(vmmGObject):
             return  # pragma: no cover
 
         now = time.time()
-        expected = self.config.get_stats_history_length()
-        current = len(self._stats)
-        if current > expected:
-            del self._stats[expected:current]  # pragma: no cover
+        self._stats.resize(self.config.get_stats_history_length() + 1)
 
         mem = 0
         cpuTime = 0
@@ -1316,7 +1402,7 @@ class vmmConnection(vmmGObject):
         pcentMem = mem * 100.0 / self.host_memory_size()
 
         if len(self._stats) > 0:
-            prevTimestamp = self._stats[0]["timestamp"]
+            prevTimestamp = self._stats.get("timestamp")
             host_cpus = self.host_active_processor_count()
 
             pcentHostCpu = (
@@ -1326,21 +1412,19 @@ class vmmConnection(vmmGObject):
         pcentHostCpu = max(0.0, min(100.0, pcentHostCpu))
         pcentMem = max(0.0, min(100.0, pcentMem))
 
-        newStats = {
-            "timestamp": now,
-            "memory": mem,
-            "memoryPercent": pcentMem,
-            "cpuTime": cpuTime,
-            "cpuHostPercent": pcentHostCpu,
-            "diskRdRate": rdRate,
-            "diskWrRate": wrRate,
-            "netRxRate": rxRate,
-            "netTxRate": txRate,
-            "diskMaxRate": diskMaxRate,
-            "netMaxRate": netMaxRate,
-        }
-
-        self._stats.insert(0, newStats)
+        self._stats.append(
+            timestamp=now,
+            memory=mem,
+            memoryPercent=pcentMem,
+            cpuTime=cpuTime,
+            cpuHostPercent=pcentHostCpu,
+            diskRdRate=rdRate,
+            diskWrRate=wrRate,
+            netRxRate=rxRate,
+            netTxRate=txRate,
+            diskMaxRate=diskMaxRate,
+            netMaxRate=netMaxRate,
+        )
 
     def schedule_priority_tick(self, **kwargs):
         from .engine import vmmEngine
@@ -1359,23 +1443,13 @@ class vmmConnection(vmmGObject):
     ########################
 
     def _get_record_helper(self, record_name):
-        if len(self._stats) == 0:
-            return 0
-        return self._stats[0][record_name]
+        return self._stats.get(record_name)
 
     def _vector_helper(self, record_name, limit, ceil=100.0):
-        vector = []
         statslen = self.config.get_stats_history_length() + 1
         if limit is not None:
             statslen = min(statslen, limit)  # pragma: no cover
-
-        for i in range(statslen):
-            if i < len(self._stats):
-                vector.append(self._stats[i][record_name] / ceil)
-            else:
-                vector.append(0)
-
-        return vector
+        return self._stats.vector(record_name, statslen, ceil=ceil)
 
     def stats_memory_vector(self, limit=None):
         return self._vector_helper("memoryPercent", limit)
@@ -5,7 +5,6 @@
 # See the COPYING file in the top-level directory.
 
 import queue
-import threading
 
 from gi.repository import Gio
 from gi.repository import GLib
@@ -17,10 +16,9 @@ from .baseclass import vmmGObject
 from .createconn import vmmCreateConn
 from .connmanager import vmmConnectionManager
 from .lib.inspection import vmmInspection
+from .lib.tickscheduler import TickScheduler
 from .systray import vmmSystray
 
-(PRIO_HIGH, PRIO_LOW) = range(1, 3)
-
 
 def _show_startup_error(fn):
     """
@@ -70,13 +68,7 @@ class vmmEngine(vmmGObject):
         self._init_gtk_application()
 
         self._timer = None
-        self._tick_counter = 0
-        self._tick_thread_slow = False
-        self._tick_thread = threading.Thread(
-            name="Tick thread", target=self._handle_tick_queue, args=()
-        )
-        self._tick_thread.daemon = True
-        self._tick_queue = queue.PriorityQueue(100)
+        self._tick_scheduler = TickScheduler(self.config.get_stats_update_interval())
 
     @property
     def _connobjs(self):
@@ -102,7 +94,6 @@ class vmmEngine(vmmGObject):
         )
 
         self._schedule_timer()
-        self._tick_thread.start()
         self._tick()
 
         uris = list(self._connobjs.keys())
@@ -248,47 +239,33 @@ class vmmEngine(vmmGObject):
         self._schedule_timer()
 
     def _schedule_timer(self):
-        interval = self.config.get_stats_update_interval() * 1000
+        interval = self.config.get_stats_update_interval()
+        self._tick_scheduler.set_interval(interval)
 
         if self._timer is not None:
             self.remove_gobject_timeout(self._timer)
             self._timer = None
 
-        self._timer = self.timeout_add(interval, self._tick)
-
-    def _add_obj_to_tick_queue(self, obj, isprio, **kwargs):
-        if self._tick_queue.full():  # pragma: no cover
-            if not self._tick_thread_slow:
-                log.debug("Tick is slow, not running at requested rate.")
-                self._tick_thread_slow = True
-            return
-
-        self._tick_counter += 1
-        self._tick_queue.put((isprio and PRIO_HIGH or PRIO_LOW, self._tick_counter, obj, kwargs))
+        self._timer = self.timeout_add(interval * 1000, self._tick)
 
     def schedule_priority_tick(self, conn, kwargs):
         # Called directly from connection
-        self._add_obj_to_tick_queue(conn, True, **kwargs)
+        self._tick_scheduler.schedule_priority(conn, kwargs)
 
     def _tick(self):
-        for conn in self._connobjs.values():
-            self._add_obj_to_tick_queue(conn, False, stats_update=True, pollvm=True)
+        # Each connection is only actually ticked when its own,
+        # possibly stretched, interval has elapsed
+        self._tick_scheduler.schedule_regular(
+            list(self._connobjs.values()), {"stats_update": True, "pollvm": True}
+        )
         return 1
 
-    def _handle_tick_queue(self):
-        while True:
-            ignore1, ignore2, conn, kwargs = self._tick_queue.get()
-            try:
-                conn.tick_from_engine(**kwargs)
-            except Exception:  # pragma: no cover
-                # Don't attempt to show any UI error here, since it
-                # can cause dialogs to appear from nowhere if say
-                # libvirtd is shut down
-                log.debug("Error polling connection %s", conn.get_uri(), exc_info=True)
-
-            # Need to clear reference to make leak check happy
-            conn = None
-            self._tick_queue.task_done()
+    def get_tick_stats(self):
+        """
+        Return per connection tick latency metrics, see
+        TickScheduler.get_stats
+        """
+        return self._tick_scheduler.get_stats()
 
     #####################################
     # window counting and exit handling #
@@ -7,7 +7,14 @@
 # This module provides a simple way to trace any activity on a specific
 # python class or module. The trace output is logged using the regular
 # logging infrastructure. Invoke this with virt-manager --trace-libvirt
+#
+# With --trace-libvirt=profile nothing is logged per call. Instead latency
+# stats are collected per API name and calling thread, and written out as
+# JSON on exit, or whenever SIGUSR1 is received. See get_stats()
 
+import atexit
+import json
+import os
 import re
 import threading
 import time
@@ -18,9 +25,141 @@ from virtinst import log
 
 
 CHECK_MAINLOOP = False
+PROFILE = None
+
+
+def _is_non_network_call(name):
+    # These APIs don't hit the network, so we might not want to see them.
+    return (
+        name.endswith(".name")
+        or name.endswith(".UUIDString")
+        or name.endswith(".__init__")
+        or name.endswith(".__del__")
+        or name.endswith(".connect")
+        or name.startswith("libvirtError")
+    )
+
+
+class _CallStats:
+    """
+    Latency histogram for one API name + thread. Buckets are powers of
+    two microseconds, so percentiles are accurate to within 2x without
+    storing every sample.
+    """
+
+    NBUCKETS = 32
+
+    def __init__(self):
+        self.count = 0
+        self.mainloop_count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * self.NBUCKETS
+
+    def add(self, duration, is_main_thread):
+        self.count += 1
+        if is_main_thread:
+            self.mainloop_count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        usecs = int(duration * 1000000)
+        self.buckets[min(usecs.bit_length(), self.NBUCKETS - 1)] += 1
+
+    def percentile(self, pct):
+        want = self.count * pct / 100.0
+        seen = 0
+        for idx, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= want:
+                # Upper bound of the bucket, capped by the real max
+                return min((1 << idx) / 1000000.0, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mainloop_count": self.mainloop_count,
+            "total": self.total,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class _Profile:
+    def __init__(self, output):
+        self.output = output
+        self.start = time.time()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, name, threadname, duration, is_main_thread):
+        key = (name, threadname)
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = _CallStats()
+            self._stats[key].add(duration, is_main_thread)
+
+    def get_stats(self):
+        apis = {}
+        with self._lock:
+            for (name, threadname), stats in sorted(self._stats.items()):
+                apis.setdefault(name, {})[threadname] = stats.to_dict()
+        return {"start": self.start, "end": time.time(), "apis": apis}
+
+    def dump(self):
+        log.debug("Writing libvirt call profile to %s", self.output)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.output)), exist_ok=True)
+            with open(self.output, "w") as fileobj:
+                json.dump(self.get_stats(), fileobj, indent=2, sort_keys=True)
+        except OSError as e:  # pragma: no cover
+            log.debug("Error writing libvirt call profile: %s", e)
+
+
+def enable_profile(output):
+    """
+    Collect per call latency stats instead of logging every call, and
+    write them as JSON to the output path on exit
+    """
+    global PROFILE
+    PROFILE = _Profile(output)
+    atexit.register(PROFILE.dump)
+
+
+def get_stats():
+    """
+    Return the stats collected so far as a dict of
+    {"apis": {apiname: {threadname: {count, mainloop_count, total,
+    max, p50, p95, p99}}}} with times in seconds, or None if
+    profiling isn't enabled
+    """
+    if not PROFILE:
+        return None
+    return PROFILE.get_stats()
+
+
+def _generate_profile_wrapper(origfunc, name):
+    def newfunc(*args, **kwargs):
+        thread = threading.current_thread()
+        start = time.monotonic()
+        try:
+            return origfunc(*args, **kwargs)
+        finally:
+            PROFILE.add(
+                name, thread.name, time.monotonic() - start, thread is threading.main_thread()
+            )
+
+    return newfunc
 
 
 def generate_wrapper(origfunc, name):
+    if PROFILE:
+        if _is_non_network_call(name):
+            return origfunc
+        return _generate_profile_wrapper(origfunc, name)
+
     # This could be used as generic infrastructure, but it has hacks for
     # identifying places where libvirt hits the network from the main thread,
     # which causes UI blocking on slow network connections.
@@ -28,16 +167,7 @@ def generate_wrapper(origfunc, name):
     def newfunc(*args, **kwargs):
         threadname = threading.current_thread().name
         is_main_thread = threading.current_thread().name == "MainThread"
-
-        # These APIs don't hit the network, so we might not want to see them.
-        is_non_network_libvirt_call = (
-            name.endswith(".name")
-            or name.endswith(".UUIDString")
-            or name.endswith(".__init__")
-            or name.endswith(".__del__")
-            or name.endswith(".connect")
-            or name.startswith("libvirtError")
-        )
+        is_non_network_libvirt_call = _is_non_network_call(name)
 
         if not is_non_network_libvirt_call and (is_main_thread or not CHECK_MAINLOOP):
             tb = ""
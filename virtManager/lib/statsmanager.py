@@ -3,7 +3,7 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
-import re
+import array
 import time
 
 import libvirt
@@ -13,11 +13,123 @@ from virtinst import log
 from ..baseclass import vmmGObject
 
 
+class StatsHistory(object):
+    """
+    Fixed size, columnar ring buffer of float stats samples.
+
+    Every field is backed by one preallocated array('d'), and new samples
+    are written in place at the head index, so appending is O(1) and no
+    per-sample objects are kept around. Index 0 is always the newest sample.
+    """
+
+    def __init__(self, fields, capacity):
+        self._fields = tuple(fields)
+        self._columns = {}
+        self._capacity = 0
+        self._head = 0
+        self._count = 0
+        self.resize(capacity)
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def resize(self, capacity):
+        """
+        Change the number of samples we keep, preserving the newest ones
+        """
+        capacity = max(int(capacity), 1)
+        if capacity == self._capacity:
+            return
+
+        keep = min(self._count, capacity)
+        columns = {}
+        for name in self._fields:
+            col = array.array("d", bytes(8 * capacity))
+            for idx in range(keep):
+                col[keep - 1 - idx] = self.get(name, idx)
+            columns[name] = col
+
+        self._columns = columns
+        self._capacity = capacity
+        self._count = keep
+        self._head = keep % capacity
+
+    def append(self, **values):
+        """
+        Store a new sample. A value must be passed for every field
+        """
+        head = self._head
+        for name in self._fields:
+            self._columns[name][head] = values[name]
+        self._head = (head + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+
+    def get(self, name, idx=0):
+        """
+        Return field 'name' of the sample 'idx' steps back in history,
+        or 0 if we don't have that many samples
+        """
+        if idx >= self._count:
+            return 0
+        return self._columns[name][(self._head - 1 - idx) % self._capacity]
+
+    def views(self, name):
+        """
+        Return the stored samples of 'name', newest first, as a pair of
+        memoryviews over the backing array. Nothing is copied.
+        """
+        col = memoryview(self._columns[name])
+        head = self._head
+        olderlen = self._count - head
+        newer = col[:head][::-1]
+        older = col[:0]
+        if olderlen > 0:
+            older = col[self._capacity - olderlen :][::-1]
+        return newer, older
+
+    def vector(self, name, length, ceil=100.0):
+        """
+        Return a list of 'length' samples of 'name', newest first,
+        divided by 'ceil' and zero padded
+        """
+        ret = []
+        for view in self.views(name):
+            remaining = length - len(ret)
+            if remaining <= 0:
+                break
+            ret.extend([val / ceil for val in view[:remaining]])
+        if len(ret) < length:
+            ret.extend([0] * (length - len(ret)))
+        return ret
+
+
 class _VMStatsRecord(object):
     """
     Tracks a set of VM stats for a single timestamp
     """
 
+    __slots__ = [
+        "timestamp",
+        "cpuTime",
+        "cpuTimeAbs",
+        "cpuHostPercent",
+        "cpuGuestPercent",
+        "curmem",
+        "currMemPercent",
+        "diskRdKiB",
+        "diskWrKiB",
+        "netRxKiB",
+        "netTxKiB",
+        "diskRdRate",
+        "diskWrRate",
+        "netRxRate",
+        "netTxRate",
+    ]
+
     def __init__(
         self,
         timestamp,
@@ -53,12 +165,14 @@ class _VMStatsRecord(object):
 
 class _VMStatsList(vmmGObject):
     """
-    Tracks a list of VMStatsRecords for a single VM
+    Tracks the stats history for a single VM
     """
 
     def __init__(self):
         vmmGObject.__init__(self)
-        self._stats = []
+        self._stats = StatsHistory(
+            _VMStatsRecord.__slots__, self.config.get_stats_history_length() + 1
+        )
 
         self.diskRdMaxRate = 10.0
         self.diskWrMaxRate = 10.0
@@ -70,20 +184,16 @@ class _VMStatsList(vmmGObject):
         self.stats_net_skip = []
 
     def _cleanup(self):
-        pass
+        self._stats.clear()
 
     def append_stats(self, newstats):
-        expected = self.config.get_stats_history_length()
-        current = len(self._stats)
-        if current > expected:  # pragma: no cover
-            del self._stats[expected:current]
+        self._stats.resize(self.config.get_stats_history_length() + 1)
 
         def _calculate_rate(record_name):
             ret = 0.0
-            if self._stats:
-                oldstats = self._stats[0]
-                ratediff = getattr(newstats, record_name) - getattr(oldstats, record_name)
-                timediff = newstats.timestamp - oldstats.timestamp
+            if len(self._stats):
+                ratediff = getattr(newstats, record_name) - self._stats.get(record_name)
+                timediff = newstats.timestamp - self._stats.get("timestamp")
                 ret = float(ratediff) / float(timediff)
             return max(ret, 0.0)
 
@@ -97,30 +207,48 @@ class _VMStatsList(vmmGObject):
         self.netRxMaxRate = max(newstats.netRxRate, self.netRxMaxRate)
         self.netTxMaxRate = max(newstats.netTxRate, self.netTxMaxRate)
 
-        self._stats.insert(0, newstats)
+        self._stats.append(**{name: getattr(newstats, name) for name in newstats.__slots__})
 
     def get_record(self, record_name):
-        if not self._stats:
-            return 0
-        return getattr(self._stats[0], record_name)
+        return self._stats.get(record_name)
 
     def get_vector(self, record_name, limit, ceil=100.0):
-        vector = []
         statslen = self.config.get_stats_history_length() + 1
         if limit is not None:
             statslen = min(statslen, limit)
-
-        for i in range(statslen):
-            if i < len(self._stats):
-                vector.append(getattr(self._stats[i], record_name) / ceil)
-            else:
-                vector.append(0)
-        return vector
+        return self._stats.vector(record_name, statslen, ceil=ceil)
 
     def get_in_out_vector(self, name1, name2, limit, ceil):
         return (self.get_vector(name1, limit, ceil=ceil), self.get_vector(name2, limit, ceil=ceil))
 
 
+_DEVICE_STATS_KEYS = {
+    ("block", "rd"): "virt-manager.block.rd.bytes",
+    ("block", "wr"): "virt-manager.block.wr.bytes",
+    ("net", "rx"): "virt-manager.net.rx.bytes",
+    ("net", "tx"): "virt-manager.net.tx.bytes",
+}
+
+
+def _sum_device_stats(domallstats):
+    """
+    Sum the per device block and interface byte counters from one
+    domain's getAllDomainStats output, in a single pass over its keys.
+    Keys look like 'block.0.rd.bytes' or 'net.1.tx.bytes'
+    """
+    ret = dict.fromkeys(_DEVICE_STATS_KEYS.values(), 0)
+    for key, val in domallstats.items():
+        if not key.endswith(".bytes"):
+            continue
+        parts = key.split(".")
+        if len(parts) != 4 or not parts[1].isdigit():
+            continue
+        sumkey = _DEVICE_STATS_KEYS.get((parts[0], parts[2]))
+        if sumkey:
+            ret[sumkey] += val
+    return ret
+
+
 class vmmStatsManager(vmmGObject):
     """
     Class for polling statistics
@@ -131,6 +259,10 @@ class vmmStatsManager(vmmGObject):
         self._vm_stats = {}
         self._latest_all_stats = {}
 
+        # Number of per domain RPCs that were answered from the
+        # getAllDomainStats result. Logged when the connection closes
+        self.rpcs_avoided = 0
+
         self._all_stats_supported = True
         self._net_stats_supported = True
         self._disk_stats_supported = True
@@ -140,7 +272,10 @@ class vmmStatsManager(vmmGObject):
     def _cleanup(self):
         for statslist in self._vm_stats.values():
             statslist.cleanup()
-        self._latest_all_stats = None
+        self._latest_all_stats = {}
+
+    def count_avoided(self, count):
+        self.rpcs_avoided += count
 
     ######################
     # CPU stats handling #
@@ -165,6 +300,7 @@ class vmmStatsManager(vmmGObject):
         prevCpuTime = self.get_vm_statslist(vm).get_record("cpuTimeAbs")
 
         if allstats:
+            self.count_avoided(1)
             state = allstats.get("state.state", 0)
             guestcpus = allstats.get("vcpu.current", 0)
             cpuTimeAbs = allstats.get("cpu.time", 0)
@@ -233,12 +369,10 @@ class vmmStatsManager(vmmGObject):
             statslist.stats_net_skip = []
             return rx, tx
 
-        if allstats:
-            for key in allstats.keys():  # pragma: no cover
-                if re.match(r"net.[0-9]+.rx.bytes", key):
-                    rx += allstats[key]
-                if re.match(r"net.[0-9]+.tx.bytes", key):
-                    tx += allstats[key]
+        if allstats:  # pragma: no cover
+            self.count_avoided(len(vm.get_interface_devices_norefresh()))
+            rx = allstats["virt-manager.net.rx.bytes"]
+            tx = allstats["virt-manager.net.tx.bytes"]
             return rx, tx
 
         for iface in vm.get_interface_devices_norefresh():
@@ -294,11 +428,9 @@ class vmmStatsManager(vmmGObject):
             return rd, wr
 
         if allstats:
-            for key in allstats.keys():
-                if re.match(r"block.[0-9]+.rd.bytes", key):
-                    rd += allstats[key]
-                if re.match(r"block.[0-9]+.wr.bytes", key):
-                    wr += allstats[key]
+            self.count_avoided(len(vm.get_disk_devices_norefresh()))
+            rd = allstats["virt-manager.block.rd.bytes"]
+            wr = allstats["virt-manager.block.wr.bytes"]
             return rd, wr
 
         # LXC has a special blockStats method
@@ -377,6 +509,7 @@ class vmmStatsManager(vmmGObject):
             statslist.mem_stats_period_is_set = True
 
         if allstats:
+            self.count_avoided(1)
             totalmem = allstats.get("balloon.current", 1)
             curmem = max(0, totalmem - allstats.get("balloon.unused", totalmem))
         else:
@@ -393,8 +526,11 @@ class vmmStatsManager(vmmGObject):
 
     def _get_all_stats(self, conn):
         # test conn supports allstats as of 2021, but for test coverage
-        # purposes lets still use the old stats code for the test driver
-        if not self._all_stats_supported or conn.is_test():
+        # purposes lets still use the old stats code for the test driver,
+        # unless the uitests explicitly ask for the allstats path
+        if not self._all_stats_supported:
+            return {}
+        if conn.is_test() and not self.config.CLITestOptions.test_allstats:
             return {}
 
         statflags = 0
@@ -416,8 +552,11 @@ class vmmStatsManager(vmmGObject):
             timestamp = time.time()
             rawallstats = conn.get_backend().getAllDomainStats(statflags, 0)
 
-            # Reformat the output to be a bit more friendly
+            # Reformat the output to be a bit more friendly, and
+            # precompute the device totals so per VM sampling is
+            # just dict lookups
             for dom, domallstats in rawallstats:
+                domallstats.update(_sum_device_stats(domallstats))
                 domallstats["virt-manager.timestamp"] = timestamp
                 ret[dom.UUIDString()] = domallstats
         except libvirt.libvirtError as err:
@@ -460,6 +599,16 @@ class vmmStatsManager(vmmGObject):
     def cache_all_stats(self, conn):
         self._latest_all_stats = self._get_all_stats(conn)
 
+    def get_cached_state(self, vm):
+        """
+        Return the VM state reported by the last getAllDomainStats call,
+        so callers can skip a per VM info() call. None if not available
+        """
+        domallstats = self._latest_all_stats.get(vm.get_uuid(), None)
+        if not domallstats:
+            return None
+        return domallstats.get("state.state", None)
+
     def get_vm_statslist(self, vm):
         if vm.get_name() not in self._vm_stats:
             self._vm_stats[vm.get_name()] = _VMStatsList()
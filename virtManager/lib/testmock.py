@@ -203,6 +203,8 @@ class CLITestOptionsClass:
         triggers logind session lookup
     * short-poll: Use a polling interval of only .1 seconds to speed
         up the uitests a bit
+    * test-allstats: Use getAllDomainStats for the test driver too, to
+        cover the bulk stats sampling path
     """
 
     def __init__(self, test_options_str):
@@ -248,6 +250,7 @@ class CLITestOptionsClass:
         self.fake_session_error = _get("fake-session-error")
         self.short_poll = _get("short-poll")
         self.fake_virtbootstrap = _get("fake-virtbootstrap")
+        self.test_allstats = _get("test-allstats")
 
         if optset:  # pragma: no cover
             raise RuntimeError("Unknown --test-options keys: %s" % optset)
@@ -0,0 +1,250 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import threading
+import time
+
+from virtinst import log
+
+
+def _merge_tick_kwargs(orig, new):
+    """
+    Combine two sets of tick_from_engine kwargs. They are all boolean
+    'poll this too' flags, so the combined tick does what both asked for.
+    """
+    ret = dict(orig)
+    for key, val in new.items():
+        ret[key] = ret.get(key) or val
+    return ret
+
+
+class _ConnTickState(object):
+    """
+    Scheduling state and latency metrics for a single connection
+    """
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.conn = None
+        self.prio_kwargs = None
+        self.regular_kwargs = None
+        self.running = False
+        self.next_due = 0
+        self.interval = 0
+        self.failures = 0
+
+        self.count = 0
+        self.failed_count = 0
+        self.last = 0.0
+        self.avg = 0.0
+        self.max = 0.0
+
+    def is_pending(self):
+        return self.prio_kwargs is not None or self.regular_kwargs is not None
+
+    def record(self, duration):
+        self.count += 1
+        self.last = duration
+        self.max = max(self.max, duration)
+        if self.count == 1:
+            self.avg = duration
+        else:
+            self.avg += (duration - self.avg) * 0.25
+
+    def get_stats(self):
+        return {
+            "count": self.count,
+            "failed": self.failed_count,
+            "last": self.last,
+            "avg": self.avg,
+            "max": self.max,
+            "interval": self.interval,
+        }
+
+
+class TickScheduler(object):
+    """
+    Runs connection ticks on a small pool of worker threads.
+
+    A connection is only ever ticked by one worker at a time, so one slow
+    remote host can't hold up the others. Each connection has its own
+    regular tick interval: it starts at the configured stats interval and
+    is stretched when the tick itself takes a large share of it. A failing
+    tick backs off exponentially. Priority ticks requested while one is
+    already pending for the connection are merged into it.
+    """
+
+    MAX_WORKERS = 4
+    # A regular tick can use at most 1/LOAD_FACTOR of its interval
+    LOAD_FACTOR = 2
+    MAX_INTERVAL = 60
+    MAX_BACKOFF = 300
+
+    def __init__(self, interval):
+        self._interval = interval
+        self._cond = threading.Condition()
+        self._states = {}
+        self._queue = []
+        self._workers = []
+        self._idle_workers = 0
+
+    ####################
+    # Internal helpers #
+    ####################
+
+    def _get_state(self, conn):
+        uri = conn.get_uri()
+        if uri not in self._states:
+            self._states[uri] = _ConnTickState(uri)
+        state = self._states[uri]
+        state.conn = conn
+        return state
+
+    def _enqueue(self, state):
+        if state.running or state in self._queue:
+            return
+        self._queue.append(state)
+        if not self._idle_workers and len(self._workers) < self.MAX_WORKERS:
+            thread = threading.Thread(
+                name="Tick thread %d" % (len(self._workers) + 1), target=self._worker
+            )
+            thread.daemon = True
+            self._workers.append(thread)
+            thread.start()
+        self._cond.notify()
+
+    def _pop_next(self):
+        # Connections with a priority tick pending go first, in FIFO order
+        for state in self._queue:
+            if state.prio_kwargs is not None:
+                self._queue.remove(state)
+                return state
+        return self._queue.pop(0)
+
+    def _schedule_next(self, state, start, duration, failed):
+        if failed:
+            state.failures += 1
+            delay = min(self._interval * (2**state.failures), self.MAX_BACKOFF)
+        else:
+            state.failures = 0
+            delay = min(max(self._interval, duration * self.LOAD_FACTOR), self.MAX_INTERVAL)
+            delay = max(delay, self._interval)
+
+        if not failed and delay != state.interval and delay > self._interval:
+            log.debug("Tick for %s took %.2fs, polling every %.1fs", state.uri, duration, delay)
+        state.interval = delay
+        state.next_due = start + delay
+
+    def _run_tick(self, state, conn, kwargs, is_regular):
+        start = time.monotonic()
+        failed = False
+        try:
+            conn.tick_from_engine(**kwargs)
+        except Exception:  # pragma: no cover
+            # Don't attempt to show any UI error here, since it
+            # can cause dialogs to appear from nowhere if say
+            # libvirtd is shut down
+            failed = True
+            log.debug("Error polling connection %s", conn.get_uri(), exc_info=True)
+        duration = time.monotonic() - start
+
+        with self._cond:
+            state.record(duration)
+            if failed:
+                state.failed_count += 1  # pragma: no cover
+            if is_regular or failed:
+                self._schedule_next(state, start, duration, failed)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._idle_workers += 1
+                while not self._queue:
+                    self._cond.wait()
+                self._idle_workers -= 1
+
+                state = self._pop_next()
+                state.running = True
+                conn = state.conn
+                prio_kwargs = state.prio_kwargs
+                regular_kwargs = state.regular_kwargs
+                state.prio_kwargs = None
+                state.regular_kwargs = None
+
+            if prio_kwargs is not None:
+                self._run_tick(state, conn, prio_kwargs, False)
+            if regular_kwargs is not None:
+                self._run_tick(state, conn, regular_kwargs, True)
+
+            with self._cond:
+                state.running = False
+                # Need to clear reference to make leak check happy
+                state.conn = None
+                if state.is_pending():
+                    state.conn = conn
+                    self._enqueue(state)
+            conn = None
+
+    ##############
+    # Public API #
+    ##############
+
+    def set_interval(self, interval):
+        """
+        Set the base regular tick interval in seconds
+        """
+        with self._cond:
+            self._interval = interval
+            for state in self._states.values():
+                state.next_due = 0
+
+    def schedule_priority(self, conn, kwargs):
+        """
+        Tick conn with kwargs as soon as possible. If a priority tick is
+        already pending for conn, the two are merged.
+        """
+        with self._cond:
+            state = self._get_state(conn)
+            if state.prio_kwargs is None:
+                state.prio_kwargs = dict(kwargs)
+            else:
+                state.prio_kwargs = _merge_tick_kwargs(state.prio_kwargs, kwargs)
+            self._enqueue(state)
+
+    def schedule_regular(self, conns, kwargs):
+        """
+        Queue a regular tick for every conn whose own interval has
+        elapsed. Connections no longer in conns are forgotten.
+        """
+        now = time.monotonic()
+        with self._cond:
+            uris = set()
+            for conn in conns:
+                state = self._get_state(conn)
+                uris.add(state.uri)
+                if state.regular_kwargs is not None:
+                    continue
+                if state.running or now < state.next_due:
+                    if not state.running and not state.is_pending():
+                        # Don't hold on to the connection until it's due
+                        state.conn = None
+                    continue
+                state.regular_kwargs = dict(kwargs)
+                self._enqueue(state)
+
+            for uri in list(self._states):
+                state = self._states[uri]
+                if uri not in uris and not state.running:
+                    if state in self._queue:
+                        self._queue.remove(state)
+                    self._states.pop(uri)
+
+    def get_stats(self):
+        """
+        Return per connection tick metrics as
+        {uri: {count, failed, last, avg, max, interval}}, times in seconds
+        """
+        with self._cond:
+            return {uri: state.get_stats() for uri, state in self._states.items()}
@@ -0,0 +1,106 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import hashlib
+import threading
+import time
+
+
+class _XMLCacheEntry(object):
+    __slots__ = ["digest", "generation", "xmlobj"]
+
+    def __init__(self, digest, generation, xmlobj):
+        self.digest = digest
+        self.generation = generation
+        self.xmlobj = xmlobj
+
+
+class XMLCache(object):
+    """
+    Per connection cache of parsed object XML, keyed by object key
+    (the UUID for domains).
+
+    Each entry remembers a checksum of the raw XML it was parsed from and
+    a generation counter. The generation is bumped when libvirt sends an
+    event for the object, or when a refresh hands us XML with a different
+    checksum. If the XML we fetched matches the cached checksum and no
+    event arrived in between, the previously parsed object is reused and
+    the libxml2 parse is skipped entirely.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.parse_time = 0.0
+
+    @staticmethod
+    def _checksum(xml):
+        return hashlib.sha1(xml.encode("utf-8")).digest()
+
+    def get_generation(self, key):
+        return self._generations.get(key, 0)
+
+    def bump_generation(self, key):
+        """
+        Mark any cached parse for 'key' as stale. Called when an event
+        tells us the object changed.
+        """
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def refresh(self, key, xml, parsecb):
+        """
+        Return the parsed object for 'xml', reusing the cached one if the
+        XML is unchanged.
+
+        :param parsecb: Called with 'xml' to build a new parsed object
+        :returns: (xmlobj, changed), where changed is True if the XML
+            differs from what was cached before, or an event marked the
+            cached parse as stale
+        """
+        digest = self._checksum(xml)
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generations.get(key, 0)
+            if entry and entry.digest == digest and entry.generation == generation:
+                self.hits += 1
+                return entry.xmlobj, False
+            self.misses += 1
+
+        start = time.time()
+        xmlobj = parsecb(xml)
+        parse_time = time.time() - start
+
+        with self._lock:
+            self.parse_time += parse_time
+            generation = self._generations.get(key, 0)
+            changed = not entry or entry.digest != digest or entry.generation != generation
+            if changed:
+                generation += 1
+                self._generations[key] = generation
+            self._entries[key] = _XMLCacheEntry(digest, generation, xmlobj)
+        return xmlobj, changed
+
+    def remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generations.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._generations = {}
+
+    def get_stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "parse_time": self.parse_time,
+        }
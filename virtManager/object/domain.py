@@ -1157,6 +1157,9 @@ class vmmDomain(vmmLibvirtObject):
     def _XMLDesc(self, flags):
         return self._backend.XMLDesc(flags)
 
+    def _xmlcache_key(self):
+        return self.get_uuid()
+
     def _get_backend_status(self):
         return self._backend.info()[0]
 
@@ -1774,8 +1777,14 @@ class vmmDomain(vmmLibvirtObject):
             # the latest XML, but other objects probably don't want to do
             # this since it could be a performance hit.
             self._invalidate_xml()
-            info = self._backend.info()
-            dosignal = self._refresh_status(newstatus=info[0], cansignal=False)
+            newstatus = None
+            if stats_update:
+                newstatus = self.conn.statsmanager.get_cached_state(self)
+            if newstatus is None:
+                newstatus = self._backend.info()[0]
+            else:
+                self.conn.statsmanager.count_avoided(1)
+            dosignal = self._refresh_status(newstatus=newstatus, cansignal=False)
 
         if stats_update:
             self.conn.statsmanager.refresh_vm_stats(self)
@@ -1812,6 +1821,10 @@ class vmmDomainVirtinst(vmmDomain):
     def get_uuid(self):
         return self._backend.uuid
 
+    def _xmlcache_key(self):
+        # Our XML comes from the in memory Guest, nothing to cache
+        return None
+
     def get_id(self):
         return -1  # pragma: no cover
 
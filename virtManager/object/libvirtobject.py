@@ -32,6 +32,7 @@ class vmmLibvirtObject(vmmGObject):
         self._xmlobj = None
         self._xmlobj_to_define = None
         self._is_xml_valid = False
+        self.__xmlcache_key = None
 
         # These should be set by the child classes if necessary
         self._inactive_xml_flags = 0
@@ -78,6 +79,8 @@ class vmmLibvirtObject(vmmGObject):
         return "<%s name=%s id=%s>" % (self.__class__.__name__, name, hex(id(self)))
 
     def _cleanup(self):
+        if self.__xmlcache_key is not None:
+            self.conn.xmlcache.remove(self.__xmlcache_key)
         self._backend = None
 
     def _get_conn(self):
@@ -153,6 +156,10 @@ class vmmLibvirtObject(vmmGObject):
     def reports_stats(self):
         return False
 
+    def _xmlcache_key(self):
+        # Key for the connection XML cache, None to not use the cache
+        return None
+
     def _using_events(self):
         return False
 
@@ -254,6 +261,9 @@ class vmmLibvirtObject(vmmGObject):
         ways, like runtime XML changing when a VM is started.
         """
         try:
+            key = self._xmlcache_key()
+            if key is not None:
+                self.conn.xmlcache.bump_generation(key)
             self.__force_refresh_xml(nosignal=True)
             # status = None forces a signal to be emitted
             self.__status = None
@@ -285,18 +295,29 @@ class vmmLibvirtObject(vmmGObject):
         :param nosignal: If true, don't send state-changed. Used by
             callers that are going to send it anyways.
         """
+        key = self._xmlcache_key()
         origxml = None
-        if self._xmlobj:
+        if self._xmlobj and key is None:
             origxml = self._xmlobj.get_xml()
 
         self._invalidate_xml()
         active_xml = self._XMLDesc(self._active_xml_flags)
-        self._xmlobj = self._parseclass(self.conn.get_backend(), parsexml=active_xml)
+        if key is None:
+            self._xmlobj = self._parse_xml(active_xml)
+            changed = origxml != active_xml
+        else:
+            if self.__xmlcache_key not in [None, key]:
+                self.conn.xmlcache.remove(self.__xmlcache_key)
+            self.__xmlcache_key = key
+            self._xmlobj, changed = self.conn.xmlcache.refresh(key, active_xml, self._parse_xml)
         self._is_xml_valid = True
 
-        if not nosignal and origxml != active_xml:
+        if not nosignal and changed:
             self.idle_emit("state-changed")
 
+    def _parse_xml(self, xml):
+        return self._parseclass(self.conn.get_backend(), parsexml=xml)
+
     def get_xmlobj(self, inactive=False, refresh_if_nec=True):
         """
         Get object xml, return it wrapped in a virtinst object.
@@ -316,7 +337,7 @@ class vmmLibvirtObject(vmmGObject):
             # stopped). Callers that request inactive are basically expecting
             # a new copy.
             inactive_xml = self._XMLDesc(self._inactive_xml_flags)
-            return self._parseclass(self.conn.get_backend(), parsexml=inactive_xml)
+            return self._parse_xml(inactive_xml)
 
         if self._xmlobj is None or (refresh_if_nec and not self._is_xml_valid):
             self.ensure_latest_xml()
@@ -18,6 +18,7 @@ gi.require_version("LibvirtGLib", "1.0")
 from gi.repository import LibvirtGLib
 
 from virtinst import BuildConfig
+from virtinst import VirtinstConnection
 from virtinst import cli
 from virtinst import log
 
@@ -143,7 +144,11 @@ def parse_commandline():
     parser.set_defaults(domain=None)
 
     # Trace every libvirt API call to debug output
-    parser.add_argument("--trace-libvirt", choices=["all", "mainloop"], help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--trace-libvirt", choices=["all", "mainloop", "profile"], help=argparse.SUPPRESS
+    )
+    # Where --trace-libvirt=profile writes its JSON stats on exit
+    parser.add_argument("--trace-libvirt-output", help=argparse.SUPPRESS)
 
     # comma separated string of options to tweak app behavior,
     # for manual and automated testing config
@@ -206,6 +211,11 @@ def main():
         from .lib import module_trace
         import libvirt
 
+        if options.trace_libvirt == "profile":
+            output = options.trace_libvirt_output or os.path.join(
+                VirtinstConnection.get_app_cache_dir(), "libvirt-profile.json"
+            )
+            module_trace.enable_profile(output)
         module_trace.wrap_module(
             libvirt, mainloop=(options.trace_libvirt == "mainloop"), regex=None
         )
@@ -304,6 +314,17 @@ def main():
 
     GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGINT, _sigint_handler, None)
 
+    if options.trace_libvirt == "profile":
+        # Write out the libvirt call profile collected so far, while running
+        def _sigusr1_handler(user_data):  # pragma: no cover
+            ignore = user_data
+            from .lib import module_trace
+
+            module_trace.PROFILE.dump()
+            return True
+
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, _sigusr1_handler, None)
+
     engine.start(options.uri, show_window, domain, skip_autostart)
 
 
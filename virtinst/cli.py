@@ -1254,21 +1254,88 @@ class _VirtCLIArgumentStatic(object):
     def nonregex_cliname(self):
         return self.cliname.replace("[0-9]*", "")
 
-    def match_name(self, userstr):
+    def all_clinames(self):
         """
-        Return True if the passed user string matches this
-        VirtCLIArgument. So for an option like --foo bar=X, this
-        checks if we are the parser for 'bar'
+        Return the cliname and all its aliases, in match priority order
         """
-        for cliname in [self.cliname] + xmlutil.listify(self._aliases):
-            if "[" in cliname:
-                ret = re.match("^%s$" % cliname.replace(".", r"\."), userstr)
-            else:
-                ret = cliname == userstr
-            if ret:
-                _SuboptChecker.add_seen(self._testsuite_argcheck_name(cliname))
-                return True
-        return False
+        return [self.cliname] + xmlutil.listify(self._aliases)
+
+    def mark_seen(self, cliname):
+        """
+        Record for the testsuite that the user passed us 'cliname'
+        """
+        _SuboptChecker.add_seen(self._testsuite_argcheck_name(cliname))
+
+
+class _VirtCLIArgTable(object):
+    """
+    Lookup table mapping user passed suboption names to the
+    _VirtCLIArgumentStatic that handles them.
+
+    Plain clinames and aliases are stored in a dict. Regex clinames like
+    seclabel[0-9]*.model are combined into a single compiled regex with
+    one named group per pattern. If a name matches multiple virtargs, the
+    one registered first wins, same as a linear scan over the virtargs.
+    """
+
+    def __init__(self, virtargs):
+        self.virtargs = virtargs
+        self._count = len(virtargs)
+        self._exact = {}
+        self._groups = {}
+        self._cache = {}
+
+        patterns = []
+        for argidx, virtarg in enumerate(virtargs):
+            for nameidx, cliname in enumerate(virtarg.all_clinames()):
+                entry = ((argidx, nameidx), cliname)
+                if "[" not in cliname:
+                    self._exact.setdefault(cliname, entry)
+                    continue
+                group = "g%d" % len(patterns)
+                self._groups[group] = entry
+                patterns.append("(?P<%s>%s)" % (group, cliname.replace(".", r"\.")))
+        self._regex = None
+        if patterns:
+            self._regex = re.compile("|".join(patterns))
+
+    def is_current(self, virtargs):
+        """
+        Return True if the table was built from the current state
+        of the passed virtargs list
+        """
+        return self.virtargs is virtargs and self._count == len(virtargs)
+
+    def _find(self, userstr):
+        ret = self._exact.get(userstr)
+        match = self._regex and self._regex.fullmatch(userstr)
+        if match:
+            patret = self._groups[match.lastgroup]
+            if not ret or patret[0] < ret[0]:
+                ret = patret
+        return ret
+
+    def lookup(self, userstr):
+        """
+        Return the index in self.virtargs of the virtarg that handles
+        the user passed name 'userstr', or None if there isn't one.
+        So for an option like --foo bar=X, this finds the parser for 'bar'
+        """
+        if userstr not in self._cache:
+            self._cache[userstr] = self._find(userstr)
+        ret = self._cache[userstr]
+        if not ret:
+            return None
+
+        (argidx, dummy), cliname = ret
+        self.virtargs[argidx].mark_seen(cliname)
+        return argidx
+
+    def lookup_virtarg(self, userstr):
+        argidx = self.lookup(userstr)
+        if argidx is None:
+            return None
+        return self.virtargs[argidx]
 
 
 class _VirtCLIArgument(object):
@@ -1364,6 +1431,9 @@ class _VirtCLIArgument(object):
         return xmlval == clival
 
 
+_OPTSTR_NEEDS_SHLEX = re.compile(r"[\"'\\]")
+
+
 def parse_optstr_tuples(optstr):
     """
     Parse the command string into an ordered list of tuples. So
@@ -1371,13 +1441,21 @@ def parse_optstr_tuples(optstr):
 
     [("path", "foo"), ("size", "5"), ("path", "bar")]
     """
-    argsplitter = shlex.shlex(optstr or "", posix=True)
-    argsplitter.commenters = ""
-    argsplitter.whitespace = ","
-    argsplitter.whitespace_split = True
-    ret = []
+    optstr = optstr or ""
+    if _OPTSTR_NEEDS_SHLEX.search(optstr):
+        argsplitter = shlex.shlex(optstr, posix=True)
+        argsplitter.commenters = ""
+        argsplitter.whitespace = ","
+        argsplitter.whitespace_split = True
+        opts = list(argsplitter)
+    else:
+        # Without any quoting or escaping, shlex is just splitting
+        # on commas and dropping empty tokens. Skip its slow char by char
+        # state machine for this common case.
+        opts = [opt for opt in optstr.split(",") if opt]
 
-    for opt in list(argsplitter):
+    ret = []
+    for opt in opts:
         if "=" in opt:
             cliname, val = opt.split("=", 1)
         else:
@@ -1388,10 +1466,10 @@ def parse_optstr_tuples(optstr):
     return ret
 
 
-def _parse_optstr_to_dict(optstr, virtargs, remove_first):
+def _parse_optstr_to_dict(optstr, argtable, remove_first):
     """
     Parse the passed argument string into an OrderedDict WRT
-    the passed list of VirtCLIArguments and their special handling.
+    the passed _VirtCLIArgTable and its VirtCLIArguments special handling.
 
     So for --disk path=foo,size=5, optstr is 'path=foo,size=5', and
     we return {"path": "foo", "size": "5"}
@@ -1399,15 +1477,10 @@ def _parse_optstr_to_dict(optstr, virtargs, remove_first):
     optdict = collections.OrderedDict()
     opttuples = parse_optstr_tuples(optstr)
 
-    def _lookup_virtarg(cliname):
-        for virtarg in virtargs:
-            if virtarg.match_name(cliname):
-                return virtarg
-
     def _consume_comma_arg(commaopt):
         while opttuples:
             cliname, val = opttuples[0]
-            if _lookup_virtarg(cliname):
+            if argtable.lookup(cliname) is not None:
                 # Next tuple is for an actual virtarg
                 break
 
@@ -1428,7 +1501,7 @@ def _parse_optstr_to_dict(optstr, virtargs, remove_first):
 
     while opttuples:
         cliname, val = opttuples.pop(0)
-        virtarg = _lookup_virtarg(cliname)
+        virtarg = argtable.lookup_virtarg(cliname)
         if not virtarg:
             optdict[cliname] = val
             continue
@@ -1505,6 +1578,7 @@ class VirtCLIParser(metaclass=_InitClass):
     stub_none = True
     cli_arg_name = None
     _virtargs = []
+    _virtarg_table = None
     aliases = {}
     supports_clearxml = True
 
@@ -1534,6 +1608,18 @@ class VirtCLIParser(metaclass=_InitClass):
             virtarg.set_aliases(xmlutil.listify(cls.aliases.pop(virtarg.cliname)))
         cls._virtargs.append(virtarg)
 
+    @classmethod
+    def _get_virtarg_table(cls):
+        """
+        Return the _VirtCLIArgTable for our virtargs, building it
+        on first use or if more args were added since
+        """
+        table = cls._virtarg_table
+        if not table or not table.is_current(cls._virtargs):
+            table = _VirtCLIArgTable(cls._virtargs)
+            cls._virtarg_table = table
+        return table
+
     @classmethod
     def cli_flag_name(cls):
         return "--" + cls.cli_arg_name.replace("_", "-")
@@ -1596,7 +1682,7 @@ class VirtCLIParser(metaclass=_InitClass):
         if self.optstr == self.OPTSTR_EMPTY:
             self.optstr = ""
         self.optdict = _parse_optstr_to_dict(
-            self.optstr, self._virtargs, xmlutil.listify(self.remove_first)[:]
+            self.optstr, self._get_virtarg_table(), xmlutil.listify(self.remove_first)[:]
         )
 
     def _clearxml_cb(self, inst, val, virtarg):
@@ -1654,12 +1740,20 @@ class VirtCLIParser(metaclass=_InitClass):
         Convert the passed optdict to a list of instantiated
         VirtCLIArguments to actually interact with
         """
+        table = self._get_virtarg_table()
+        found = []
+        for key in list(optdict.keys()):
+            argidx = table.lookup(key)
+            if argidx is not None:
+                found.append((argidx, key))
+
+        # Process params in virtarg registration order. sort() is stable,
+        # so keys for the same virtarg keep their command line order
+        found.sort(key=lambda f: f[0])
         ret = []
-        for virtargstatic in self._virtargs:
-            for key in list(optdict.keys()):
-                if virtargstatic.match_name(key):
-                    arginst = _VirtCLIArgument(virtargstatic, key, optdict.pop(key))
-                    ret.append(arginst)
+        for argidx, key in found:
+            arginst = _VirtCLIArgument(table.virtargs[argidx], key, optdict.pop(key))
+            ret.append(arginst)
         return ret
 
     def _check_leftover_opts(self, optdict):
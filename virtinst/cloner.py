@@ -9,6 +9,7 @@
 
 import re
 import os
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
 
 import libvirt
@@ -67,8 +68,9 @@ def _generate_clone_name(conn, basename):
         return generatename.check_libvirt_collision(conn.lookupByName, n)
 
     basename = basename + "-clone"
+    existing = generatename.list_existing(conn.listAllDomains, lambda d: d.name())
     return generatename.generate_name(
-        basename, cb, sep="", start_num=start_num, force_num=force_num
+        basename, cb, sep="", start_num=start_num, force_num=force_num, existing=existing
     )
 
 
@@ -333,6 +335,7 @@ class Cloner(object):
         self._sparse = True
         self._replace = False
         self._reflink = False
+        self._clone_jobs = 1
 
     #################
     # Init routines #
@@ -460,6 +463,12 @@ class Cloner(object):
         """
         self._sparse = flg
 
+    def set_clone_jobs(self, jobs):
+        """
+        Number of disks to clone concurrently. Defaults to 1
+        """
+        self._clone_jobs = max(1, int(jobs))
+
     def get_diskinfos(self):
         """
         Return the list of _CloneDiskInfo instances
@@ -588,6 +597,79 @@ class Cloner(object):
         diff = xmlutil.diff(self._src_guest.get_xml(), self._new_guest.get_xml())
         log.debug("Clone guest xml diff:\n%s", diff)
 
+    def _get_preexisting_storage(self, disks):
+        """
+        Return the set of clone destination paths that already exist,
+        and so must never be removed if the clone fails
+        """
+        ret = set()
+        for disk in disks:
+            path = disk.get_source_path()
+            if disk.get_vol_install():
+                # A new libvirt volume, which libvirt removes itself
+                # if creating it fails
+                continue
+            if path and os.path.exists(path):
+                ret.add(path)
+        return ret
+
+    def _cleanup_created_storage(self, disks, preexisting, meter):
+        """
+        Remove the clone destinations this run created, including a
+        partially written one. Paths in 'preexisting' are left alone.
+        """
+        for disk in disks:
+            path = disk.get_source_path()
+            if path in preexisting:
+                continue
+            if not disk.get_vol_object() and (disk.get_vol_install() or not os.path.exists(path)):
+                continue
+            log.debug("Removing cloned disk path=%s", path)
+            try:
+                meter.start(_("Removing disk '%s'") % os.path.basename(path), None)
+                if disk.get_vol_object():
+                    disk.get_vol_object().delete()
+                else:
+                    os.unlink(path)
+                meter.end()
+            except Exception:  # pragma: no cover
+                log.debug("Failed to remove cloned disk '%s'", path, exc_info=True)
+        self.conn.invalidate_fetch_cache(vols=True)
+
+    def _build_storage_parallel(self, disks, meter):
+        """
+        Clone the passed disks concurrently, up to self._clone_jobs at once.
+        Progress of all of them is combined into the passed meter.
+
+        If any clone fails, queued clones are skipped and the first
+        error is raised.
+        """
+        total = sum(int((d.get_size() or 0) * 1024 * 1024 * 1024) for d in disks)
+        aggregate = progress.AggregateMeter(
+            meter, _("Cloning %d disks") % len(disks), total or None
+        )
+        jobs = min(self._clone_jobs, len(disks))
+        log.debug("Cloning %d disks with %d jobs", len(disks), jobs)
+
+        def _build(disk):
+            disk.build_storage(aggregate.make_child())
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_build, d) for d in disks]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    if not errors:
+                        for f in futures:
+                            f.cancel()
+                    errors.append(e)
+        aggregate.end()
+
+        if errors:
+            raise errors[0]
+
     def start_duplicate(self, meter=None):
         """
         Actually perform the duplication: cloning disks if needed and defining
@@ -609,10 +691,17 @@ class Cloner(object):
             if self._nvram_diskinfo:
                 diskinfos.append(self._nvram_diskinfo)
 
-            for diskinfo in diskinfos:
-                if not diskinfo.is_clone_requested():
-                    continue
-                diskinfo.new_disk.build_storage(meter)
+            clonedisks = [d.new_disk for d in diskinfos if d.is_clone_requested()]
+            preexisting = self._get_preexisting_storage(clonedisks)
+            try:
+                if self._clone_jobs > 1 and len(clonedisks) > 1:
+                    self._build_storage_parallel(clonedisks, meter)
+                else:
+                    for new_disk in clonedisks:
+                        new_disk.build_storage(meter)
+            except Exception:
+                self._cleanup_created_storage(clonedisks, preexisting, meter)
+                raise
         except Exception as e:
             log.debug("Duplicate failed: %s", str(e))
             if dom:
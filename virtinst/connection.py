@@ -4,7 +4,11 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import collections
+import hashlib
 import os
+import threading
+import time
 import weakref
 
 import libvirt
@@ -15,6 +19,7 @@ from . import support
 from . import xmlutil
 from .guest import Guest
 from .logger import log
+from .network import Network
 from .nodedev import NodeDevice
 from .storage import StoragePool, StorageVolume
 from .uri import URI, MagicURI
@@ -31,6 +36,249 @@ def _real_local_libvirt_version():
     return getattr(libvirt, key)
 
 
+class _FetchCache(object):
+    """
+    Storage for the fetch_all_* object lists.
+
+    Each list is stamped with the time it was fetched, and is dropped
+    once it is older than the TTL registered for its key, so long running
+    callers eventually notice objects created or removed behind our back.
+    Lookup indexes over a list are built on first use and dropped
+    whenever the list is replaced, invalidated, or changed in place.
+    """
+
+    def __init__(self, ttls):
+        self._ttls = ttls
+        self._entries = {}
+        self._indexes = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def _is_expired(self, key, timestamp):
+        ttl = self._ttls.get(key)
+        return ttl is not None and time.monotonic() - timestamp > ttl
+
+    def _get_unlocked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._is_expired(key, entry[0]):
+            log.debug("fetch cache key=%s expired", key)
+            self._drop(key)
+            return None
+        return entry[1]
+
+    def get(self, key):
+        """
+        Return the cached list for 'key', or None if there is no
+        unexpired one
+        """
+        with self._lock:
+            return self._get_unlocked(key)
+
+    def get_or_fetch(self, key, raw_cb):
+        """
+        Return the cached list for 'key', calling raw_cb() to fetch and
+        store a new one if there is none. The returned list is the one
+        found or stored, so a concurrent invalidate can't make it vanish.
+        """
+        with self._lock:
+            objlist = self._get_unlocked(key)
+            if objlist is not None:
+                return objlist
+
+        objlist = raw_cb()
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic(), objlist)
+        return objlist
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._entries[key][1]
+
+    def __setitem__(self, key, objlist):
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic(), objlist)
+
+    def items(self):
+        return [(key, entry[1]) for key, entry in list(self._entries.items())]
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        for idxkey in [k for k in self._indexes if k[0] == key]:
+            self._indexes.pop(idxkey)
+
+    def invalidate(self, key=None):
+        """
+        Drop the cached list for 'key', or everything if key is None
+        """
+        with self._lock:
+            if key is None:
+                self._entries = {}
+                self._indexes = {}
+                self._derived = {}
+            else:
+                self._drop(key)
+
+    def changed(self, key):
+        """
+        Drop any indexes for 'key' after its list was altered in place
+        """
+        with self._lock:
+            for idxkey in [k for k in self._indexes if k[0] == key]:
+                self._indexes.pop(idxkey)
+
+    def get_derived(self, name, objlists, buildcb):
+        """
+        Return buildcb(*objlists), reusing the previous result for 'name'
+        as long as every list still holds the very same objects. This
+        works for lists we don't own too, like the ones virt-manager
+        hands us, since those objects are replaced when their XML changes.
+        """
+        with self._lock:
+            entry = self._derived.get(name)
+        if entry and len(entry[0]) == len(objlists):
+            if all(
+                len(old) == len(new) and all(a is b for a, b in zip(old, new))
+                for old, new in zip(entry[0], objlists)
+            ):
+                return entry[1]
+
+        value = buildcb(*objlists)
+        with self._lock:
+            self._derived[name] = ([objlist[:] for objlist in objlists], value)
+        return value
+
+    def get_index(self, key, indexname, keyscb, objlist):
+        """
+        Return a dict mapping index values to objects from 'objlist', the
+        list cached for 'key'. 'keyscb' returns the list of index values
+        for a single object. When several objects share a value, the first
+        one in list order wins, same as a linear scan would. The index is
+        only kept while objlist is still the cached list.
+        """
+        idxkey = (key, indexname)
+        with self._lock:
+            entry = self._entries.get(key)
+            is_current = entry is not None and entry[1] is objlist
+            index = None
+            if is_current:
+                index = self._indexes.get(idxkey)
+            if index is None:
+                index = {}
+                for obj in objlist:
+                    for value in keyscb(obj):
+                        if value is not None:
+                            index.setdefault(value, obj)
+                if is_current:
+                    self._indexes[idxkey] = index
+            return index
+
+
+class _CapsCache(object):
+    """
+    LRU cache of capabilities and domain capabilities XML for a single
+    connection. With VIRTINST_CAPS_CACHE=1 in the environment, entries
+    are also saved to the app cache dir and reused across processes.
+
+    Keys carry the URI and the libvirt and hypervisor versions, and for
+    domcaps the emulator binary mtime, so upgrades never see stale XML.
+    """
+
+    MAXSIZE = 32
+    DISK_MAX_AGE = 24 * 60 * 60
+
+    def __init__(self):
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._diskdir = None
+        if os.environ.get("VIRTINST_CAPS_CACHE"):
+            self._diskdir = os.path.join(VirtinstConnection.get_app_cache_dir(), "caps")
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self._diskdir, digest + ".xml")
+
+    def _disk_read(self, key):
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.DISK_MAX_AGE:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _disk_write(self, key, xml):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(self._diskdir, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(xml)
+            os.replace(path + ".tmp", path)
+        except OSError as e:  # pragma: no cover
+            log.debug("Error writing caps cache %s: %s", path, e)
+
+    def lookup(self, key, fetchcb):
+        """
+        Return the XML cached for 'key', calling fetchcb() to get it
+        on a miss. Errors from fetchcb are never cached.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        xml = None
+        if self._diskdir:
+            xml = self._disk_read(key)
+        if xml is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            xml = fetchcb()
+            if self._diskdir and xml:
+                self._disk_write(key, xml)
+
+        with self._lock:
+            self._entries[key] = xml
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.MAXSIZE:
+                self._entries.popitem(last=False)
+        return xml
+
+    def remove(self, key):
+        """
+        Drop 'key' from memory and disk, so the next lookup fetches
+        fresh XML
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._diskdir:
+            try:
+                os.unlink(self._disk_path(key))
+            except OSError:
+                pass
+
+    def get_stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
 class VirtinstConnection(object):
     """
     Wrapper for libvirt connection that provides various bits like
@@ -76,8 +324,9 @@ class VirtinstConnection(object):
         self._libvirtconn = None
         self._uriobj = URI(self._uri)
         self._caps = None
+        self._caps_cache = _CapsCache()
 
-        self._fetch_cache = {}
+        self._fetch_cache = _FetchCache(self._FETCH_TTLS)
 
         # These let virt-manager register a callback which provides its
         # own cached object lists, rather than doing fresh calls
@@ -85,6 +334,7 @@ class VirtinstConnection(object):
         self.cb_fetch_all_pools = None
         self.cb_fetch_all_vols = None
         self.cb_fetch_all_nodedevs = None
+        self.cb_fetch_all_networks = None
         self.cb_cache_new_pool = None
 
         self.support = support.SupportCache(weakref.proxy(self))
@@ -103,9 +353,14 @@ class VirtinstConnection(object):
 
     uri = property(_get_uri)
 
+    def _caps_cache_key(self, *args):
+        return (self._uri, self.daemon_version(), self.conn_version()) + args
+
     def _get_caps(self):
         if not self._caps:
-            capsxml = self._libvirtconn.getCapabilities()
+            capsxml = self._caps_cache.lookup(
+                self._caps_cache_key("caps"), self._libvirtconn.getCapabilities
+            )
             self._caps = Capabilities(self, capsxml)
             log.debug("Fetched capabilities for %s: %s", self._uri, capsxml)
         return self._caps
@@ -139,11 +394,12 @@ class VirtinstConnection(object):
 
     def close(self):
         ret = 0
+        log.debug("caps cache stats for %s: %s", self._uri, self._caps_cache.get_stats())
         if self._libvirtconn:
             ret = self._libvirtconn.close()
         self._libvirtconn = None
         self._uri = None
-        self._fetch_cache = {}
+        self._fetch_cache.invalidate()
         return ret
 
     def fake_conn_predictable(self):
@@ -151,6 +407,7 @@ class VirtinstConnection(object):
 
     def invalidate_caps(self):
         self._caps = None
+        self._caps_cache.remove(self._caps_cache_key("caps"))
 
     def is_open(self):
         return bool(self._libvirtconn)
@@ -196,13 +453,59 @@ class VirtinstConnection(object):
     _FETCH_KEY_POOLS = "pools"
     _FETCH_KEY_VOLS = "vols"
     _FETCH_KEY_NODEDEVS = "nodedevs"
-
-    def _fetch_helper(self, key, raw_cb, override_cb):
+    _FETCH_KEY_NETWORKS = "nets"
+
+    # Seconds until a cached list is refetched. Objects we create or
+    # define through this connection invalidate the relevant key right
+    # away, so these only bound how stale outside changes can get.
+    _FETCH_TTLS = {
+        _FETCH_KEY_DOMAINS: 30,
+        _FETCH_KEY_POOLS: 120,
+        _FETCH_KEY_VOLS: 30,
+        _FETCH_KEY_NODEDEVS: 120,
+        _FETCH_KEY_NETWORKS: 120,
+    }
+
+    def _fetch_callbacks(self, key):
+        return {
+            self._FETCH_KEY_DOMAINS: (self._fetch_all_domains_raw, self.cb_fetch_all_domains),
+            self._FETCH_KEY_POOLS: (self._fetch_all_pools_raw, self.cb_fetch_all_pools),
+            self._FETCH_KEY_VOLS: (self._fetch_all_vols_raw, self.cb_fetch_all_vols),
+            self._FETCH_KEY_NODEDEVS: (self._fetch_all_nodedevs_raw, self.cb_fetch_all_nodedevs),
+            self._FETCH_KEY_NETWORKS: (self._fetch_all_networks_raw, self.cb_fetch_all_networks),
+        }[key]
+
+    def _fetch_cached(self, key):
+        """
+        Return the cached list for 'key', fetching it if needed. The
+        list is shared, callers must not alter it.
+        """
+        raw_cb, override_cb = self._fetch_callbacks(key)
         if override_cb:
             return override_cb()  # pragma: no cover
-        if key not in self._fetch_cache:
-            self._fetch_cache[key] = raw_cb()
-        return self._fetch_cache[key][:]
+        return self._fetch_cache.get_or_fetch(key, raw_cb)
+
+    def _fetch_helper(self, key):
+        return self._fetch_cached(key)[:]
+
+    def _fetch_index(self, key, indexname, keyscb):
+        """
+        Return a dict of index value -> object over the fetch_all_* list
+        for 'key'. See _FetchCache.get_index for the 'keyscb' contract.
+        """
+        dummy, override_cb = self._fetch_callbacks(key)
+        if override_cb:  # pragma: no cover
+            # virt-manager maintains its own lists, so there is nothing
+            # for us to keep an index in sync with
+            index = {}
+            for obj in override_cb():
+                for value in keyscb(obj):
+                    if value is not None:
+                        index.setdefault(value, obj)
+            return index
+
+        objlist = self._fetch_cached(key)
+        return self._fetch_cache.get_index(key, indexname, keyscb, objlist)
 
     def _fetch_all_domains_raw(self):
         dummy1, dummy2, ret = pollhelpers.fetch_vms(self, {}, lambda obj, ignore: obj)
@@ -237,6 +540,19 @@ class VirtinstConnection(object):
         dummy1, dummy2, ret = pollhelpers.fetch_nodedevs(self, {}, lambda obj, ignore: obj)
         return [NodeDevice(weakref.proxy(self), obj.XMLDesc(0)) for obj in ret]
 
+    def _fetch_all_networks_raw(self):
+        dummy1, dummy2, ret = pollhelpers.fetch_nets(self, {}, lambda obj, ignore: obj)
+        networks = []
+        for obj in ret:
+            # TOCTOU race: a network may go away in between enumeration and inspection
+            try:
+                xml = obj.XMLDesc(0)
+            except libvirt.libvirtError as e:  # pragma: no cover
+                log.debug("Fetching network XML failed: %s", e)
+                continue
+            networks.append(Network(weakref.proxy(self), parsexml=xml))
+        return networks
+
     def _fetch_vols_raw(self, poolxmlobj):
         ret = []
         # TOCTOU race: a volume may go away in between enumeration and inspection
@@ -253,7 +569,9 @@ class VirtinstConnection(object):
         for vol in vols:
             try:
                 xml = vol.XMLDesc(0)
-                ret.append(StorageVolume(weakref.proxy(self), parsexml=xml))
+                volxml = StorageVolume(weakref.proxy(self), parsexml=xml)
+                volxml.pool_name = poolxmlobj.name
+                ret.append(volxml)
             except libvirt.libvirtError as e:  # pragma: no cover
                 log.debug("Fetching volume XML failed: %s", e)
         return ret
@@ -266,19 +584,21 @@ class VirtinstConnection(object):
 
     def _cache_new_pool_raw(self, poolobj):
         # Make sure cache is primed
-        if self._FETCH_KEY_POOLS not in self._fetch_cache:
+        poollist = self._fetch_cache.get(self._FETCH_KEY_POOLS)
+        if poollist is None:
             # Nothing cached yet, so next poll will pull in latest bits,
             # so there's nothing to do
             return
 
-        poollist = self._fetch_cache[self._FETCH_KEY_POOLS]
         poolxmlobj = self._build_pool_raw(poolobj)
         poollist.append(poolxmlobj)
+        self._fetch_cache.changed(self._FETCH_KEY_POOLS)
 
-        if self._FETCH_KEY_VOLS not in self._fetch_cache:
+        vollist = self._fetch_cache.get(self._FETCH_KEY_VOLS)
+        if vollist is None:
             return
-        vollist = self._fetch_cache[self._FETCH_KEY_VOLS]
         vollist.extend(self._fetch_vols_raw(poolxmlobj))
+        self._fetch_cache.changed(self._FETCH_KEY_VOLS)
 
     def cache_new_pool(self, poolobj):
         """
@@ -289,37 +609,163 @@ class VirtinstConnection(object):
             return self.cb_cache_new_pool(poolobj)
         return self._cache_new_pool_raw(poolobj)
 
+    def cache_pool_refresh(self, poolobj):
+        """
+        Update the cached volume list after the passed poolobj was
+        refreshed, rather than refetching volumes for every pool
+        """
+        if self.cb_fetch_all_vols:
+            # virt-manager tracks pool refreshes itself
+            return  # pragma: no cover
+        vollist = self._fetch_cache.get(self._FETCH_KEY_VOLS)
+        if vollist is None:
+            return
+
+        poolname = poolobj.name()
+        newvols = self._fetch_vols_raw(self._build_pool_raw(poolobj))
+        vollist[:] = [vol for vol in vollist if vol.pool_name != poolname] + newvols
+        self._fetch_cache.changed(self._FETCH_KEY_VOLS)
+
+    def cache_new_vol(self, volobj, poolname):
+        """
+        Insert the passed volobj from pool 'poolname' into our cached
+        volume list, replacing any entry with the same path
+        """
+        if self.cb_fetch_all_vols:
+            return  # pragma: no cover
+        vollist = self._fetch_cache.get(self._FETCH_KEY_VOLS)
+        if vollist is None:
+            return
+
+        try:
+            volxml = StorageVolume(weakref.proxy(self), parsexml=volobj.XMLDesc(0))
+        except libvirt.libvirtError as e:  # pragma: no cover
+            log.debug("Fetching volume XML failed: %s", e)
+            return
+        volxml.pool_name = poolname
+        vollist[:] = [vol for vol in vollist if vol.target_path != volxml.target_path]
+        vollist.append(volxml)
+        self._fetch_cache.changed(self._FETCH_KEY_VOLS)
+
+    def _fetch_keys(self, domains, pools, vols, nodedevs, networks):
+        keys = []
+        if domains:
+            keys.append(self._FETCH_KEY_DOMAINS)
+        if pools:
+            keys.append(self._FETCH_KEY_POOLS)
+        if vols:
+            keys.append(self._FETCH_KEY_VOLS)
+        if nodedevs:
+            keys.append(self._FETCH_KEY_NODEDEVS)
+        if networks:
+            keys.append(self._FETCH_KEY_NETWORKS)
+        return keys
+
+    def invalidate_fetch_cache(
+        self, domains=False, pools=False, vols=False, nodedevs=False, networks=False
+    ):
+        """
+        Drop the requested fetch_all_* lists, so the next call fetches
+        fresh data from libvirt. With no arguments everything is dropped.
+        Apps that listen for libvirt lifecycle events can call this from
+        their event handlers.
+        """
+        keys = self._fetch_keys(domains, pools, vols, nodedevs, networks)
+        if not keys:
+            self._fetch_cache.invalidate()
+        for key in keys:
+            self._fetch_cache.invalidate(key)
+
+    def fetch_derived(
+        self, name, buildcb, domains=False, pools=False, vols=False, nodedevs=False, networks=False
+    ):
+        """
+        Return data computed from the requested fetch_all_* lists, like a
+        lookup index. buildcb is passed the lists in argument order and
+        is only called again once any of those lists changes.
+        """
+        keys = self._fetch_keys(domains, pools, vols, nodedevs, networks)
+        objlists = [self._fetch_cached(key) for key in keys]
+        return self._fetch_cache.get_derived(name, objlists, buildcb)
+
     def fetch_all_domains(self):
         """
         Returns a list of Guest() objects
         """
-        return self._fetch_helper(
-            self._FETCH_KEY_DOMAINS, self._fetch_all_domains_raw, self.cb_fetch_all_domains
-        )
+        return self._fetch_helper(self._FETCH_KEY_DOMAINS)
 
     def fetch_all_pools(self):
         """
         Returns a list of StoragePool objects
         """
-        return self._fetch_helper(
-            self._FETCH_KEY_POOLS, self._fetch_all_pools_raw, self.cb_fetch_all_pools
-        )
+        return self._fetch_helper(self._FETCH_KEY_POOLS)
 
     def fetch_all_vols(self):
         """
         Returns a list of StorageVolume objects
         """
-        return self._fetch_helper(
-            self._FETCH_KEY_VOLS, self._fetch_all_vols_raw, self.cb_fetch_all_vols
-        )
+        return self._fetch_helper(self._FETCH_KEY_VOLS)
 
     def fetch_all_nodedevs(self):
         """
         Returns a list of NodeDevice() objects
         """
-        return self._fetch_helper(
-            self._FETCH_KEY_NODEDEVS, self._fetch_all_nodedevs_raw, self.cb_fetch_all_nodedevs
+        return self._fetch_helper(self._FETCH_KEY_NODEDEVS)
+
+    def fetch_all_networks(self):
+        """
+        Returns a list of Network() objects
+        """
+        return self._fetch_helper(self._FETCH_KEY_NETWORKS)
+
+    def fetch_domain_by_name(self, name):
+        """
+        Returns the Guest() object with the passed name, or None
+        """
+        index = self._fetch_index(self._FETCH_KEY_DOMAINS, "name", lambda obj: [obj.name])
+        return index.get(name)
+
+    def fetch_domain_by_uuid(self, uuid):
+        """
+        Returns the Guest() object with the passed UUID, or None
+        """
+        index = self._fetch_index(
+            self._FETCH_KEY_DOMAINS, "uuid", lambda obj: [obj.uuid and obj.uuid.lower()]
         )
+        return index.get(uuid and uuid.lower())
+
+    def fetch_pool_by_name(self, name):
+        """
+        Returns the StoragePool object with the passed name, or None
+        """
+        index = self._fetch_index(self._FETCH_KEY_POOLS, "name", lambda obj: [obj.name])
+        return index.get(name)
+
+    def fetch_pool_by_path(self, path):
+        """
+        Returns the first StoragePool object whose absolute target path
+        matches the passed path, or None
+        """
+
+        def _keyscb(obj):
+            return [obj.target_path and os.path.abspath(obj.target_path)]
+
+        index = self._fetch_index(self._FETCH_KEY_POOLS, "path", _keyscb)
+        return index.get(path)
+
+    def fetch_vol_by_path(self, path):
+        """
+        Returns the StorageVolume object with the passed target path, or None
+        """
+        index = self._fetch_index(self._FETCH_KEY_VOLS, "path", lambda obj: [obj.target_path])
+        return index.get(path)
+
+    def fetch_nodedev_by_name(self, name):
+        """
+        Returns the NodeDevice() object with the passed name, or None
+        """
+        index = self._fetch_index(self._FETCH_KEY_NODEDEVS, "name", lambda obj: [obj.name])
+        return index.get(name)
 
     #########################
     # Libvirt API overrides #
@@ -328,6 +774,35 @@ class VirtinstConnection(object):
     def getURI(self):
         return self._uri
 
+    def getDomainCapabilities(self, emulator, arch, machine, virttype, flags=0):
+        emulator_mtime = None
+        if emulator and not self.is_remote():
+            try:
+                emulator_mtime = os.stat(emulator).st_mtime_ns
+            except OSError:
+                pass
+        key = self._caps_cache_key(
+            "domcaps", emulator, emulator_mtime, arch, machine, virttype, flags
+        )
+
+        def _fetch():
+            return self._libvirtconn.getDomainCapabilities(emulator, arch, machine, virttype, flags)
+
+        return self._caps_cache.lookup(key, _fetch)
+
+    def get_caps_cache_stats(self):
+        return self._caps_cache.get_stats()
+
+    def defineXML(self, xml):
+        ret = self._libvirtconn.defineXML(xml)
+        self.invalidate_fetch_cache(domains=True)
+        return ret
+
+    def createXML(self, xml, flags=0):
+        ret = self._libvirtconn.createXML(xml, flags)
+        self.invalidate_fetch_cache(domains=True)
+        return ret
+
     #########################
     # Public version checks #
     #########################
@@ -188,6 +188,64 @@ class _DiskSource(XMLBuilder):
         self.name = path or None
 
 
+class _DiskPathIndex(object):
+    """
+    Inverted index of storage paths to the VMs using them, built in a
+    single pass over every VM's disks, kernel, initrd and dtb.
+
+    A VM also uses every path in the backing chain of its disks. Those
+    chains are walked once at build time using the volume list, so a
+    lookup is just a couple of dict accesses.
+    """
+
+    def __init__(self, vms, vols):
+        self._direct = {}
+        self._indirect = {}
+
+        backmap = dict((vol.target_path, vol.backing_store) for vol in vols if vol.backing_store)
+
+        for vmidx, vm in enumerate(vms):
+            for bootpath in [vm.os.kernel, vm.os.initrd, vm.os.dtb]:
+                if bootpath:
+                    self._direct.setdefault(bootpath, []).append(
+                        (vmidx, vm.name, True, False, False)
+                    )
+
+            for disk in vm.devices.disk:
+                path = disk.get_source_path()
+                if not path:
+                    continue
+                self._direct.setdefault(path, []).append(
+                    (vmidx, vm.name, False, disk.shareable, disk.read_only)
+                )
+
+                seen = [path]
+                backpath = backmap.get(path)
+                while backpath and backpath not in seen:
+                    seen.append(backpath)
+                    self._indirect.setdefault(backpath, []).append((vmidx, vm.name))
+                    backpath = backmap.get(backpath)
+
+    def lookup(self, path, shareable=False, read_only=False):
+        """
+        Return the names of VMs using 'path', in VM list order.
+        See DeviceDisk.path_in_use_by for the parameters.
+        """
+        if not path:
+            return []
+
+        # VMs using the path indirectly via backing store always count
+        found = dict(self._indirect.get(path, []))
+        for vmidx, name, is_boot, disk_shareable, disk_read_only in self._direct.get(path, []):
+            if is_boot:
+                if read_only:
+                    continue
+            elif (shareable and disk_shareable) or (read_only and disk_read_only):
+                continue
+            found[vmidx] = name
+        return [found[vmidx] for vmidx in sorted(found)]
+
+
 class DeviceDisk(Device):
     XML_NAME = "disk"
 
@@ -296,8 +354,12 @@ class DeviceDisk(Device):
         return errdict
 
     @staticmethod
-    def get_volmap(conn):
-        return dict((vol.backing_store, vol) for vol in conn.fetch_all_vols() if vol.backing_store)
+    def get_path_index(conn):
+        """
+        Return the _DiskPathIndex for all VMs on conn, rebuilt only when
+        the domain or volume lists change
+        """
+        return conn.fetch_derived("disk-path-index", _DiskPathIndex, domains=True, vols=True)
 
     @staticmethod
     def path_in_use_by(conn, path, shareable=False, read_only=False):
@@ -311,15 +373,12 @@ class DeviceDisk(Device):
         :param read_only: Path we are checking is marked read_only, so
             don't warn if it conflicts with another read_only source.
         """
-        volmap = DeviceDisk.get_volmap(conn)
-        return DeviceDisk._path_in_use_by(conn, path, volmap, shareable, read_only)
+        return DeviceDisk.get_path_index(conn).lookup(path, shareable, read_only)
 
     @staticmethod
     def paths_in_use_by(conn, paths, shareable=False, read_only=False):
         """
         Return a list of lists of VM names that are using the passed paths.
-        When handling a list of paths, this method is faster than calling
-        path_in_use_by() separately as it takes time to call conn.fetch_all_vols().
 
         :param conn: virConnect to check VMs
         :param paths: Paths to check for
@@ -328,54 +387,8 @@ class DeviceDisk(Device):
         :param read_only: Path we are checking is marked read_only, so
             don't warn if it conflicts with another read_only source.
         """
-        volmap = DeviceDisk.get_volmap(conn)
-        ret = []
-        for path in paths:
-            ret.append(DeviceDisk._path_in_use_by(conn, path, volmap, shareable, read_only))
-        return ret
-
-    @staticmethod
-    def _path_in_use_by(conn, path, volmap, shareable=False, read_only=False):
-        if not path:
-            return []
-
-        # Find all volumes that have 'path' somewhere in their backing chain
-        vols = []
-        backpath = path
-        while backpath in volmap:
-            vol = volmap[backpath]
-            if vol in vols:
-                break  # pragma: no cover
-            backpath = vol.target_path
-            vols.append(backpath)
-
-        ret = []
-        vms = conn.fetch_all_domains()
-        for vm in vms:
-            if not read_only:
-                if path in [vm.os.kernel, vm.os.initrd, vm.os.dtb]:
-                    ret.append(vm.name)
-                    continue
-
-            for disk in vm.devices.disk:
-                checkpath = disk.get_source_path()
-                if checkpath in vols and vm.name not in ret:
-                    # VM uses the path indirectly via backing store
-                    ret.append(vm.name)
-                    break
-
-                if checkpath != path:
-                    continue
-
-                if shareable and disk.shareable:
-                    continue
-                if read_only and disk.read_only:
-                    continue
-
-                ret.append(vm.name)
-                break
-
-        return ret
+        index = DeviceDisk.get_path_index(conn)
+        return [index.lookup(path, shareable, read_only) for path in paths]
 
     @staticmethod
     def build_vol_install(
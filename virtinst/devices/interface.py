@@ -6,6 +6,7 @@
 
 import os
 import random
+import re
 
 from .device import Device, DeviceAddress
 from ..nodedev import NodeDevice
@@ -128,6 +129,61 @@ def _testsuite_mac():
     return ret
 
 
+def _mac_to_int(mac):
+    """
+    Normalize a MAC address string to a 48-bit int, so differently
+    formatted strings for the same address compare equal. Returns None
+    if the string isn't a MAC address.
+    """
+    parts = re.split("[:-]", (mac or "").strip())
+    if len(parts) != 6:
+        return None
+    ret = 0
+    for part in parts:
+        try:
+            val = int(part, 16)
+        except ValueError:
+            return None
+        if not 0 <= val <= 0xFF:
+            return None
+        ret = (ret << 8) | val
+    return ret
+
+
+class _MACRegistry(object):
+    """
+    The MAC addresses in use on a connection, as 48-bit ints, built in
+    one pass over every VM NIC and every libvirt network.
+
+    Network DHCP host entries and bridge MACs are only avoided when
+    generating a new address. A user picking a MAC that has a DHCP host
+    entry is the expected way to use those entries, so that isn't
+    reported as a conflict.
+    """
+
+    def __init__(self, vms, networks):
+        self._vm_macs = set()
+        self._reserved_macs = set()
+
+        for vm in vms:
+            for nic in vm.devices.interface:
+                self._vm_macs.add(_mac_to_int(nic.macaddr))
+        for net in networks:
+            self._reserved_macs.add(_mac_to_int(net.macaddr))
+            for ip in net.ips:
+                for host in ip.hosts:
+                    self._reserved_macs.add(_mac_to_int(host.macaddr))
+
+        self._vm_macs.discard(None)
+        self._reserved_macs.discard(None)
+
+    def vm_has(self, macint):
+        return macint in self._vm_macs
+
+    def is_taken(self, macint):
+        return macint in self._vm_macs or macint in self._reserved_macs
+
+
 class _Backend(XMLBuilder):
     XML_NAME = "backend"
 
@@ -181,25 +237,55 @@ class DeviceInterface(Device):
     TYPE_DIRECT = "direct"
 
     @staticmethod
-    def generate_mac(conn):
+    def get_mac_registry(conn):
+        """
+        Return the _MACRegistry for conn, rebuilt only when the domain
+        or network lists change
+        """
+        return conn.fetch_derived("mac-registry", _MACRegistry, domains=True, networks=True)
+
+    @staticmethod
+    def generate_mac(conn, inuse=None):
         """
-        Generate a random MAC that doesn't conflict with any VMs on
-        the connection.
+        Generate a random MAC that doesn't conflict with any VMs or
+        network DHCP host entries on the connection.
+
+        :param inuse: Optional set of lowercase MACs to avoid as well,
+            like ones handed out for VMs that aren't defined yet. The
+            returned MAC is added to it
         """
         if conn.fake_conn_predictable():
             return _testsuite_mac()
 
+        registry = DeviceInterface.get_mac_registry(conn)
         for ignore in range(256):
             mac = _random_mac(conn)
-            try:
-                DeviceInterface.check_mac_in_use(conn, mac)
-                return mac
-            except RuntimeError:  # pragma: no cover
-                continue
+            if registry.is_taken(_mac_to_int(mac)):
+                continue  # pragma: no cover
+            if inuse is not None:
+                if mac.lower() in inuse:
+                    continue  # pragma: no cover
+                inuse.add(mac.lower())
+            return mac
 
         log.debug("Failed to generate non-conflicting MAC")  # pragma: no cover
         return None  # pragma: no cover
 
+    @staticmethod
+    def generate_macs(conn, count):
+        """
+        Generate 'count' MACs that are unique among themselves and don't
+        conflict with anything on the connection, for bulk provisioning
+        """
+        inuse = set()
+        ret = []
+        for ignore in range(count):
+            mac = DeviceInterface.generate_mac(conn, inuse=inuse)
+            if not mac:
+                break  # pragma: no cover
+            ret.append(mac)
+        return ret
+
     @staticmethod
     def check_mac_in_use(conn, searchmac):
         """
@@ -208,14 +294,11 @@ class DeviceInterface(Device):
         if not searchmac:
             return
 
-        vms = conn.fetch_all_domains()
-        for vm in vms:
-            for nic in vm.devices.interface:
-                nicmac = nic.macaddr or ""
-                if nicmac.lower() == searchmac.lower():
-                    raise RuntimeError(
-                        _("The MAC address '%s' is in use by another virtual machine.") % searchmac
-                    )
+        registry = DeviceInterface.get_mac_registry(conn)
+        if registry.vm_has(_mac_to_int(searchmac)):
+            raise RuntimeError(
+                _("The MAC address '%s' is in use by another virtual machine.") % searchmac
+            )
 
     @staticmethod
     def default_bridge(conn):
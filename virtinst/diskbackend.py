@@ -6,6 +6,8 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import errno
+import fcntl
 import os
 import re
 import stat
@@ -38,6 +40,86 @@ def _lookup_vol_by_path(conn, path):
         return None, e
 
 
+class _CachedStoragePool(object):
+    """
+    Stand-in for a virStoragePool found in the connection's cached pool
+    list. name() and XMLDesc() are answered from the cached XML, anything
+    else looks up the real object on first use.
+    """
+
+    def __init__(self, conn, poolname):
+        self._conn = conn
+        self._poolname = poolname
+        self._poolobj = None
+
+    def __getattr__(self, attr):
+        # Proxy everything else, including '_o' for libvirt API arguments
+        if self.__dict__.get("_poolobj") is None:
+            self._poolobj = self._conn.storagePoolLookupByName(self._poolname)
+        return getattr(self._poolobj, attr)
+
+    def name(self):
+        return self._poolname
+
+    def XMLDesc(self, flags=0):
+        poolxml = self._conn.fetch_pool_by_name(self._poolname)
+        if flags or not poolxml:
+            return self.__getattr__("XMLDesc")(flags)
+        return poolxml.get_xml()
+
+
+class _CachedStorageVolume(object):
+    """
+    Stand-in for a virStorageVol found in the connection's cached volume
+    list, see _CachedStoragePool
+    """
+
+    def __init__(self, conn, volxml, pool):
+        self._conn = conn
+        self._volxml = volxml
+        self._pool = pool
+        self._volobj = None
+
+    def __getattr__(self, attr):
+        if self.__dict__.get("_volobj") is None:
+            self._volobj = self._pool.storageVolLookupByName(self._volxml.name)
+        return getattr(self._volobj, attr)
+
+    def name(self):
+        return self._volxml.name
+
+    def path(self):
+        return self._volxml.target_path
+
+    def XMLDesc(self, flags=0):
+        if flags:
+            return self.__getattr__("XMLDesc")(flags)  # pragma: no cover
+        return self._volxml.get_xml()
+
+    def storagePoolLookupByVolume(self):
+        return self._pool
+
+    def delete(self, flags=0):
+        ret = self.__getattr__("delete")(flags)
+        self._conn.invalidate_fetch_cache(vols=True)
+        return ret
+
+
+def _lookup_vol_by_index(conn, path):
+    """
+    Try to find a volume for 'path' in the connection's cached volume
+    list. This is answered without any libvirt calls, the real objects
+    are only looked up if something beyond name/XML is used. Returns
+    (vol, parent pool), or (None, None) if the path isn't indexed.
+    """
+    volxml = conn.fetch_vol_by_path(path)
+    if not volxml or not volxml.pool_name:
+        return None, None
+
+    pool = _CachedStoragePool(conn, volxml.pool_name)
+    return _CachedStorageVolume(conn, volxml, pool), pool
+
+
 def _lookup_vol_by_basename(pool, path):
     """
     Try to lookup a volume for 'path' in parent 'pool' by it's filename.
@@ -45,8 +127,10 @@ def _lookup_vol_by_basename(pool, path):
     since not all libvirt storage backends implement path lookup.
     """
     name = os.path.basename(path)
-    if name in pool.listVolumes():
+    try:
         return pool.storageVolLookupByName(name)
+    except libvirt.libvirtError:
+        return None
 
 
 def _get_block_size(path):  # pragma: no cover
@@ -80,9 +164,15 @@ def _check_if_path_managed(conn, path):
 
     Returns (volume, parent pool). Only one is returned at a time.
     """
+    vol, pool = _lookup_vol_by_index(conn, path)
+    if vol:
+        return vol, pool
+
     vol, ignore = _lookup_vol_by_path(conn, path)
     if vol:
-        return vol, vol.storagePoolLookupByVolume()
+        pool = vol.storagePoolLookupByVolume()
+        conn.cache_new_vol(vol, pool.name())
+        return vol, pool
 
     pool = StoragePool.lookup_pool_by_path(conn, os.path.dirname(path))
     if not pool:
@@ -99,6 +189,9 @@ def _check_if_path_managed(conn, path):
                 vol = _lookup_vol_by_basename(pool, path)
             except Exception:  # pragma: no cover
                 pass
+        if vol:
+            # Index just this volume, so later lookups of the path hit
+            conn.cache_new_vol(vol, pool.name())
     except Exception as e:  # pragma: no cover
         vol = None
         pool = None
@@ -180,10 +273,8 @@ def path_is_network_vol(conn, path):
     """
     Detect if path is a network volume such as rbd, gluster, etc
     """
-    for volxml in conn.fetch_all_vols():
-        if path and volxml.target_path == path:
-            return volxml.type == "network"
-    return False
+    volxml = path and conn.fetch_vol_by_path(path)
+    return bool(volxml) and volxml.type == "network"
 
 
 def _get_dev_type(path, vol_xml, vol_object, pool_xml, remote):
@@ -604,7 +695,6 @@ class CloneStorageCreator(_StorageCreator):
         # this priority takes an existing file.
 
         if not os.path.exists(self._output_path) and self._sparse:
-            clone_block_size = 4096
             sparse = True
             fd = None
             try:
@@ -614,18 +704,9 @@ class CloneStorageCreator(_StorageCreator):
                 if fd:
                     os.close(fd)
         else:
-            clone_block_size = 1024 * 1024 * 10
             sparse = False
 
-        log.debug(
-            "Local Cloning %s to %s, sparse=%s, block_size=%s",
-            self._input_path,
-            self._output_path,
-            sparse,
-            clone_block_size,
-        )
-
-        zeros = b"\0" * 4096
+        log.debug("Local Cloning %s to %s, sparse=%s", self._input_path, self._output_path, sparse)
 
         src_fd, dst_fd = None, None
         try:
@@ -633,24 +714,15 @@ class CloneStorageCreator(_StorageCreator):
                 src_fd = os.open(self._input_path, os.O_RDONLY)
                 dst_fd = os.open(self._output_path, os.O_WRONLY | os.O_CREAT, 0o640)
 
-                i = 0
-                while 1:
-                    l = os.read(src_fd, clone_block_size)
-                    s = len(l)
-                    if s == 0:
-                        meter.end()
-                        break
-                    # check sequence of zeros
-                    if sparse and zeros == l:
-                        os.lseek(dst_fd, s, 1)
-                    else:
-                        b = os.write(dst_fd, l)
-                        if s != b:  # pragma: no cover
-                            meter.end()
-                            break
-                    i += s
-                    if i < size_bytes:
-                        meter.update(i)
+                # A reflink shares the source extents, holes included,
+                # so there is nothing left to copy
+                if sparse and _clone_reflink(src_fd, dst_fd):
+                    meter.end()
+                    return
+
+                copier = _LocalDiskCopier(src_fd, dst_fd, sparse, meter, size_bytes)
+                copier.copy_all()
+                meter.end()
             except OSError as e:  # pragma: no cover
                 log.debug("Error while cloning", exc_info=True)
                 msg = _("Error cloning diskimage %(inputpath)s to %(outputpath)s: %(error)s") % {
@@ -666,6 +738,159 @@ class CloneStorageCreator(_StorageCreator):
                 os.close(dst_fd)
 
 
+# FICLONE ioctl from linux/fs.h, _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
+_CLONE_BUFFER_SIZE = 1024 * 1024
+_CLONE_RANGE_SIZE = 64 * 1024 * 1024
+_SPARSE_BLOCK_SIZE = 4096
+_ZEROS = memoryview(bytes(_CLONE_BUFFER_SIZE))
+
+
+def _clone_reflink(src_fd, dst_fd):
+    """
+    Try to make dst_fd a copy-on-write clone of src_fd. This only works
+    when both live on the same filesystem and it supports reflinks.
+    """
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    except OSError as e:
+        log.debug("reflink clone not possible: %s", e)
+        return False
+    log.debug("Cloned via reflink")
+    return True
+
+
+def _data_extents(fd, size):
+    """
+    Yield (offset, length) for every data extent of 'fd' up to 'size',
+    skipping holes. If the filesystem can't report holes, the whole
+    file is a single extent.
+    """
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+            end = os.lseek(fd, start, os.SEEK_HOLE)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # Only a hole remains past 'offset'
+                return
+            if offset:
+                raise  # pragma: no cover
+            log.debug("SEEK_DATA not supported, copying whole file: %s", e)
+            yield 0, size
+            return
+
+        end = min(end, size)
+        yield start, end - start
+        offset = end
+
+
+class _LocalDiskCopier(object):
+    """
+    Copy the content of src_fd to dst_fd for CloneStorageCreator.
+
+    Holes in the source are found with SEEK_DATA/SEEK_HOLE. For a sparse
+    clone they are skipped, otherwise they are written out as zeros so
+    the destination is fully allocated. Data extents are copied in the
+    kernel with copy_file_range if possible, falling back to a
+    pread/pwrite loop over a reused buffer, which also skips all-zero
+    blocks when sparse.
+    """
+
+    def __init__(self, src_fd, dst_fd, sparse, meter, size_bytes):
+        self._src_fd = src_fd
+        self._dst_fd = dst_fd
+        self._sparse = sparse
+        self._meter = meter
+        self._size_bytes = size_bytes
+
+        self._use_copy_range = hasattr(os, "copy_file_range")
+        self._buffer = None
+
+    def _update_meter(self, offset):
+        if offset < self._size_bytes:
+            self._meter.update(offset)
+
+    def _advise(self, offset, length, advice):
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(self._src_fd, offset, length, advice)
+            except OSError:  # pragma: no cover
+                pass
+
+    def _write_all(self, data, offset):
+        while data:
+            count = os.pwrite(self._dst_fd, data, offset)
+            data = data[count:]
+            offset += count
+
+    def _write_zeros(self, offset, length):
+        end = offset + length
+        while offset < end:
+            count = min(end - offset, len(_ZEROS))
+            self._write_all(_ZEROS[:count], offset)
+            offset += count
+            self._update_meter(offset)
+
+    def _copy_range(self, offset, length):
+        try:
+            return os.copy_file_range(self._src_fd, self._dst_fd, length, offset, offset)
+        except OSError as e:
+            if e.errno not in [errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL]:
+                raise  # pragma: no cover
+            log.debug("copy_file_range not usable, falling back to read/write: %s", e)
+            self._use_copy_range = False
+            return None
+
+    def _copy_buffered(self, offset, length):
+        if self._buffer is None:
+            self._buffer = memoryview(bytearray(_CLONE_BUFFER_SIZE))
+        view = self._buffer[:length]
+        count = os.preadv(self._src_fd, [view], offset)
+        data = view[:count]
+
+        if not self._sparse:
+            self._write_all(data, offset)
+        elif data != _ZEROS[:count]:
+            for blockstart in range(0, count, _SPARSE_BLOCK_SIZE):
+                block = data[blockstart : blockstart + _SPARSE_BLOCK_SIZE]
+                if block != _ZEROS[: len(block)]:
+                    self._write_all(block, offset + blockstart)
+
+        # Don't let a huge clone push everything else out of the page cache
+        self._advise(offset, count, getattr(os, "POSIX_FADV_DONTNEED", 4))
+        return count
+
+    def _copy_extent(self, offset, length):
+        end = offset + length
+        while offset < end:
+            count = None
+            if self._use_copy_range:
+                count = self._copy_range(offset, min(end - offset, _CLONE_RANGE_SIZE))
+            if count is None:
+                count = self._copy_buffered(offset, min(end - offset, _CLONE_BUFFER_SIZE))
+            if not count:
+                # Source shrunk underneath us
+                break  # pragma: no cover
+            offset += count
+            self._update_meter(offset)
+
+    def copy_all(self):
+        size = os.lseek(self._src_fd, 0, os.SEEK_END)
+        self._advise(0, 0, getattr(os, "POSIX_FADV_SEQUENTIAL", 2))
+
+        offset = 0
+        for start, length in _data_extents(self._src_fd, size):
+            if not self._sparse and start > offset:
+                self._write_zeros(offset, start - offset)
+            self._copy_extent(start, length)
+            offset = start + length
+
+        if not self._sparse and size > offset:
+            self._write_zeros(offset, size - offset)
+
+
 class StorageBackendStub(_StorageBase):
     """
     Class representing a storage path for a parsed XML disk, that we
@@ -5,8 +5,13 @@
 # See the COPYING file in the top-level directory.
 #
 
+import itertools
+import re
+
 import libvirt
 
+from .logger import log
+
 
 def check_libvirt_collision(collision_cb, val):
     """
@@ -24,7 +29,43 @@ def check_libvirt_collision(collision_cb, val):
     return check
 
 
-def generate_name(base, collision_cb, suffix="", start_num=1, sep="-", force_num=False):
+def list_existing(list_cb, key_cb):
+    """
+    Take a single bulk snapshot of existing object keys, for passing
+    to generate_name as 'existing'.
+
+    :param list_cb: Function returning a list of libvirt objects, like
+        conn.listAllDomains
+    :param key_cb: Function returning the key of a single object. It
+        should not need an RPC, like virDomain.name
+    :returns: A set of keys, or None if listing failed
+    """
+    try:
+        return set(key_cb(obj) for obj in list_cb())
+    except libvirt.libvirtError as e:  # pragma: no cover
+        log.debug("Listing existing objects failed: %s", e)
+        return None
+
+
+def _used_numbers(base, existing, suffix, sep):
+    """
+    Parse the numeric suffixes out of the 'existing' names that match
+    the base+sep+NUM+suffix pattern
+    """
+    regex = re.compile(
+        "^%s%s(0|[1-9][0-9]*)%s$" % (re.escape(base), re.escape(sep), re.escape(suffix))
+    )
+    ret = set()
+    for name in existing:
+        match = regex.match(name)
+        if match:
+            ret.add(int(match.group(1)))
+    return ret
+
+
+def generate_name(
+    base, collision_cb, suffix="", start_num=1, sep="-", force_num=False, existing=None
+):
     """
     Generate a new name from the passed base string, verifying it doesn't
     collide with the collision callback.
@@ -45,12 +86,20 @@ def generate_name(base, collision_cb, suffix="", start_num=1, sep="-", force_num
     :param sep: The separator to use between the basename and the
         generated number (default is "-")
     :param force_num: Force the generated name to always end with a number
+    :param existing: Optional set of names already in use, from
+        list_existing. Names in the set are skipped without calling
+        collision_cb, which then only confirms the final pick.
     """
     base = str(base)
 
-    numrange = list(range(start_num, start_num + 100000))
+    used = set()
+    if existing is not None:
+        used = _used_numbers(base, existing, suffix, sep)
+
+    numrange = (i for i in range(start_num, start_num + 100000) if i not in used)
     if not force_num:
-        numrange = [None] + numrange
+        if existing is None or (base + suffix) not in existing:
+            numrange = itertools.chain([None], numrange)
 
     ret = None
     for i in numrange:
@@ -122,7 +122,13 @@ class Guest(XMLBuilder):
         raise ValueError(_("Guest name '%s' is already in use.") % name)
 
     @staticmethod
-    def generate_uuid(conn):
+    def generate_uuid(conn, inuse=None):
+        """
+        :param inuse: Optional set of UUIDs known to be in use. If passed,
+            it's used for collision checking instead of asking libvirt,
+            and the returned UUID is added to it
+        """
+
         def _randomUUID():
             if conn.fake_conn_predictable():
                 # Testing hack
@@ -136,13 +142,23 @@ class Guest(XMLBuilder):
 
         for ignore in range(256):
             uuid = _randomUUID()
+            if inuse is not None:
+                if uuid in inuse and not conn.fake_conn_predictable():
+                    continue  # pragma: no cover
+                inuse.add(uuid)
+                return uuid
             if not generatename.check_libvirt_collision(conn.lookupByUUID, uuid):
                 return uuid
 
         log.error("Failed to generate non-conflicting UUID")  # pragma: no cover
 
     @staticmethod
-    def generate_name(guest):
+    def generate_name(guest, existing=None):
+        """
+        :param existing: Optional set of names known to be in use. If not
+            passed, the list of domains is fetched from libvirt
+        """
+
         def _pretty_arch(_a):
             if _a == "armv7l":
                 return "arm"
@@ -167,12 +183,15 @@ class Guest(XMLBuilder):
         def cb(n):
             return generatename.check_libvirt_collision(guest.conn.lookupByName, n)
 
+        if existing is None:
+            existing = generatename.list_existing(guest.conn.listAllDomains, lambda d: d.name())
         return generatename.generate_name(
             basename,
             cb,
             start_num=force_num and 1 or 2,
             force_num=force_num,
             sep=not force_num and "-" or "",
+            existing=existing,
         )
 
     @staticmethod
@@ -132,6 +132,9 @@ class Installer(object):
                 log.debug("Failed to remove disk '%s'", name, exc_info=True)
                 log.error("Failed to remove disk '%s': %s", name, e)
 
+        if clean_disks:
+            guest.conn.invalidate_fetch_cache(vols=True)
+
     ###################
     # Private helpers #
     ###################
@@ -461,6 +464,14 @@ class Installer(object):
             raise RuntimeError("Install method does not support initrd injections.")
         self._treemedia.set_initrd_injections(initrd_injections)
 
+    def set_treemedia_cache(self, shared_cache):
+        """
+        Share install tree detection and kernel/initrd fetching with
+        other installers using the same SharedTreeMediaCache
+        """
+        if self._treemedia:
+            self._treemedia.set_shared_cache(shared_cache)
+
     def set_extra_args(self, extra_args):
         if not self._treemedia:
             raise RuntimeError(
@@ -5,9 +5,13 @@
 # See the COPYING file in the top-level directory.
 
 import os
+import shutil
+import tempfile
+import threading
 
 from . import urldetect
 from . import urlfetcher
+from .mediacache import MediaCache
 from .installerinject import perform_initrd_injections
 from .. import progress
 from ..devices import DeviceDisk
@@ -36,6 +40,57 @@ class _LocationData(object):
             self.kernel_url_arg = osobj.get_kernel_url_arg()
 
 
+class SharedTreeMediaCache(object):
+    """
+    Install tree detection results and fetched kernel/initrd files that
+    can be shared between multiple InstallerTreeMedia installing from the
+    same location, so the media is only probed and downloaded once.
+
+    Values are built under a per key lock, so concurrent installs from
+    the same location wait for the first one to finish fetching rather
+    than all fetching in parallel. Call cleanup() once every install
+    using the cache is done, to remove the shared files.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._values = {}
+        self._tmpfiles = []
+
+    def get(self, key, buildcb):
+        with self._lock:
+            keylock = self._key_locks.setdefault(key, threading.Lock())
+        with keylock:
+            if key not in self._values:
+                self._values[key] = buildcb()
+            return self._values[key]
+
+    def get_file(self, key, fetchcb):
+        """
+        Like get(), but the value is a path to a fetched file that we
+        remove in cleanup()
+        """
+
+        def _fetch():
+            path = fetchcb()
+            with self._lock:
+                self._tmpfiles.append(path)
+            return path
+
+        return self.get(key, _fetch)
+
+    def cleanup(self):
+        with self._lock:
+            tmpfiles = self._tmpfiles
+            self._tmpfiles = []
+            self._values = {}
+        for f in tmpfiles:
+            log.debug("Removing shared %s", f)
+            if os.path.exists(f):
+                os.unlink(f)
+
+
 class InstallerTreeMedia(object):
     """
     Class representing --location Tree media. Can be one of
@@ -129,6 +184,7 @@ class InstallerTreeMedia(object):
 
         self._cached_fetcher = None
         self._cached_data = None
+        self._shared_cache = None
 
         self._tmpfiles = []
 
@@ -172,14 +228,36 @@ class InstallerTreeMedia(object):
                 self._cached_fetcher = urlfetcher.DirectFetcher(None, scratchdir, meter)
             else:
                 self._cached_fetcher = urlfetcher.fetcherForURI(self.location, scratchdir, meter)
+            self._cached_fetcher.set_media_cache(MediaCache.get_default())
 
         self._cached_fetcher.meter = meter
         return self._cached_fetcher
 
+    def _shared_key(self, guest, *args):
+        return (
+            self._media_type,
+            self.location,
+            self._location_kernel,
+            self._location_initrd,
+            self._install_kernel,
+            self._install_initrd,
+            guest.os.arch,
+            guest.osinfo.name,
+        ) + args
+
     def _get_cached_data(self, guest, fetcher):
         if self._cached_data:
             return self._cached_data
 
+        if self._shared_cache:
+            self._cached_data = self._shared_cache.get(
+                self._shared_key(guest, "data"), lambda: self._build_location_data(guest, fetcher)
+            )
+        else:
+            self._cached_data = self._build_location_data(guest, fetcher)
+        return self._cached_data
+
+    def _build_location_data(self, guest, fetcher):
         store = None
         osinfo = None
         os_media = None
@@ -200,22 +278,41 @@ class InstallerTreeMedia(object):
         if has_location_kernel:
             kernel_paths = [(self._location_kernel, self._location_initrd)]
 
-        self._cached_data = _LocationData(osinfo, kernel_paths, os_media, os_tree)
-        return self._cached_data
+        return _LocationData(osinfo, kernel_paths, os_media, os_tree)
+
+    def _acquire_file(self, guest, fetcher, path):
+        if not self._shared_cache:
+            return fetcher.acquireFile(path)
+
+        # Fetch the shared pristine copy once, and hand each install its
+        # own local copy, since the initrd is altered by injections
+        shared = self._shared_cache.get_file(
+            self._shared_key(guest, "file", path), lambda: fetcher.acquireFile(path)
+        )
+        fd, ret = tempfile.mkstemp(
+            prefix="virtinst-", suffix="-" + os.path.basename(path), dir=fetcher.scratchdir
+        )
+        os.close(fd)
+        shutil.copyfile(shared, ret)
+        log.debug("Copied shared %s to %s", shared, ret)
+        return ret
 
     def _prepare_kernel_url(self, guest, cache, fetcher):
-        ignore = guest
-
         def _check_kernel_pairs():
             for kpath, ipath in cache.kernel_pairs:
                 if fetcher.hasFile(kpath) and fetcher.hasFile(ipath):
                     return kpath, ipath
             raise RuntimeError(_("Couldn't find kernel for install tree."))  # pragma: no cover
 
-        kernelpath, initrdpath = _check_kernel_pairs()
-        kernel = fetcher.acquireFile(kernelpath)
+        if self._shared_cache:
+            kernelpath, initrdpath = self._shared_cache.get(
+                self._shared_key(guest, "kernelpair"), _check_kernel_pairs
+            )
+        else:
+            kernelpath, initrdpath = _check_kernel_pairs()
+        kernel = self._acquire_file(guest, fetcher, kernelpath)
         self._tmpfiles.append(kernel)
-        initrd = fetcher.acquireFile(initrdpath)
+        initrd = self._acquire_file(guest, fetcher, initrdpath)
         self._tmpfiles.append(initrd)
 
         perform_initrd_injections(initrd, self._initrd_injections, fetcher.scratchdir)
@@ -295,6 +392,9 @@ class InstallerTreeMedia(object):
     def set_initrd_injections(self, initrd_injections):
         self._initrd_injections = initrd_injections
 
+    def set_shared_cache(self, shared_cache):
+        self._shared_cache = shared_cache
+
     def set_extra_args(self, extra_args):
         self._extra_args = extra_args
 
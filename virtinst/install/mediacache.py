@@ -0,0 +1,257 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# This work is licensed under the GNU GPLv2 or later.
+# See the COPYING file in the top-level directory.
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from ..connection import VirtinstConnection
+from ..logger import log
+
+
+_ENABLE_ENV = "VIRTINST_MEDIA_CACHE"
+_SIZE_ENV = "VIRTINST_MEDIA_CACHE_SIZE"
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fileobj:
+        while True:
+            buff = fileobj.read(1024 * 1024)
+            if not buff:
+                break
+            hasher.update(buff)
+    return hasher.hexdigest()
+
+
+class MediaCache(object):
+    """
+    Persistent, size bounded cache of install media files fetched from
+    the network, like kernels, initrds and .treeinfo files.
+
+    Files are stored once by the sha256 of their content. A URL maps to
+    a stored file along with the ETag/Last-Modified the server sent for
+    it, so a lookup by URL only hits if the server still reports the
+    same validator. A lookup by a known sha256 checksum, like from the
+    .treeinfo [checksums] section, needs no server round trip at all.
+    When the total size exceeds the limit, the least recently used
+    files are evicted.
+
+    The index is shared between processes and guarded by a lock file,
+    so concurrent virt-install runs can use the same cache.
+
+    Enable with VIRTINST_MEDIA_CACHE=1 in the environment. The size
+    limit in MiB can be set with VIRTINST_MEDIA_CACHE_SIZE.
+    """
+
+    DEFAULT_MAX_SIZE = 4096 * 1024 * 1024
+    _default = None
+    _default_lock = threading.Lock()
+
+    @classmethod
+    def get_default(cls):
+        """
+        Return the process wide cache in the app cache dir, or None if
+        it isn't enabled
+        """
+        if not os.environ.get(_ENABLE_ENV):
+            return None
+        with cls._default_lock:
+            if not cls._default:
+                max_size = cls.DEFAULT_MAX_SIZE
+                try:
+                    if os.environ.get(_SIZE_ENV):
+                        max_size = int(os.environ[_SIZE_ENV]) * 1024 * 1024
+                except ValueError:
+                    log.debug("Invalid %s=%s", _SIZE_ENV, os.environ[_SIZE_ENV])
+                cachedir = os.path.join(VirtinstConnection.get_app_cache_dir(), "media")
+                cls._default = MediaCache(cachedir, max_size)
+            return cls._default
+
+    def __init__(self, cachedir, max_size):
+        self._dir = cachedir
+        self._objdir = os.path.join(cachedir, "objects")
+        self._indexpath = os.path.join(cachedir, "index.json")
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._memo = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    ####################
+    # Internal helpers #
+    ####################
+
+    @contextlib.contextmanager
+    def _locked_index(self):
+        """
+        Yield the index dict while holding both the thread and the
+        cross process lock. Changes to the dict are written back.
+        """
+        with self._lock:
+            os.makedirs(self._objdir, exist_ok=True)
+            with open(os.path.join(self._dir, "index.lock"), "w") as lockfile:
+                fcntl.flock(lockfile, fcntl.LOCK_EX)
+                index = self._read_index()
+                orig = json.dumps(index, sort_keys=True)
+                yield index
+                if json.dumps(index, sort_keys=True) != orig:
+                    self._write_index(index)
+
+    def _read_index(self):
+        try:
+            with open(self._indexpath) as fileobj:
+                index = json.load(fileobj)
+            if isinstance(index.get("urls"), dict) and isinstance(index.get("objects"), dict):
+                return index
+        except (OSError, ValueError):
+            pass
+        return {"urls": {}, "objects": {}}
+
+    def _write_index(self, index):
+        with open(self._indexpath + ".tmp", "w") as fileobj:
+            json.dump(index, fileobj)
+        os.replace(self._indexpath + ".tmp", self._indexpath)
+
+    def _object_path(self, digest):
+        return os.path.join(self._objdir, digest)
+
+    def _find_object(self, index, digest):
+        obj = index["objects"].get(digest)
+        if not obj:
+            return None
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            index["objects"].pop(digest)
+            return None
+        obj["atime"] = time.time()
+        return path, obj["size"]
+
+    def _evict(self, index, keep):
+        total = sum(obj["size"] for obj in index["objects"].values())
+        lru = sorted(index["objects"].items(), key=lambda item: item[1]["atime"])
+        for digest, obj in lru:
+            if total <= self._max_size:
+                break
+            if digest == keep and obj["size"] <= self._max_size:
+                continue
+            log.debug("Evicting %s from media cache", digest)
+            index["objects"].pop(digest)
+            total -= obj["size"]
+            with contextlib.suppress(OSError):
+                os.unlink(self._object_path(digest))
+
+        for url, entry in list(index["urls"].items()):
+            if entry["digest"] not in index["objects"]:
+                index["urls"].pop(url)
+
+    ##############
+    # Public API #
+    ##############
+
+    def lookup(self, url, validator=None, checksum=None):
+        """
+        Return the cached content for url as a binary file object opened
+        for reading, or None on a miss. The caller must close it. The file
+        is opened while the index is locked, so it stays readable even if
+        another process evicts it right after.
+
+        :param validator: ETag/Last-Modified the server reports now
+        :param checksum: Known "<algo>:<hexdigest>" of the content
+        """
+        fileobj = None
+        with self._locked_index() as index:
+            ret = None
+            if checksum and checksum.startswith("sha256:"):
+                ret = self._find_object(index, checksum[len("sha256:") :].strip().lower())
+            entry = index["urls"].get(url)
+            if not ret and entry and validator and entry["validator"] == validator:
+                ret = self._find_object(index, entry["digest"])
+            if ret:
+                try:
+                    fileobj = open(ret[0], "rb")
+                except OSError as e:  # pragma: no cover
+                    log.debug("Error opening cached %s: %s", ret[0], e)
+
+        if not fileobj:
+            self.misses += 1
+            return None
+        log.debug("Media cache hit for %s", url)
+        self.hits += 1
+        self.bytes_saved += ret[1]
+        return fileobj
+
+    def add(self, url, validator, path):
+        """
+        Store a copy of the fetched file at path as the content of url
+        """
+        digest = _hash_file(path)
+        objpath = self._object_path(digest)
+        size = os.path.getsize(path)
+        if size > self._max_size:
+            return
+
+        with self._locked_index() as index:
+            if not os.path.exists(objpath):
+                shutil.copyfile(path, objpath + ".tmp")
+                os.replace(objpath + ".tmp", objpath)
+            index["objects"][digest] = {"size": size, "atime": time.time()}
+            if validator:
+                index["urls"][url] = {"validator": validator, "digest": digest}
+            self._evict(index, digest)
+        log.debug("Added %s to media cache as %s", url, digest)
+
+    def add_data(self, url, validator, data):
+        """
+        Like add(), but for content already in memory
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        objpath = self._object_path(digest)
+        if len(data) > self._max_size:
+            return
+
+        with self._locked_index() as index:
+            if not os.path.exists(objpath):
+                with open(objpath + ".tmp", "wb") as fileobj:
+                    fileobj.write(data)
+                os.replace(objpath + ".tmp", objpath)
+            index["objects"][digest] = {"size": len(data), "atime": time.time()}
+            if validator:
+                index["urls"][url] = {"validator": validator, "digest": digest}
+            self._evict(index, digest)
+        log.debug("Added %s to media cache as %s", url, digest)
+
+    def memoize(self, kind, content, parsecb):
+        """
+        Return parsecb(content), reusing the result from an earlier call
+        with identical content. For parsed .treeinfo and similar files.
+        """
+        key = (kind, hashlib.sha256(content.encode("utf-8")).hexdigest())
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        ret = parsecb(content)
+        with self._lock:
+            self._memo[key] = ret
+        return ret
+
+    def get_stats(self):
+        with self._locked_index() as index:
+            entries = len(index["objects"])
+            size = sum(obj["size"] for obj in index["objects"].values())
+        return {
+            "entries": entries,
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -47,6 +47,16 @@ class _DistroCache(object):
             self._filecache[path] = content
         return self._filecache[path]
 
+    def memoize(self, kind, content, parsecb):
+        """
+        Parse content with parsecb, reusing an earlier result for the
+        same content if the fetcher has a media cache
+        """
+        mediacache = self._fetcher.get_media_cache()
+        if not mediacache:
+            return parsecb(content)
+        return mediacache.memoize(kind, content, parsecb)
+
     @property
     def treeinfo(self):
         if self._treeinfo:
@@ -69,12 +79,19 @@ class _DistroCache(object):
         # If the file doesn't parse or there's no 'family', this will
         # error, but that should be fine because we aren't going to
         # successfully detect the tree anyways
-        treeinfo = configparser.ConfigParser()
-        treeinfo.read_string(treeinfostr)
+        def _parse_treeinfo(content):
+            ret = configparser.ConfigParser()
+            ret.read_string(content)
+            return ret
+
+        treeinfo = self.memoize("treeinfo", treeinfostr, _parse_treeinfo)
         self.treeinfo_family = treeinfo.get("general", "family")
         self._treeinfo = treeinfo
         log.debug("treeinfo family=%s", self.treeinfo_family)
 
+        if treeinfo.has_section("checksums"):
+            self._fetcher.set_checksums(dict(treeinfo.items("checksums")))
+
         if self._treeinfo.has_option("general", "version"):
             self.treeinfo_version = self._treeinfo.get("general", "version")
             log.debug("Found treeinfo version=%s", self.treeinfo_version)
@@ -504,7 +521,7 @@ class _SuseDistro(_RHELDistro):
                 return False
 
             try:
-                cache.suse_content = _SUSEContent(content_str)
+                cache.suse_content = cache.memoize("suse-content", content_str, _SUSEContent)
             except Exception as e:  # pragma: no cover
                 log.debug("Error parsing SUSE content file: %s", str(e))
                 return False
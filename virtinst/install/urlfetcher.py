@@ -6,11 +6,18 @@
 #
 # Backends for the various URL types we support (http, https, ftp, local)
 
+import concurrent.futures
+import contextlib
+import fcntl
 import ftplib
+import hashlib
 import io
 import os
+import re
+import shutil
 import subprocess
 import tempfile
+import threading
 import urllib
 
 import requests
@@ -18,6 +25,79 @@ import requests
 from ..logger import log
 
 
+# Bounds for the adaptive read size used when streaming files
+_MIN_BLOCK_SIZE = 64 * 1024
+_MAX_BLOCK_SIZE = 4 * 1024 * 1024
+_DEFAULT_BLOCK_SIZE = 256 * 1024
+
+# Transient network errors that a resumable HTTP download retries
+_RETRYABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+
+def _pick_block_size(size):
+    """
+    Pick a read size for a download of 'size' bytes: roughly 1/64th of
+    the file, clamped so small files don't over allocate and large
+    files don't spend their time in tiny reads.
+    """
+    if not size:
+        return _DEFAULT_BLOCK_SIZE
+    return max(_MIN_BLOCK_SIZE, min(_MAX_BLOCK_SIZE, size // 64))
+
+
+def _get_segment_count():
+    """
+    Number of parallel ranged segments to use for large HTTP downloads,
+    from VIRTINST_URLFETCH_SEGMENTS. Defaults to 1, meaning disabled.
+    """
+    try:
+        return max(1, int(os.environ.get("VIRTINST_URLFETCH_SEGMENTS", "1")))
+    except ValueError:
+        return 1
+
+
+def _parse_sha256sums(content):
+    """
+    Parse a SHA256SUMS style file, in either coreutils or BSD format,
+    into a {filename: "sha256:<hexdigest>"} dict
+    """
+    ret = {}
+    for line in content.splitlines():
+        line = line.strip()
+        match = re.match(r"^SHA256 \((.+)\) = ([0-9a-fA-F]{64})$", line)
+        if match:
+            ret[match.group(1)] = "sha256:" + match.group(2).lower()
+            continue
+        match = re.match(r"^([0-9a-fA-F]{64}) [ *](.+)$", line)
+        if match:
+            ret[match.group(2)] = "sha256:" + match.group(1).lower()
+    return ret
+
+
+def _get_response_validator(response):
+    # Weak ETags can't be used with If-Range, and don't promise
+    # byte identical content
+    validator = response.headers.get("etag")
+    if not validator or validator.startswith("W/"):
+        validator = response.headers.get("last-modified")
+    return validator or None
+
+
+def _checksum_file(path, algo):
+    hasher = hashlib.new(algo)
+    with open(path, "rb") as fileobj:
+        while True:
+            buff = fileobj.read(_MAX_BLOCK_SIZE)
+            if not buff:
+                break
+            hasher.update(buff)
+    return hasher.hexdigest()
+
+
 #########################
 # isoreader abstraction #
 #########################
@@ -61,13 +141,17 @@ class _URLFetcher(object):
     a media source, such as CD ISO, or HTTP/HTTPS/FTP server
     """
 
-    _block_size = 16384
     _is_iso = False
+    _verify_checksums = False
+    _cacheable = False
 
     def __init__(self, location, scratchdir, meter):
         self.location = location
         self.scratchdir = scratchdir
         self.meter = meter
+        self._checksums = {}
+        self._sumfiles = {}
+        self._media_cache = None
 
         log.debug("Using scratchdir=%s", scratchdir)
         self._prepare()
@@ -105,16 +189,17 @@ class _URLFetcher(object):
         msg = _("Retrieving '%(filename)s'") % {"filename": os.path.basename(filename)}
         self.meter.start(msg, size)
 
-        self._write(urlobj, fileobj)
+        self._write(urlobj, fileobj, _pick_block_size(size))
         self.meter.end()
 
-    def _write(self, urlobj, fileobj):
+    def _write(self, urlobj, fileobj, block_size, total=0):
         """
-        Write the contents of urlobj to python file like object fileobj
+        Write the contents of urlobj to python file like object fileobj.
+        'total' is the number of bytes already on disk, for progress
+        reporting
         """
-        total = 0
         while 1:
-            buff = urlobj.read(self._block_size)
+            buff = urlobj.read(block_size)
             if not buff:
                 break
             fileobj.write(buff)
@@ -130,10 +215,131 @@ class _URLFetcher(object):
         """
         raise NotImplementedError("must be implemented in subclass")
 
+    def _make_tempfile(self, filename):
+        return tempfile.NamedTemporaryFile(
+            prefix="virtinst-",
+            suffix="-" + os.path.basename(filename),
+            dir=self.scratchdir,
+            delete=False,
+        )
+
+    def _acquireToFile(self, filename, fullurl):
+        """
+        Download filename to a new file in the scratchdir, returning
+        the new filename
+        """
+        fileobj = self._make_tempfile(filename)
+        try:
+            self._grabURL(filename, fileobj, fullurl=fullurl)
+        except BaseException:  # pragma: no cover
+            os.unlink(fileobj.name)
+            raise
+        return fileobj.name
+
+    def _lookup_sumfile(self, url):
+        """
+        Look for a SHA256SUMS file next to url, and return the checksum
+        it lists for url, if any. Results are cached per directory.
+        """
+        dirurl, basename = url.rsplit("/", 1)
+        if dirurl not in self._sumfiles:
+            sums = {}
+            sumsurl = dirurl + "/SHA256SUMS"
+            try:
+                fileobj = io.BytesIO()
+                self._grabURL("SHA256SUMS", fileobj, fullurl=sumsurl)
+                sums = _parse_sha256sums(fileobj.getvalue().decode("utf-8"))
+            except Exception as e:
+                log.debug("No usable checksum file at %s: %s", sumsurl, str(e))
+            self._sumfiles[dirurl] = sums
+        return self._sumfiles[dirurl].get(basename)
+
+    def _find_checksum(self, filename, url):
+        key = (filename or "").lstrip("/")
+        checksum = self._checksums.get(key) or self._checksums.get(key.lower())
+        if checksum:
+            return checksum
+        return self._lookup_sumfile(url)
+
+    def _verify_file(self, filename, url, path):
+        """
+        Check the downloaded file at 'path' against any known checksum,
+        raising ValueError on mismatch
+        """
+        checksum = self._find_checksum(filename, url)
+        if not checksum or ":" not in checksum:
+            log.debug("No checksum known for %s, skipping verification", url)
+            return
+
+        algo, expected = checksum.split(":", 1)
+        if algo not in hashlib.algorithms_available:
+            log.debug("Unsupported checksum type '%s' for %s", algo, url)
+            return
+
+        actual = _checksum_file(path, algo)
+        if actual != expected.strip().lower():
+            msg = _("Checksum mismatch for %(url)s: expected %(expected)s, got %(actual)s") % {
+                "url": url,
+                "expected": checksum,
+                "actual": "%s:%s" % (algo, actual),
+            }
+            raise ValueError(msg)
+        log.debug("Verified %s checksum of %s", algo, url)
+
+    def _get_validator(self, url):
+        """
+        Return a string identifying the current version of url on the
+        server, like an ETag, or None if there isn't one
+        """
+        dummy = url
+        return None
+
+    def _lookupMediaCache(self, filename, url):
+        """
+        Return (open cached file or None, validator) for url
+        """
+        checksum = None
+        if self._verify_checksums:
+            checksum = self._find_checksum(filename, url)
+        validator = None
+        if not checksum:
+            validator = self._get_validator(url)
+        try:
+            return self._media_cache.lookup(url, validator, checksum), validator
+        except OSError as e:
+            log.debug("Error reading media cache: %s", str(e))
+            return None, validator
+
+    def _addToMediaCache(self, url, validator, path=None, data=None):
+        try:
+            if path:
+                self._media_cache.add(url, validator, path)
+            else:
+                self._media_cache.add_data(url, validator, data)
+        except OSError as e:
+            log.debug("Error adding %s to media cache: %s", url, str(e))
+
     ##############
     # Public API #
     ##############
 
+    def set_media_cache(self, cache):
+        """
+        Use the passed mediacache.MediaCache for network downloads
+        """
+        self._media_cache = cache
+
+    def get_media_cache(self):
+        return self._media_cache
+
+    def set_checksums(self, checksums):
+        """
+        Register known checksums for files in the tree, as a dict of
+        {relative path: "<algo>:<hexdigest>"}, like the .treeinfo
+        [checksums] section. Only used by fetchers that verify downloads.
+        """
+        self._checksums = dict(checksums)
+
     def is_iso(self):
         """
         If this is a fetcher for local CDROM/ISO
@@ -176,17 +382,25 @@ class _URLFetcher(object):
         Grab the passed filename from self.location and save it to
         a temporary file, returning the temp filename
         """
+        url = fullurl or self._make_full_url(filename)
+        use_cache = bool(self._media_cache and self._cacheable)
         fn = None
         try:
-            fileobj = tempfile.NamedTemporaryFile(
-                prefix="virtinst-",
-                suffix="-" + os.path.basename(filename),
-                dir=self.scratchdir,
-                delete=False,
-            )
-            fn = fileobj.name
-
-            self._grabURL(filename, fileobj, fullurl=fullurl)
+            validator = None
+            if use_cache:
+                cached, validator = self._lookupMediaCache(filename, url)
+                if cached:
+                    with cached, self._make_tempfile(filename) as fileobj:
+                        fn = fileobj.name
+                        shutil.copyfileobj(cached, fileobj)
+                    log.debug("Copied cached %s to %s", url, fn)
+                    return fn
+
+            fn = self._acquireToFile(filename, fullurl)
+            if self._verify_checksums:
+                self._verify_file(filename, url, fn)
+            if use_cache:
+                self._addToMediaCache(url, validator, path=fn)
             log.debug("Saved file to %s", fn)
             return fn
         except BaseException:  # pragma: no cover
@@ -198,13 +412,37 @@ class _URLFetcher(object):
         """
         Grab the passed filename from self.location and return it as a string
         """
+        url = self._make_full_url(filename)
+        use_cache = bool(self._media_cache and self._cacheable)
+        validator = None
+        if use_cache:
+            cached, validator = self._lookupMediaCache(filename, url)
+            if cached:
+                with cached:
+                    return cached.read().decode("utf-8")
+
         fileobj = io.BytesIO()
         self._grabURL(filename, fileobj)
+        if use_cache:
+            self._addToMediaCache(url, validator, data=fileobj.getvalue())
         return fileobj.getvalue().decode("utf-8")
 
 
 class _HTTPURLFetcher(_URLFetcher):
+    """
+    Downloads via acquireFile go to a '.part' file in the scratchdir
+    named after the URL. If the transfer is interrupted, the next attempt
+    (in this process or a later one) resumes it with a Range request,
+    provided the server gave us an ETag or Last-Modified to validate the
+    partial content with. A concurrent download of the same URL uses a
+    private file instead.
+    """
+
     _session = None
+    _verify_checksums = True
+    _cacheable = True
+    _retries = 3
+    _segment_min_size = 32 * 1024 * 1024
 
     def _prepare(self):
         self._session = requests.Session()
@@ -232,6 +470,15 @@ class _HTTPURLFetcher(_URLFetcher):
             return False
         return True
 
+    def _get_validator(self, url):
+        try:
+            response = self._session.head(url, allow_redirects=True)
+            response.raise_for_status()
+        except Exception as e:
+            log.debug("HTTP HEAD request for %s failed: %s", url, str(e))
+            return None
+        return _get_response_validator(response)
+
     def _grabber(self, url):
         """
         Use requests for this
@@ -244,22 +491,233 @@ class _HTTPURLFetcher(_URLFetcher):
             size = None
         return response, size
 
-    def _write(self, urlobj, fileobj):
+    def _write(self, urlobj, fileobj, block_size, total=0):
         """
         The requests object doesn't have a file-like read() option, so
         we need to implement it ourselves
         """
-        total = 0
-        for data in urlobj.iter_content(chunk_size=self._block_size):
+        for data in urlobj.iter_content(chunk_size=block_size):
             fileobj.write(data)
             total += len(data)
             self.meter.update(total)
         fileobj.flush()
         return total
 
+    ######################
+    # Resumable download #
+    ######################
+
+    def _get_partial_path(self, url, filename):
+        urlhash = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(
+            self.scratchdir, "virtinst-%s-%s.part" % (urlhash, os.path.basename(filename))
+        )
+
+    @contextlib.contextmanager
+    def _locked_partial(self, partfn):
+        """
+        Hold an exclusive lock for partfn while downloading to it, so
+        concurrent runs fetching the same URL never share the file.
+        Yields the path to download to: partfn itself, or a private
+        file if another download already holds the lock.
+        """
+        lockfn = partfn + ".lock"
+        fd = os.open(lockfn, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # The holder unlinks the lock file when done, so make
+                # sure we didn't lock a file that was already removed
+                locked = os.path.samestat(os.fstat(fd), os.stat(lockfn))
+            except OSError:
+                locked = False
+
+            if locked:
+                try:
+                    yield partfn
+                finally:
+                    os.unlink(lockfn)
+                return
+
+            log.debug("%s is in use by another download, not resuming", partfn)
+            privfd, privfn = tempfile.mkstemp(
+                prefix="virtinst-", suffix=".part", dir=self.scratchdir
+            )
+            os.close(privfd)
+            try:
+                yield privfn
+            finally:
+                self._discard_partial(privfn)
+        finally:
+            os.close(fd)
+
+    def _read_partial(self, partfn):
+        """
+        Return (offset, validator) for a previous partial download,
+        or (0, None) if there is nothing we can resume
+        """
+        try:
+            offset = os.path.getsize(partfn)
+            with open(partfn + ".meta") as fileobj:
+                validator = fileobj.read().strip()
+        except OSError:
+            return 0, None
+        if not offset or not validator:
+            return 0, None
+        return offset, validator
+
+    def _write_partial_meta(self, partfn, response):
+        validator = _get_response_validator(response)
+        if validator:
+            with open(partfn + ".meta", "w") as fileobj:
+                fileobj.write(validator)
+        elif os.path.exists(partfn + ".meta"):
+            os.unlink(partfn + ".meta")
+
+    def _discard_partial(self, partfn):
+        for path in [partfn, partfn + ".meta"]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _request(self, url, headers):
+        """
+        Start a GET for url. Transient network errors are passed up for
+        _acquireToFile to retry, anything else, like an HTTP error
+        status, is a ValueError.
+        """
+        try:
+            response = self._session.get(url, stream=True, headers=headers)
+            if getattr(response, "status_code", 200) == 416:
+                return response
+            response.raise_for_status()
+        except _RETRYABLE_ERRORS:
+            raise
+        except Exception as e:
+            msg = _("Couldn't acquire file %(url)s: %(error)s") % {"url": url, "error": str(e)}
+            raise ValueError(msg) from None
+        return response
+
+    def _download(self, url, filename, partfn):
+        offset, validator = self._read_partial(partfn)
+        headers = {}
+        if offset:
+            headers = {"Range": "bytes=%d-" % offset, "If-Range": validator}
+
+        response = self._request(url, headers)
+        if getattr(response, "status_code", 200) == 416:
+            # Our partial file doesn't fit the remote file anymore
+            log.debug("Server rejected resume of %s, restarting", url)
+            self._discard_partial(partfn)
+            offset = 0
+            response = self._request(url, {})
+        if getattr(response, "status_code", 200) != 206:
+            offset = 0
+
+        try:
+            size = int(response.headers.get("content-length")) + offset
+        except Exception:  # pragma: no cover
+            size = None
+
+        if offset:
+            log.debug("Resuming URI: %s at offset=%s", url, offset)
+        else:
+            log.debug("Fetching URI: %s", url)
+        msg = _("Retrieving '%(filename)s'") % {"filename": os.path.basename(filename)}
+        self.meter.start(msg, size)
+
+        block_size = _pick_block_size(size)
+        segments = _get_segment_count()
+        if (
+            not offset
+            and segments > 1
+            and size
+            and size >= self._segment_min_size
+            and response.headers.get("accept-ranges") == "bytes"
+        ):
+            response.close()
+            self._write_segments(url, partfn, size, block_size, segments)
+        else:
+            self._write_partial_meta(partfn, response)
+            with open(partfn, offset and "ab" or "wb") as fileobj:
+                self._write(response, fileobj, block_size, total=offset)
+        self.meter.end()
+
+    def _write_segments(self, url, partfn, size, block_size, count):
+        """
+        Fetch url as 'count' ranged requests in parallel, each on its own
+        session, writing into place in partfn. Segmented downloads are
+        not resumable, so any failure discards the partial file.
+        """
+        log.debug("Fetching %s in %d parallel segments", url, count)
+        self._discard_partial(partfn)
+        bounds = [(i * size // count, (i + 1) * size // count - 1) for i in range(count)]
+        lock = threading.Lock()
+        progress = [0]
+
+        fd = os.open(partfn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        def _fetch_segment(start, end):
+            session = requests.Session()
+            try:
+                headers = {"Range": "bytes=%d-%d" % (start, end)}
+                response = session.get(url, stream=True, headers=headers)
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise RuntimeError("Server ignored range request")
+                pos = start
+                for data in response.iter_content(chunk_size=block_size):
+                    os.pwrite(fd, data, pos)
+                    pos += len(data)
+                    with lock:
+                        progress[0] += len(data)
+                        self.meter.update(progress[0])
+                if pos != end + 1:
+                    raise RuntimeError("Short read for range %d-%d" % (start, end))
+            finally:
+                session.close()
+
+        try:
+            os.ftruncate(fd, size)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=count) as executor:
+                futures = [executor.submit(_fetch_segment, s, e) for (s, e) in bounds]
+                for future in futures:
+                    future.result()
+        except Exception as e:
+            self._discard_partial(partfn)
+            msg = _("Couldn't acquire file %(url)s: %(error)s") % {"url": url, "error": str(e)}
+            raise ValueError(msg) from None
+        finally:
+            os.close(fd)
+
+    def _acquireToFile(self, filename, fullurl):
+        url = fullurl or self._make_full_url(filename)
+        partfn = self._get_partial_path(url, filename)
+
+        with self._locked_partial(partfn) as partfn:
+            for attempt in range(1, self._retries + 1):
+                try:
+                    self._download(url, filename, partfn)
+                    break
+                except _RETRYABLE_ERRORS as e:
+                    if attempt == self._retries:
+                        msg = _("Couldn't acquire file %(url)s: %(error)s") % {
+                            "url": url,
+                            "error": str(e),
+                        }
+                        raise ValueError(msg) from None
+                    log.debug("Download of %s interrupted (%s), retrying", url, str(e))
+
+            fileobj = self._make_tempfile(filename)
+            fileobj.close()
+            os.replace(partfn, fileobj.name)
+            self._discard_partial(partfn)
+        return fileobj.name
+
 
 class _FTPURLFetcher(_URLFetcher):
     _ftp = None
+    _verify_checksums = True
+    _cacheable = True
 
     def _prepare(self):
         if self._ftp:
@@ -281,6 +739,16 @@ class _FTPURLFetcher(_URLFetcher):
             }
             raise ValueError(msg) from None
 
+    def _get_validator(self, url):
+        path = urllib.parse.urlparse(url)[2]
+        try:
+            size = self._ftp.size(path)
+            mtime = self._ftp.sendcmd("MDTM " + path)
+        except Exception as e:
+            log.debug("FTP validator lookup for %s failed: %s", url, str(e))
+            return None
+        return "%s:%s" % (mtime.split()[-1], size)
+
     def _grabber(self, url):
         """
         Use urllib and ftplib to grab the file
@@ -366,6 +834,7 @@ class DirectFetcher(_URLFetcher):
             fullurl = filename
         filename = os.path.basename(filename)
         fetcher = fetcherForURI(fullurl, self.scratchdir, self.meter, direct=True)
+        fetcher.set_media_cache(self._media_cache)
         return fetcher.acquireFile(filename, fullurl)  # pylint: disable=protected-access
 
     def _hasFile(self, url):
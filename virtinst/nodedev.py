@@ -10,16 +10,17 @@ import uuid
 from .xmlbuilder import XMLBuilder, XMLProperty, XMLChildProperty
 
 
-def _compare_int(nodedev_val, hostdev_val):
-    def _intify(val):
-        try:
-            if "0x" in str(val):
-                return int(val or "0x00", 16)
-            else:
-                return int(val)
-        except Exception:
-            return -1
+def _intify(val):
+    try:
+        if "0x" in str(val):
+            return int(val or "0x00", 16)
+        else:
+            return int(val)
+    except Exception:
+        return -1
 
+
+def _compare_int(nodedev_val, hostdev_val):
     nodedev_val = _intify(nodedev_val)
     hostdev_val = _intify(hostdev_val)
     return nodedev_val == hostdev_val or hostdev_val == -1
@@ -35,6 +36,74 @@ def _compare_uuid(nodedev_val, hostdev_val):
     return nodedev_val == hostdev_val
 
 
+def _normalize_uuid(val):
+    try:
+        return str(uuid.UUID(val))
+    except Exception:
+        return None
+
+
+def _hostdev_key(hostdev):
+    """
+    Normalized (type, fields) key for a domain <hostdev>, matching the
+    fields compare_to_hostdev checks. Unset int fields are -1, which
+    compare_to_hostdev treats as matching anything.
+    """
+    if hostdev.type == "pci":
+        fields = (hostdev.domain, hostdev.bus, hostdev.slot, hostdev.function)
+        return ("pci", tuple(_intify(f) for f in fields))
+    if hostdev.type == "usb":
+        fields = (hostdev.vendor, hostdev.product, hostdev.bus, hostdev.device)
+        return ("usb", tuple(_intify(f) for f in fields))
+    if hostdev.type == "mdev":
+        return ("mdev", _normalize_uuid(hostdev.uuid))
+    return None
+
+
+def _nodedev_hostdev_keys(nodedev):
+    """
+    Every _hostdev_key value that compare_to_hostdev would match against
+    nodedev, covering the wildcard combinations
+    """
+    if nodedev.device_type == "pci":
+        fields = (nodedev.domain, nodedev.bus, nodedev.slot, nodedev.function)
+        hosttype = "pci"
+    elif nodedev.device_type == "usb_device":
+        fields = (nodedev.vendor_id, nodedev.product_id, nodedev.bus, nodedev.device)
+        hosttype = "usb"
+    elif nodedev.device_type == "mdev":
+        return [("mdev", _normalize_uuid(nodedev.get_mdev_uuid()))]
+    else:
+        return []
+
+    keys = [()]
+    for field in fields:
+        val = _intify(field)
+        keys = [key + (choice,) for key in keys for choice in sorted({val, -1})]
+    return [(hosttype, key) for key in keys]
+
+
+class _HostdevIndex(object):
+    """
+    Index of normalized host device keys to the VMs with a matching
+    <hostdev>, built in a single pass over every VM
+    """
+
+    def __init__(self, vms):
+        self._users = {}
+        for vmidx, vm in enumerate(vms):
+            for hostdev in vm.devices.hostdev:
+                key = _hostdev_key(hostdev)
+                if key and key[1] is not None:
+                    self._users.setdefault(key, []).append((vmidx, vm.name))
+
+    def lookup(self, nodedev):
+        found = {}
+        for key in _nodedev_hostdev_keys(nodedev):
+            found.update(self._users.get(key, []))
+        return [found[vmidx] for vmidx in sorted(found)]
+
+
 class DevNode(XMLBuilder):
     XML_NAME = "devnode"
 
@@ -62,9 +131,7 @@ class NodeDevice(XMLBuilder):
         :param conn: nodedev name
         :returns: NodeDevice instance
         """
-        for nodedev in conn.fetch_all_nodedevs():
-            if nodedev.name == name:
-                return nodedev
+        return conn.fetch_nodedev_by_name(name)
 
     XML_NAME = "device"
 
@@ -85,6 +152,17 @@ class NodeDevice(XMLBuilder):
 
         return self.name[5:].replace("_", "-")
 
+    @staticmethod
+    def hostdev_in_use_by(conn, nodedev):
+        """
+        Return a list of VM names with a <hostdev> matching the passed
+        NodeDevice, same as checking compare_to_hostdev against every
+        hostdev of every VM. The index behind this is rebuilt only when
+        the domain list changes.
+        """
+        index = conn.fetch_derived("hostdev-index", _HostdevIndex, domains=True)
+        return index.lookup(nodedev)
+
     def compare_to_hostdev(self, hostdev):
         if self.device_type == "pci":
             if hostdev.type != "pci":
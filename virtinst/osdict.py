@@ -7,8 +7,10 @@
 # See the COPYING file in the top-level directory.
 
 import datetime
+import json
 import os
 import re
+import tempfile
 
 from gi.repository import Libosinfo
 
@@ -50,6 +52,139 @@ class _OsinfoIter:
         return ret
 
 
+def _natural_sort_key(val):
+    # human/natural sort, but with reverse sorted numbers
+    def to_int(text):
+        return (int(text) * -1) if text.isdigit() else text.lower()
+
+    return [to_int(c) for c in re.split("([0-9]+)", val)]
+
+
+class _OsCatalog(object):
+    """
+    Index of every OS in the libosinfo DB. Wrapping each OS in an
+    _OsVariant, building the lookup dicts, and sorting happens once
+    per process instead of on every lookup_os/list_os call.
+    """
+
+    def __init__(self, variants, os_generic):
+        self.variants = variants
+        self.by_full_id = {}
+        self.by_short_id = {}
+
+        # First match in DB order wins, same as a Libosinfo.Filter lookup
+        for variant in self.variants:
+            self.by_full_id.setdefault(variant.full_id, variant)
+            for short_id in variant.all_names:
+                self.by_short_id.setdefault(short_id, variant)
+
+        self.variants.append(os_generic)
+        self._sorted = {}
+
+    def get_sorted(self, sortkey):
+        if sortkey not in self._sorted:
+            self._sorted[sortkey] = sorted(
+                self.variants, key=lambda obj: _natural_sort_key(getattr(obj, sortkey))
+            )
+        return self._sorted[sortkey]
+
+
+###########################
+# osinfo-db disk snapshot #
+###########################
+
+# Bump this whenever the snapshot layout or the extracted fields change
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_ENV = "VIRTINST_OSINFO_SNAPSHOT"
+
+
+def _osinfo_db_dirs():
+    """
+    The directories Libosinfo.Loader.process_default_path reads from
+    """
+    config_home = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+    return [
+        os.environ.get("OSINFO_SYSTEM_DIR", "/usr/share/osinfo"),
+        os.environ.get("OSINFO_LOCAL_DIR", "/etc/osinfo"),
+        os.environ.get("OSINFO_USER_DIR", os.path.join(config_home, "osinfo")),
+        os.environ.get("OSINFO_DATA_DIR", "/usr/share/libosinfo/db"),
+    ]
+
+
+def _osinfo_db_stamp():
+    """
+    mtimes of every directory in the osinfo-db trees. Adding, removing,
+    or replacing a DB file changes the mtime of its parent directory.
+    """
+    stamp = {}
+    for topdir in _osinfo_db_dirs():
+        for dirpath, dummy, dummy in os.walk(topdir):
+            stamp[dirpath] = os.stat(dirpath).st_mtime_ns
+    return stamp
+
+
+class _OsinfoSnapshot(object):
+    """
+    Opt-in on-disk copy of the osinfo-db fields virtinst uses, so short
+    lived commands can skip parsing the whole osinfo-db XML tree. Enable
+    it by setting VIRTINST_OSINFO_SNAPSHOT=1 in the environment.
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    @staticmethod
+    def get_default():
+        if not os.environ.get(_SNAPSHOT_ENV):
+            return None
+        from .connection import VirtinstConnection
+
+        cachedir = VirtinstConnection.get_app_cache_dir()
+        return _OsinfoSnapshot(os.path.join(cachedir, "osinfo-snapshot.json"))
+
+    def load(self):
+        """
+        Return a list of _OsVariant served from the snapshot, or None if
+        there is no valid snapshot for the current osinfo-db content
+        """
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                content = json.load(f)
+        except (OSError, ValueError) as e:
+            log.debug("Not using osinfo snapshot %s: %s", self._path, e)
+            return None
+
+        if content.get("version") != _SNAPSHOT_VERSION:
+            log.debug("osinfo snapshot version mismatch, ignoring")
+            return None
+        if content.get("stamp") != _osinfo_db_stamp():
+            log.debug("osinfo-db changed since snapshot was written, ignoring")
+            return None
+
+        log.debug("Loaded osinfo snapshot %s", self._path)
+        return [_OsVariant(None, data=data) for data in content["oses"]]
+
+    def save(self, variants):
+        content = {
+            "version": _SNAPSHOT_VERSION,
+            "stamp": _osinfo_db_stamp(),
+            "oses": [variant.get_snapshot_data() for variant in variants],
+        }
+
+        tmpname = None
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(self._path), prefix=".osinfo")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(content, f)
+            os.replace(tmpname, self._path)
+            log.debug("Wrote osinfo snapshot %s", self._path)
+        except OSError as e:  # pragma: no cover
+            log.debug("Error writing osinfo snapshot %s: %s", self._path, e)
+            if tmpname and os.path.exists(tmpname):
+                os.unlink(tmpname)
+
+
 class _OSDB(object):
     """
     Entry point for the public API
@@ -58,6 +193,7 @@ class _OSDB(object):
     def __init__(self):
         self.__os_loader = None
         self.__os_generic = None
+        self.__os_catalog = None
 
     #################
     # Internal APIs #
@@ -86,32 +222,52 @@ class _OSDB(object):
     def _os_db(self):
         return self._os_loader.get_db()
 
+    def _build_os_catalog(self):
+        snapshot = _OsinfoSnapshot.get_default()
+        variants = snapshot and snapshot.load()
+        if variants is None:
+            variants = [_OsVariant(o) for o in self._os_db.get_os_list().get_elements()]
+            if snapshot:
+                snapshot.save(variants)
+        return _OsCatalog(variants, self._os_generic)
+
+    @property
+    def _os_catalog(self):
+        if not self.__os_catalog:
+            self.__os_catalog = self._build_os_catalog()
+        return self.__os_catalog
+
+    def get_osinfo_handle(self, full_id):
+        """
+        Return the Libosinfo.Os for full_id, loading the osinfo-db if
+        the catalog was served from the snapshot
+        """
+        return self._os_db.get_os(full_id)
+
     ###############
     # Public APIs #
     ###############
 
     def lookup_os_by_full_id(self, full_id, raise_error=False):
-        osobj = self._os_db.get_os(full_id)
+        osobj = self._os_catalog.by_full_id.get(full_id)
         if osobj is None:
             if raise_error:
                 raise ValueError(_("Unknown libosinfo ID '%s'") % full_id)
             return None
-        return _OsVariant(osobj)
+        return osobj
 
     def lookup_os(self, key, raise_error=False):
         if key == self._os_generic.name:
             return self._os_generic
 
-        flt = Libosinfo.Filter()
-        flt.add_constraint(Libosinfo.PRODUCT_PROP_SHORT_ID, key)
-        oslist = self._os_db.get_os_list().new_filtered(flt).get_elements()
-        if len(oslist) == 0:
+        osobj = self._os_catalog.by_short_id.get(key)
+        if osobj is None:
             if raise_error:
                 raise ValueError(
                     _("Unknown OS name '%s'. See `--osinfo list` for valid values.") % key
                 )
             return None
-        return _OsVariant(oslist[0])
+        return osobj
 
     def guess_os_by_iso(self, location):
         try:
@@ -154,18 +310,7 @@ class _OSDB(object):
         """
         List all OSes in the DB, sorting by the passes _OsVariant attribute
         """
-        oslist = [_OsVariant(osent) for osent in self._os_db.get_os_list().get_elements()]
-        oslist.append(self._os_generic)
-
-        # human/natural sort, but with reverse sorted numbers
-        def to_int(text):
-            return (int(text) * -1) if text.isdigit() else text.lower()
-
-        def alphanum_key(obj):
-            val = getattr(obj, sortkey)
-            return [to_int(c) for c in re.split("([0-9]+)", val)]
-
-        return list(sorted(oslist, key=alphanum_key))
+        return self._os_catalog.get_sorted(sortkey)[:]
 
 
 OSDB = _OSDB()
@@ -176,24 +321,25 @@ OSDB = _OSDB()
 #####################
 
 
+def _resources_to_dict(resources):
+    """
+    Convert an OsResources object to a dictionary for easier
+    lookups. Layout is: {arch: {strkey: value}}
+    """
+    ret = {}
+    for r in _OsinfoIter(resources):
+        vals = {}
+        vals["ram"] = r.get_ram()
+        vals["n-cpus"] = r.get_n_cpus()
+        vals["storage"] = r.get_storage()
+        ret[r.get_architecture()] = vals
+    return ret
+
+
 class _OsResources:
     def __init__(self, minimum, recommended):
-        self._minimum = self._convert_to_dict(minimum)
-        self._recommended = self._convert_to_dict(recommended)
-
-    def _convert_to_dict(self, resources):
-        """
-        Convert an OsResources object to a dictionary for easier
-        lookups. Layout is: {arch: {strkey: value}}
-        """
-        ret = {}
-        for r in _OsinfoIter(resources):
-            vals = {}
-            vals["ram"] = r.get_ram()
-            vals["n-cpus"] = r.get_n_cpus()
-            vals["storage"] = r.get_storage()
-            ret[r.get_architecture()] = vals
-        return ret
+        self._minimum = minimum
+        self._recommended = recommended
 
     def _get_key(self, resources, key, arch):
         for checkarch in [arch, "all"]:
@@ -232,87 +378,231 @@ class _OsResources:
         return self._get_recommended_key("storage", arch)
 
 
+########################
+# osinfo-db extractors #
+########################
+
+# Each of these pulls one group of fields out of a Libosinfo.Os, in a
+# JSON friendly layout, so the same data can come from libosinfo or
+# from an _OsinfoSnapshot.
+
+
+def _glib_date_to_str(glibdate):
+    if glibdate is None:
+        return None
+    return "%s-%s" % (glibdate.get_year(), glibdate.get_day_of_year())
+
+
+def _extract_base(osobj):
+    short_ids = [osobj.get_short_id()]
+    if hasattr(osobj, "get_short_id_list"):
+        short_ids = osobj.get_short_id_list()
+    return {
+        "short-ids": short_ids,
+        "family": osobj.get_family(),
+        "full-id": osobj.get_id(),
+        "label": osobj.get_name(),
+        "codename": osobj.get_codename() or "",
+        "distro": osobj.get_distro() or "",
+        "version": osobj.get_version(),
+    }
+
+
+def _extract_eol(osobj):
+    # We can use os.get_release_status() & osinfo.ReleaseStatus.ROLLING
+    # if we require libosinfo >= 1.4.0.
+    return {
+        "eol": _glib_date_to_str(osobj.get_eol_date()),
+        "release": _glib_date_to_str(osobj.get_release_date()),
+        "status": osobj.get_param_value(Libosinfo.OS_PROP_RELEASE_STATUS) or None,
+    }
+
+
+def _extract_related(osobj):
+    ret = {}
+    for key, relationship in [
+        ("derives", Libosinfo.ProductRelationship.DERIVES_FROM),
+        ("clones", Libosinfo.ProductRelationship.CLONES),
+        ("upgrades", Libosinfo.ProductRelationship.UPGRADES),
+    ]:
+        ret[key] = [o.get_id() for o in osobj.get_related(relationship).get_elements()]
+    return ret
+
+
+def _extract_devices(osobj):
+    return [
+        [dev.get_id(), dev.get_class(), dev.get_name()]
+        for dev in _OsinfoIter(osobj.get_all_devices())
+    ]
+
+
+def _extract_resources(osobj):
+    network_install = []
+    if hasattr(osobj, "get_network_install_resources"):
+        for r in _OsinfoIter(osobj.get_network_install_resources()):
+            network_install.append([r.get_architecture(), r.get_ram()])
+    return {
+        "minimum": _resources_to_dict(osobj.get_minimum_resources()),
+        "recommended": _resources_to_dict(osobj.get_recommended_resources()),
+        "network-install": network_install,
+    }
+
+
+def _extract_firmware(osobj):
+    if not hasattr(osobj, "get_complete_firmware_list"):
+        return []  # pragma: no cover
+    return [  # pragma: no cover
+        [fw.get_architecture(), fw.get_firmware_type(), fw.is_supported()]
+        for fw in osobj.get_complete_firmware_list().get_elements()
+    ]
+
+
+def _extract_kernel_url_arg(osobj):
+    if hasattr(osobj, "get_kernel_url_argument"):
+        return osobj.get_kernel_url_argument()
+    return None  # pragma: no cover
+
+
+def _extract_trees(osobj):
+    ret = []
+    for tree in _OsinfoIter(osobj.get_tree_list()):
+        variants = None
+        if hasattr(Libosinfo.Tree, "get_os_variants"):
+            variants = [v.get_name() for v in _OsinfoIter(tree.get_os_variants())]
+        ret.append([tree.get_architecture(), tree.get_url(), variants])
+    return ret
+
+
+_EXTRACTORS = {
+    "base": _extract_base,
+    "eol": _extract_eol,
+    "related": _extract_related,
+    "devices": _extract_devices,
+    "resources": _extract_resources,
+    "firmware": _extract_firmware,
+    "kernel-url-arg": _extract_kernel_url_arg,
+    "trees": _extract_trees,
+}
+
+
 #####################
 # OsVariant classes #
 #####################
 
 
 class _OsVariant(object):
-    def __init__(self, o):
-        self._os = o
+    """
+    Wrapper around a libosinfo OS. The fields virtinst uses are read
+    through _get_data, which is either prefilled from an _OsinfoSnapshot
+    (with 'o' None, the Libosinfo.Os is only looked up when something
+    outside the snapshot is needed), or extracted from 'o' on first use.
+    """
 
-        self._short_ids = [self._os.get_short_id()]
-        if hasattr(self._os, "get_short_id_list"):
-            self._short_ids = self._os.get_short_id_list()
+    def __init__(self, o, data=None):
+        self.__os = o
+        self._data = data or {}
+
+        base = self._get_data("base")
+        self._short_ids = base["short-ids"]
         self.name = self._short_ids[0]
         self.all_names = list(sorted(set(self._short_ids)))
 
-        self._family = self._os.get_family()
-        self.full_id = self._os.get_id()
-        self.label = self._os.get_name()
-        self.codename = self._os.get_codename() or ""
-        self.distro = self._os.get_distro() or ""
-        self.version = self._os.get_version()
+        self._family = base["family"]
+        self.full_id = base["full-id"]
+        self.label = base["label"]
+        self.codename = base["codename"]
+        self.distro = base["distro"]
+        self.version = base["version"]
 
-        self.eol = self._get_eol()
+        self._eol = None
+        self._related_cache = {}
 
     def __repr__(self):
         return "<%s name=%s>" % (self.__class__.__name__, self.name)
 
+    @property
+    def _os(self):
+        if self.__os is None:
+            self.__os = OSDB.get_osinfo_handle(self.full_id)
+        return self.__os
+
+    def _get_data(self, key):
+        if key not in self._data:
+            self._data[key] = _EXTRACTORS[key](self._os)
+        return self._data[key]
+
+    def get_snapshot_data(self):
+        for key in _EXTRACTORS:
+            self._get_data(key)
+        return self._data
+
+    @property
+    def eol(self):
+        # Computed on first use, since the catalog builds every variant
+        if self._eol is None:
+            self._eol = self._get_eol()
+        return self._eol
+
     ########################
     # Internal helper APIs #
     ########################
 
+    def _get_related_short_ids(self, check_derives, check_upgrades, check_clones):
+        """
+        Return the short IDs of this OS and everything it transitively
+        derives from, clones, or upgrades. Memoized per flag combination.
+        """
+        cachekey = (check_derives, check_upgrades, check_clones)
+        if cachekey in self._related_cache:
+            return self._related_cache[cachekey]
+
+        relationships = []
+        if check_derives:
+            relationships.append("derives")
+        if check_clones:
+            relationships.append("clones")
+        if check_upgrades:
+            relationships.append("upgrades")
+
+        ret = set()
+        seen = set([self.full_id])
+        tocheck = [self]
+        while tocheck:
+            variant = tocheck.pop()
+            ret.add(variant.name)
+            related = variant._get_data("related")
+            for relationship in relationships:
+                for full_id in related[relationship]:
+                    relvariant = OSDB.lookup_os_by_full_id(full_id)
+                    if relvariant and full_id not in seen:
+                        seen.add(full_id)
+                        tocheck.append(relvariant)
+
+        self._related_cache[cachekey] = frozenset(ret)
+        return self._related_cache[cachekey]
+
     def _is_related_to(
         self,
         related_os_list,
-        osobj=None,
         check_derives=True,
         check_upgrades=True,
         check_clones=True,
     ):
-        osobj = osobj or self._os
-        if osobj.get_short_id() in related_os_list:
-            return True
-
-        check_list = []
-
-        def _extend(newl):
-            for obj in newl:
-                if obj not in check_list:
-                    check_list.append(obj)
-
-        if check_derives:
-            _extend(osobj.get_related(Libosinfo.ProductRelationship.DERIVES_FROM).get_elements())
-        if check_clones:
-            _extend(osobj.get_related(Libosinfo.ProductRelationship.CLONES).get_elements())
-        if check_upgrades:
-            _extend(osobj.get_related(Libosinfo.ProductRelationship.UPGRADES).get_elements())
-
-        for checkobj in check_list:
-            if checkobj.get_short_id() in related_os_list or self._is_related_to(
-                related_os_list,
-                osobj=checkobj,
-                check_upgrades=check_upgrades,
-                check_derives=check_derives,
-                check_clones=check_clones,
-            ):
-                return True
-
-        return False
+        related = self._get_related_short_ids(check_derives, check_upgrades, check_clones)
+        return any(name in related for name in xmlutil.listify(related_os_list))
 
     def _get_all_devices(self):
-        return list(_OsinfoIter(self._os.get_all_devices()))
+        return self._get_data("devices")
 
     def _device_filter(self, devids=None, cls=None, extra_devs=None):
         ret = []
         devids = devids or []
-        for dev in self._get_all_devices():
-            if devids and dev.get_id() not in devids:
+        for devid, devclass, devname in self._get_all_devices():
+            if devids and devid not in devids:
                 continue
-            if cls and not re.match(cls, dev.get_class()):
+            if cls and not re.match(cls, devclass):
                 continue
-            ret.append(dev.get_name())
+            ret.append(devname)
 
         extra_devs = extra_devs or []
         for dev in extra_devs:
@@ -327,15 +617,12 @@ class _OsVariant(object):
     ###############
 
     def _get_eol(self):
-        eol = self._os.get_eol_date()
-        rel = self._os.get_release_date()
-
-        # We can use os.get_release_status() & osinfo.ReleaseStatus.ROLLING
-        # if we require libosinfo >= 1.4.0.
-        release_status = self._os.get_param_value(Libosinfo.OS_PROP_RELEASE_STATUS) or None
+        eolinfo = self._get_data("eol")
+        eol = eolinfo["eol"]
+        rel = eolinfo["release"]
+        release_status = eolinfo["status"]
 
-        def _glib_to_datetime(glibdate):
-            date = "%s-%s" % (glibdate.get_year(), glibdate.get_day_of_year())
+        def _glib_to_datetime(date):
             return datetime.datetime.strptime(date, "%Y-%j")
 
         now = datetime.datetime.today()
@@ -438,19 +725,14 @@ class _OsVariant(object):
         devids = ["http://qemu.org/chipset/x86/q35"]
         return bool(self._device_filter(devids=devids, extra_devs=extra_devs))
 
-    def _get_firmware_list(self):
-        if hasattr(self._os, "get_complete_firmware_list"):  # pragma: no cover
-            return self._os.get_complete_firmware_list().get_elements()
-        return []  # pragma: no cover
-
     def _supports_firmware_type(self, name, arch, default):
-        firmwares = self._get_firmware_list()
+        firmwares = self._get_data("firmware")
 
-        for firmware in firmwares:  # pragma: no cover
-            if firmware.get_architecture() != arch:
+        for fwarch, fwtype, supported in firmwares:  # pragma: no cover
+            if fwarch != arch:
                 continue
-            if firmware.get_firmware_type() == name:
-                return firmware.is_supported()
+            if fwtype == name:
+                return supported
 
         return default
 
@@ -466,17 +748,13 @@ class _OsVariant(object):
         return ret
 
     def get_recommended_resources(self):
-        minimum = self._os.get_minimum_resources()
-        recommended = self._os.get_recommended_resources()
-        return _OsResources(minimum, recommended)
+        resources = self._get_data("resources")
+        return _OsResources(resources["minimum"], resources["recommended"])
 
     def get_network_install_required_ram(self, guest):
-        if hasattr(self._os, "get_network_install_resources"):
-            resources = self._os.get_network_install_resources()
-            for r in _OsinfoIter(resources):
-                arch = r.get_architecture()
-                if arch == guest.os.arch or arch == "all":
-                    return r.get_ram()
+        for arch, ram in self._get_data("resources")["network-install"]:
+            if arch == guest.os.arch or arch == "all":
+                return ram
 
     def get_kernel_url_arg(self):
         """
@@ -484,10 +762,9 @@ class _OsVariant(object):
         a network source, possibly bypassing some installer prompts
         """
         # Let's ask the OS for its kernel argument for the source
-        if hasattr(self._os, "get_kernel_url_argument"):
-            osarg = self._os.get_kernel_url_argument()
-            if osarg is not None:
-                return osarg
+        osarg = self._get_data("kernel-url-arg")
+        if osarg is not None:
+            return osarg
 
         # SUSE distros
         if self.distro in ["caasp", "sle", "sled", "sles", "opensuse"]:
@@ -500,10 +777,11 @@ class _OsVariant(object):
         return "inst.repo"  # pragma: no cover
 
     def _get_generic_location(self, treelist, arch, profile):
-        if not hasattr(Libosinfo.Tree, "get_os_variants"):  # pragma: no cover
-            for tree in treelist:
-                if tree.get_architecture() == arch:
-                    return tree.get_url()
+        if any(variants is None for dummy, dummy, variants in treelist):  # pragma: no cover
+            # libosinfo without Tree.get_os_variants
+            for treearch, url, dummy in treelist:
+                if treearch == arch:
+                    return url
             return None
 
         fallback_tree = None
@@ -514,22 +792,19 @@ class _OsVariant(object):
         elif not profile:
             profile = "Everything"
 
-        for tree in treelist:
-            if tree.get_architecture() != arch:
+        for treearch, url, variants in treelist:
+            if treearch != arch:
                 continue
 
-            variant_list = tree.get_os_variants()
-            fallback_tree = tree
-            for variant in _OsinfoIter(variant_list):
-                if profile in variant.get_name():
-                    return tree.get_url()
+            fallback_tree = url
+            for variant in variants:
+                if profile in variant:
+                    return url
 
-        if fallback_tree:
-            return fallback_tree.get_url()
-        return None
+        return fallback_tree
 
     def get_location(self, arch, profile=None):
-        treelist = list(_OsinfoIter(self._os.get_tree_list()))
+        treelist = self._get_data("trees")
 
         if not treelist:
             raise RuntimeError(_("OS '%s' does not have a URL location") % self.name)
@@ -6,8 +6,10 @@
 #
 
 import sys
+import threading
 
 from . import _progresspriv
+from .logger import log
 
 
 class Meter:
@@ -51,3 +53,69 @@ def ensure_meter(meter):
     if meter:
         return meter
     return make_meter(quiet=True)
+
+
+class _ChildMeter(Meter):
+    """
+    Meter for one operation of an AggregateMeter. It doesn't print
+    anything itself, it just reports progress to the parent.
+    """
+
+    def __init__(self, parent):
+        Meter.__init__(self, quiet=True)
+        self._parent = parent
+        self.done = False
+
+    def start(self, text, size):
+        Meter.start(self, text, size)
+        log.debug("Started: %s", text)
+        self._parent.child_changed()
+
+    def update(self, new_total):
+        Meter.update(self, new_total)
+        self._parent.child_changed()
+
+    def end(self):
+        Meter.end(self)
+        if self._size:
+            self._total_read = self._size
+        self.done = True
+        log.debug("Finished: %s", self._text)
+        self._parent.child_changed()
+
+    def get_progress(self):
+        return self._text, self._total_read, self._size
+
+
+class AggregateMeter:
+    """
+    Report progress for multiple operations running in parallel,
+    each using its own child meter from make_child(), as one combined
+    operation on the passed meter.
+    """
+
+    def __init__(self, meter, text, size):
+        self._meter = ensure_meter(meter)
+        self._text = text
+        self._size = size
+        self._children = []
+        self._started = False
+        self._lock = threading.Lock()
+
+    def make_child(self):
+        child = _ChildMeter(self)
+        with self._lock:
+            self._children.append(child)
+        return child
+
+    def child_changed(self):
+        with self._lock:
+            if not self._started:
+                self._started = True
+                self._meter.start(self._text, self._size)
+            self._meter.update(sum(c.get_progress()[1] for c in self._children))
+
+    def end(self):
+        with self._lock:
+            if self._started:
+                self._meter.end()
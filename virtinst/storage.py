@@ -51,14 +51,6 @@ def _preferred_default_pool_path(conn):
     return os.path.join(root, "images")
 
 
-def _lookup_poolxml_by_path(conn, path):
-    for poolxml in conn.fetch_all_pools():
-        xml_path = poolxml.target_path
-        if xml_path is not None and os.path.abspath(xml_path) == path:
-            return poolxml
-    return None
-
-
 class _Host(XMLBuilder):
     _XML_PROP_ORDER = ["name", "port"]
     XML_NAME = "host"
@@ -125,13 +117,9 @@ class StoragePool(_StorageObject):
         name = "default"
         path = _preferred_default_pool_path(conn)
 
-        poolxml = None
-        for trypool in conn.fetch_all_pools():
-            if trypool.name == name:
-                poolxml = trypool
-                break
-        else:
-            poolxml = _lookup_poolxml_by_path(conn, path)
+        poolxml = conn.fetch_pool_by_name(name)
+        if not poolxml:
+            poolxml = conn.fetch_pool_by_path(path)
 
         if poolxml:
             log.debug("Found default pool name=%s target=%s", poolxml.name, poolxml.target_path)
@@ -170,11 +158,12 @@ class StoragePool(_StorageObject):
         """
         Return the first pool with matching matching target path.
         return the first we find, active or inactive. This iterates over
-        all pools and dumps their xml, so it is NOT quick.
+        all pools and dumps their xml the first time it is called, but
+        later lookups are answered from the connection's pool index.
 
         :returns: virStoragePool object if found, None otherwise
         """
-        poolxml = _lookup_poolxml_by_path(conn, path)
+        poolxml = conn.fetch_pool_by_path(path)
         if not poolxml:
             return None
         return conn.storagePoolLookupByName(poolxml.name)
@@ -187,10 +176,7 @@ class StoragePool(_StorageObject):
         """
 
         def cb(name):
-            for pool in conn.fetch_all_pools():
-                if pool.name == name:
-                    return True
-            return False
+            return bool(conn.fetch_pool_by_name(name))
 
         return generatename.generate_name(basename, cb, **kwargs)
 
@@ -484,11 +470,9 @@ class StorageVolume(_StorageObject):
         collidelist = []
         if collideguest:
             pooltarget = None
-            poolname = pool_object.name()
-            for poolxml in conn.fetch_all_pools():
-                if poolxml.name == poolname:
-                    pooltarget = poolxml.target_path
-                    break
+            poolxml = conn.fetch_pool_by_name(pool_object.name())
+            if poolxml:
+                pooltarget = poolxml.target_path
 
             for disk in collideguest.devices.disk:
                 checkpath = disk.get_source_path()
@@ -501,7 +485,10 @@ class StorageVolume(_StorageObject):
             return generatename.check_libvirt_collision(pool_object.storageVolLookupByName, tryname)
 
         StoragePool.ensure_pool_is_running(pool_object, refresh=True)
-        return generatename.generate_name(basename, cb, **kwargs)
+        existing = generatename.list_existing(pool_object.listAllVolumes, lambda v: v.name())
+        if existing is not None:
+            existing.update(collidelist)
+        return generatename.generate_name(basename, cb, existing=existing, **kwargs)
 
     TYPE_FILE = getattr(libvirt, "VIR_STORAGE_VOL_FILE", 0)
     TYPE_BLOCK = getattr(libvirt, "VIR_STORAGE_VOL_BLOCK", 1)
@@ -517,6 +504,9 @@ class StorageVolume(_StorageObject):
         self._pool_xml = None
         self._reflink = False
 
+        # Parent pool name, filled in for objects from conn.fetch_all_vols
+        self.pool_name = None
+
     ######################
     # Non XML properties #
     ######################
@@ -724,6 +714,7 @@ class StorageVolume(_StorageObject):
             else:
                 log.debug("Using vol create flags=%s", createflags)
                 vol = self.pool.createXML(xml, createflags)
+            self.conn.invalidate_fetch_cache(vols=True)
 
             meter.update(self.capacity)
             meter.end()
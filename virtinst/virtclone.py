@@ -118,6 +118,12 @@ def parse_args():
         default=True,
         help=_("Do not use a sparse file for the clone's disk image"),
     )
+    stog.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help=_("Number of disks to clone in parallel. Default: 1"),
+    )
     stog.add_argument(
         "--preserve-data",
         dest="preserve",
@@ -187,6 +193,7 @@ def main(conn=None):
     cloner.set_replace(bool(options.replace))
     cloner.set_reflink(bool(options.reflink))
     cloner.set_sparse(bool(options.sparse))
+    cloner.set_clone_jobs(options.jobs)
 
     if options.new_uuid is not None:
         cloner.set_clone_uuid(options.new_uuid)
@@ -5,10 +5,13 @@
 
 import argparse
 import atexit
+import json
 import os
 import sys
+import threading
 import time
 import select
+from concurrent.futures import ThreadPoolExecutor
 
 import libvirt
 
@@ -16,7 +19,10 @@ import virtinst
 from . import cli
 from .cli import fail, fail_conflicting, print_stdout, print_stderr
 from . import Network
+from .devices import DeviceInterface
 from .guest import Guest
+from .install.installertreemedia import SharedTreeMediaCache
+from .install.mediacache import MediaCache
 from .logger import log
 
 
@@ -402,7 +408,7 @@ def get_location_for_os(guest, osname, profile=None):
     return location
 
 
-def build_installer(options, guest, installdata):
+def build_installer(options, guest, installdata, fleet=None):
     cdrom = None
     location = None
     location_kernel = None
@@ -474,13 +480,15 @@ def build_installer(options, guest, installdata):
     if options.cloud_init:
         cloudinit_data = cli.parse_cloud_init(options.cloud_init)
         installer.set_cloudinit_data(cloudinit_data)
+    if fleet:
+        installer.set_treemedia_cache(fleet.media_cache)
 
     return installer
 
 
-def set_cli_default_name(guest):
+def set_cli_default_name(guest, existing=None):
     if not guest.name:
-        default_name = virtinst.Guest.generate_name(guest)
+        default_name = virtinst.Guest.generate_name(guest, existing=existing)
         cli.print_stdout(_("Using default --name {vm_name}").format(vm_name=default_name))
         guest.name = default_name
 
@@ -666,7 +674,7 @@ def _build_options_guest(conn, options):
     return guest
 
 
-def build_guest_instance(conn, options):
+def build_guest_instance(conn, options, fleet=None):
     installdata = cli.parse_install(options.install)
     osdata = cli.parse_osinfo(options.osinfo or installdata.os)
     options.boot_was_set = bool(options.boot)
@@ -676,7 +684,7 @@ def build_guest_instance(conn, options):
     else:
         guest = _build_options_guest(conn, options)
 
-    installer = build_installer(options, guest, installdata)
+    installer = build_installer(options, guest, installdata, fleet=fleet)
 
     # Set guest osname, from commandline or detected from media
     guest.set_default_os_name()
@@ -685,9 +693,11 @@ def build_guest_instance(conn, options):
     if not options.reinstall:
         # We want to fill in --name before we do disk parsing, since
         # default disk paths are generated based on VM name
-        set_cli_default_name(guest)
+        set_cli_default_name(guest, existing=fleet and fleet.names or None)
         cli.run_all_parsers(options, guest)
         set_cli_defaults(options, guest)
+        if fleet:
+            fleet.reserve_ids(guest)
 
     installer.set_install_defaults(guest)
     for path in installer.get_search_paths(guest):
@@ -1042,12 +1052,240 @@ def xml_to_print(guest, installer, xmlonly, dry):
     return xml
 
 
+######################
+# Fleet provisioning #
+######################
+
+
+def _manifest_entry_to_args(entry):
+    """
+    Convert a manifest guest dict like {"memory": 2048, "disk": ["a", "b"]}
+    to virt-install command line arguments
+    """
+    args = []
+    for key, value in entry.items():
+        opt = "--" + key.replace("_", "-")
+        for val in value if isinstance(value, list) else [value]:
+            if val is None or val is False:
+                continue
+            if val is True:
+                args.append(opt)
+            else:
+                # opt=val form so values starting with '-' aren't
+                # mistaken for options
+                args.append("%s=%s" % (opt, val))
+    return args
+
+
+def parse_fleet_manifest(path):
+    """
+    Parse the --fleet JSON manifest. It's either a list of guest dicts,
+    or a dict with a 'guests' list and optional shared 'defaults' dict.
+    Guest keys override 'defaults' keys of the same name.
+
+    :returns: list of command line argument lists, one per guest
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        fail(
+            _("Error reading fleet manifest '%(path)s': %(error)s")
+            % {"path": path, "error": str(e)}
+        )
+
+    defaults = {}
+    guests = manifest
+    if isinstance(manifest, dict):
+        defaults = manifest.get("defaults", {})
+        guests = manifest.get("guests", [])
+    if (
+        not isinstance(guests, list)
+        or not isinstance(defaults, dict)
+        or not all(isinstance(g, dict) for g in guests)
+    ):
+        fail(_("Fleet manifest must contain a list of guest objects"))
+    if not guests:
+        fail(_("Fleet manifest does not list any guests"))
+
+    return [_manifest_entry_to_args(dict(defaults, **guest)) for guest in guests]
+
+
+class _FleetGuest:
+    def __init__(self, idx, options):
+        self.idx = idx
+        self.options = options
+        self.name = options.name or "#%d" % (idx + 1)
+        self.guest = None
+        self.installer = None
+        self.error = None
+        self.install_time = 0
+
+
+class _Fleet:
+    """
+    State shared by all guests of a virt-install --fleet run: the install
+    media cache, plus the names and UUIDs in use on the connection,
+    fetched once and extended as each guest is set up. MACs already on
+    the connection are covered by the connection's MAC registry, so
+    'macs' only tracks the ones handed out to fleet guests
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.media_cache = SharedTreeMediaCache()
+
+        self.names = set()
+        self.uuids = set()
+        self.macs = set()
+        for domain in conn.fetch_all_domains():
+            self.names.add(domain.name)
+            self.uuids.add(domain.uuid)
+        self._fleet_names = set()
+
+    def reserve_ids(self, guest):
+        """
+        Claim the name for 'guest', and pre-generate its UUID and any
+        missing MAC addresses against our in use sets
+        """
+        if guest.name in self._fleet_names:
+            fail(_("Guest name '%s' is used more than once in the fleet") % guest.name)
+        self._fleet_names.add(guest.name)
+        self.names.add(guest.name)
+
+        if not guest.uuid:
+            guest.uuid = Guest.generate_uuid(self.conn, inuse=self.uuids)
+        for net in guest.devices.interface:
+            if not net.macaddr:
+                net.macaddr = DeviceInterface.generate_mac(self.conn, inuse=self.macs)
+            else:
+                self.macs.add(net.macaddr.lower())
+
+
+class _FleetRunner:
+    """
+    Provision every guest listed in a --fleet manifest.
+
+    Guests are set up one at a time, so install media detection and
+    name/UUID/MAC generation are done once and shared. Storage creation
+    and install startup then run concurrently, up to --fleet-jobs at once.
+    """
+
+    def __init__(self, conn, options):
+        self.conn = conn
+        self.options = options
+        self.timings = []
+        self._lock = threading.Lock()
+        self._done = 0
+        self._fleetguests = []
+
+    def _time_phase(self, name, cb):
+        start = time.time()
+        try:
+            return cb()
+        finally:
+            self.timings.append((name, time.time() - start))
+
+    def _parse_manifest(self):
+        baseargs = sys.argv[1:]
+        for idx, guestargs in enumerate(parse_fleet_manifest(self.options.fleet)):
+            guestopts = parse_args(baseargs + guestargs)
+            convert_old_printxml(guestopts)
+            convert_options(guestopts)
+            # Nobody is around to watch a console for each guest
+            guestopts.autoconsole = "none"
+            self._fleetguests.append(_FleetGuest(idx, guestopts))
+
+    def _setup_guests(self, fleet):
+        for fleetguest in self._fleetguests:
+            try:
+                fleetguest.guest, fleetguest.installer = build_guest_instance(
+                    self.conn, fleetguest.options, fleet=fleet
+                )
+                fleetguest.name = fleetguest.guest.name
+            except SystemExit:
+                # cli.fail() already logged the actual error
+                fleetguest.error = _("setup failed, see error above")
+            except Exception as e:
+                log.debug("Error setting up guest %s", fleetguest.name, exc_info=True)
+                fleetguest.error = str(e)
+            if fleetguest.error:
+                self._report(fleetguest)
+
+    def _report(self, fleetguest):
+        with self._lock:
+            self._done += 1
+            prefix = "[%d/%d] %s" % (self._done, len(self._fleetguests), fleetguest.name)
+        if fleetguest.error:
+            print_stderr(
+                _("%(prefix)s: FAILED: %(error)s") % {"prefix": prefix, "error": fleetguest.error}
+            )
+        else:
+            print_stdout(
+                _("%(prefix)s: OK (%(secs).2fs)")
+                % {"prefix": prefix, "secs": fleetguest.install_time}
+            )
+
+    def _install_one(self, fleetguest):
+        options = fleetguest.options
+        start = time.time()
+        try:
+            if options.xmlonly or options.dry:
+                xml = xml_to_print(
+                    fleetguest.guest, fleetguest.installer, options.xmlonly, options.dry
+                )
+                if xml:
+                    print_stdout(xml, do_force=True)
+            else:
+                start_install(fleetguest.guest, fleetguest.installer, options)
+        except SystemExit:
+            fleetguest.error = _("install failed, see error above")
+        except Exception as e:
+            log.debug("Error installing guest %s", fleetguest.name, exc_info=True)
+            fleetguest.error = str(e)
+        fleetguest.install_time = time.time() - start
+        self._report(fleetguest)
+
+    def _install_guests(self):
+        toinstall = [g for g in self._fleetguests if not g.error]
+        if not toinstall:
+            return
+        jobs = max(1, min(self.options.fleet_jobs, len(toinstall)))
+        log.debug("Installing %d fleet guests with %d jobs", len(toinstall), jobs)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for dummy in executor.map(self._install_one, toinstall):
+                pass
+
+    def run(self):
+        fleet = None
+        try:
+            self._time_phase("manifest", self._parse_manifest)
+            fleet = self._time_phase("connection data", lambda: _Fleet(self.conn))
+            self._time_phase("setup", lambda: self._setup_guests(fleet))
+            self._time_phase("install", self._install_guests)
+        finally:
+            if fleet:
+                fleet.media_cache.cleanup()
+
+        failed = [g for g in self._fleetguests if g.error]
+        print_stdout(
+            _("Fleet finished: %(succeeded)d succeeded, %(failed)d failed")
+            % {"succeeded": len(self._fleetguests) - len(failed), "failed": len(failed)}
+        )
+        timings = ", ".join("%s %.2fs" % (name, secs) for name, secs in self.timings)
+        total = sum(secs for dummy, secs in self.timings)
+        print_stdout(
+            _("Fleet timing: %(phases)s, total %(secs).2fs") % {"phases": timings, "secs": total}
+        )
+        return failed and 1 or 0
+
+
 #######################
 # CLI option handling #
 #######################
 
 
-def parse_args():
+def parse_args(args=None):
     parser = cli.setupParser(
         "%(prog)s OPTIONS",
         _("Create a new virtual machine from specified install media."),
@@ -1205,6 +1443,12 @@ def parse_args():
     misc.add_argument(
         "--wait", type=int, const=-1, nargs="?", help=_("Minutes to wait for install to complete.")
     )
+    misc.add_argument(
+        "--cache-stats",
+        action="store_true",
+        default=False,
+        help=_("Print install media cache statistics when finished."),
+    )
 
     cli.add_misc_options(
         misc,
@@ -1216,9 +1460,22 @@ def parse_args():
         noautoconsole=True,
     )
 
+    fleetg = parser.add_argument_group(_("Fleet Options"))
+    fleetg.add_argument(
+        "--fleet",
+        metavar="MANIFEST",
+        help=_("Create every guest listed in the JSON file MANIFEST"),
+    )
+    fleetg.add_argument(
+        "--fleet-jobs",
+        type=int,
+        default=4,
+        help=_("Number of fleet guests to install in parallel. Default: 4"),
+    )
+
     cli.autocomplete(parser)
 
-    return parser.parse_args()
+    return parser.parse_args(args)
 
 
 ###################
@@ -1258,20 +1515,10 @@ def set_test_stub_options(options):  # pragma: no cover
         options.osinfo = "fedora27"
 
 
-def main(conn=None):
-    cli.earlyLogging()
-    options = parse_args()
-
-    # Default setup options
-    convert_old_printxml(options)
-    options.quiet = options.xmlonly or options.test_media_detection or options.quiet
-    cli.setupLogging("virt-install", options.debug, options.quiet)
-
-    if cli.check_option_introspection(options):
-        return 0
-    if cli.check_osinfo_list(options):
-        return 0
-
+def convert_options(options):
+    """
+    Validate and convert backcompat options to their current form
+    """
     check_cdrom_option_error(options)
     cli.convert_old_force(options)
     cli.parse_check(options.check)
@@ -1288,6 +1535,59 @@ def main(conn=None):
     set_test_stub_options(options)
     convert_old_os_options(options)
 
+
+def print_cache_stats(options):
+    if not options.cache_stats:
+        return
+
+    mediacache = MediaCache.get_default()
+    if not mediacache:
+        print_stdout(
+            _("Install media cache is disabled. Set VIRTINST_MEDIA_CACHE=1 to enable it."),
+            do_force=True,
+        )
+        return
+
+    stats = mediacache.get_stats()
+    print_stdout(
+        _(
+            "Media cache: %(hits)d hits, %(misses)d misses, %(saved).1f MiB saved, "
+            "%(entries)d files using %(size).1f MiB"
+        )
+        % {
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "saved": stats["bytes_saved"] / 1024.0 / 1024.0,
+            "entries": stats["entries"],
+            "size": stats["size"] / 1024.0 / 1024.0,
+        },
+        do_force=True,
+    )
+
+
+def main(conn=None):
+    cli.earlyLogging()
+    options = parse_args()
+
+    # Default setup options
+    convert_old_printxml(options)
+    options.quiet = options.xmlonly or options.test_media_detection or options.quiet
+    cli.setupLogging("virt-install", options.debug, options.quiet)
+
+    if cli.check_option_introspection(options):
+        return 0
+    if cli.check_osinfo_list(options):
+        return 0
+
+    if options.fleet:
+        if options.fleet_jobs < 1:
+            fail(_("--fleet-jobs must be at least 1"))
+        conn = cli.getConnection(options.connect, conn=conn)
+        ret = _FleetRunner(conn, options).run()
+        print_cache_stats(options)
+        return ret
+
+    convert_options(options)
     conn = cli.getConnection(options.connect, conn=conn)
 
     if options.test_media_detection:
@@ -1302,6 +1602,7 @@ def main(conn=None):
     else:
         start_install(guest, installer, options)
 
+    print_cache_stats(options)
     return 0
 
 
@@ -3,8 +3,12 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import fnmatch
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import libvirt
 
@@ -12,6 +16,7 @@ from . import cli
 from .cli import fail, fail_conflicting, print_stdout, print_stderr
 from .guest import Guest
 from .logger import log
+from .osdict import OSDB
 from . import xmlutil
 
 
@@ -441,6 +446,204 @@ def prepare_changes(orig_xmlobj, options, action, input_devs=None):
     return devs, xmlobj
 
 
+def edit_domain(conn, options, action, domain, inactive_xmlobj, active_xmlobj):
+    """
+    Apply the requested action to a single domain, and define/update/start
+    it as requested by the user
+    """
+    vm_is_running = bool(active_xmlobj)
+    input_devs = None
+    performed_update = False
+    if options.update:
+        if options.update and options.start:
+            fail_conflicting("--update", "--start")
+        if vm_is_running:
+            input_devs, dummy = prepare_changes(active_xmlobj, options, action)
+            update_changes(domain, input_devs, action, options.confirm)
+            performed_update = True
+        else:
+            log.warning(_("The VM is not running, --update is inapplicable."))
+        if not options.define:
+            # --update and --no-define passed, so we are done
+            return 0
+
+    original_xml = inactive_xmlobj.get_xml()
+    devs, xmlobj_to_define = prepare_changes(
+        inactive_xmlobj, options, action, input_devs=input_devs
+    )
+    if not options.define:
+        if options.start:
+            start_domain_transient(conn, xmlobj_to_define, devs, action, options.confirm)
+        return 0
+
+    dom = define_changes(conn, xmlobj_to_define, devs, action, options.confirm)
+    if not dom:
+        # --confirm user said 'no'
+        return 0
+
+    if options.start:
+        try:
+            dom.create()
+        except libvirt.libvirtError as e:  # pragma: no cover
+            fail(
+                _("Failed starting domain '%(domain)s': %(error)s")
+                % {
+                    "domain": inactive_xmlobj.name,
+                    "error": e,
+                }
+            )
+        print_stdout(_("Domain '%s' started successfully.") % inactive_xmlobj.name)
+
+    elif vm_is_running and not performed_update:
+        print_stdout(_("Changes will take effect after the domain is fully powered off."))
+    elif defined_xml_is_unchanged(conn, dom, original_xml):
+        log.warning(
+            _(
+                "XML did not change after domain define. You may "
+                "have changed a value that libvirt is setting by default."
+            )
+        )
+
+    return 0
+
+
+#################
+# Batch editing #
+#################
+
+
+def _read_domains_file(path):
+    """
+    Read domain names from 'path', one per line. Blank lines and
+    lines starting with '#' are skipped
+    """
+    names = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                names.append(line)
+    return names
+
+
+def validate_batch_options(options):
+    if options.domain:
+        fail(_("A domain can not be specified with --domains-from or --domains-matching"))
+    if options.confirm:
+        fail(_("Can't use --confirm with batch editing."))
+    if options.build_xml:
+        fail(_("Can't use --build-xml with batch editing."))
+    if options.jobs < 1:
+        fail(_("--jobs must be at least 1"))
+
+
+def get_batch_domains(conn, options):
+    """
+    Return the ordered list of domain strings requested via
+    --domains-from and --domains-matching, without duplicates
+    """
+    names = []
+    if options.domains_from:
+        try:
+            names += _read_domains_file(options.domains_from)
+        except OSError as e:
+            fail(
+                _("Error reading domain list '%(path)s': %(error)s")
+                % {"path": options.domains_from, "error": str(e)}
+            )
+    if options.domains_matching:
+        allnames = sorted(dom.name() for dom in conn.listAllDomains(0))
+        names += [n for n in allnames if fnmatch.fnmatchcase(n, options.domains_matching)]
+
+    ret = list(dict.fromkeys(names))
+    if not ret:
+        fail(_("No domains matched the batch selection."))
+    return ret
+
+
+class _BatchRunner:
+    """
+    Run the same virt-xml action against many domains over one
+    connection, using a bounded pool of worker threads. Each worker
+    fetches, edits and defines a single domain.
+    """
+
+    def __init__(self, conn, options, action, names):
+        self.conn = conn
+        self.options = options
+        self.action = action
+        self.names = names
+
+        self.failed = []
+        self._done = 0
+        self._lock = threading.Lock()
+
+    def _prime_caches(self):
+        # Everything here is shared by all domains, and lazily populated
+        # on first use. Do it once upfront so the workers don't race
+        # to each build their own copy
+        dummy = self.conn.caps
+        dummy = OSDB.list_os()
+
+    def _report(self, name, start, error):
+        with self._lock:
+            self._done += 1
+            prefix = "[%d/%d] %s" % (self._done, len(self.names), name)
+            elapsed = time.time() - start
+            if error is None:
+                print_stdout(
+                    _("%(prefix)s: OK (%(secs).2fs)") % {"prefix": prefix, "secs": elapsed}
+                )
+                return
+            self.failed.append((name, error))
+        print_stderr(_("%(prefix)s: FAILED: %(error)s") % {"prefix": prefix, "error": error})
+
+    def _run_one(self, name):
+        start = time.time()
+        error = None
+        try:
+            domain, inactive_xmlobj, active_xmlobj = cli.get_domain_and_guest(self.conn, name)
+            edit_domain(
+                self.conn, self.options, self.action, domain, inactive_xmlobj, active_xmlobj
+            )
+        except SystemExit:
+            # cli.fail() already logged the actual error
+            error = _("see error above")
+        except Exception as e:
+            log.debug("Error processing domain '%s'", name, exc_info=True)
+            error = str(e)
+        self._report(name, start, error)
+
+    def run(self):
+        self._prime_caches()
+        jobs = max(1, min(self.options.jobs, len(self.names)))
+        log.debug("Batch processing %d domains with %d jobs", len(self.names), jobs)
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for dummy in executor.map(self._run_one, self.names):
+                pass
+        elapsed = time.time() - start
+
+        total = len(self.names)
+        print_stdout(
+            _(
+                "Batch finished: %(succeeded)d succeeded, %(failed)d failed, "
+                "%(total)d domains in %(secs).2f seconds (%(rate).1f domains/sec)"
+            )
+            % {
+                "succeeded": total - len(self.failed),
+                "failed": len(self.failed),
+                "total": total,
+                "secs": elapsed,
+                "rate": total / max(elapsed, 0.001),
+            }
+        )
+        for name, error in self.failed:
+            log.debug("Batch failure for domain '%s': %s", name, error)
+        return self.failed and 1 or 0
+
+
 #######################
 # CLI option handling #
 #######################
@@ -457,6 +660,24 @@ def parse_args():
 
     parser.add_argument("domain", nargs="?", help=_("Domain name, id, or uuid"))
 
+    batchg = parser.add_argument_group(_("Batch options"))
+    batchg.add_argument(
+        "--domains-from",
+        metavar="FILE",
+        help=_("Apply the change to every domain listed in FILE, one per line"),
+    )
+    batchg.add_argument(
+        "--domains-matching",
+        metavar="GLOB",
+        help=_("Apply the change to every domain with a name matching GLOB"),
+    )
+    batchg.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help=_("Number of domains to process in parallel in batch mode. Default: 4"),
+    )
+
     actg = parser.add_argument_group(_("XML actions"))
     actg.add_argument(
         "--edit",
@@ -590,8 +811,12 @@ def main(conn=None):
     if cli.check_osinfo_list(options):
         return 0
 
+    is_batch = bool(options.domains_from or options.domains_matching)
+    if is_batch:
+        validate_batch_options(options)
+
     options.stdinxml = None
-    if not options.domain and not options.build_xml:
+    if not options.domain and not options.build_xml and not is_batch:
         if not sys.stdin.closed and not sys.stdin.isatty():
             if options.confirm:
                 fail(_("Can't use --confirm with stdin input."))
@@ -618,6 +843,10 @@ def main(conn=None):
     conn = cli.getConnection(options.connect, conn)
     action = parse_action(conn, options)
 
+    if is_batch:
+        names = get_batch_domains(conn, options)
+        return _BatchRunner(conn, options, action, names).run()
+
     domain = None
     active_xmlobj = None
     inactive_xmlobj = None
@@ -625,7 +854,6 @@ def main(conn=None):
         domain, inactive_xmlobj, active_xmlobj = cli.get_domain_and_guest(conn, options.domain)
     else:
         inactive_xmlobj = Guest(conn, parsexml=options.stdinxml)
-    vm_is_running = bool(active_xmlobj)
 
     if action.is_build_xml:
         built_devs = action_build_xml(action, inactive_xmlobj)
@@ -634,59 +862,7 @@ def main(conn=None):
             print_stdout(xmlutil.unindent_device_xml(dev.get_xml()))
         return 0
 
-    input_devs = None
-    performed_update = False
-    if options.update:
-        if options.update and options.start:
-            fail_conflicting("--update", "--start")
-        if vm_is_running:
-            input_devs, dummy = prepare_changes(active_xmlobj, options, action)
-            update_changes(domain, input_devs, action, options.confirm)
-            performed_update = True
-        else:
-            log.warning(_("The VM is not running, --update is inapplicable."))
-        if not options.define:
-            # --update and --no-define passed, so we are done
-            return 0
-
-    original_xml = inactive_xmlobj.get_xml()
-    devs, xmlobj_to_define = prepare_changes(
-        inactive_xmlobj, options, action, input_devs=input_devs
-    )
-    if not options.define:
-        if options.start:
-            start_domain_transient(conn, xmlobj_to_define, devs, action, options.confirm)
-        return 0
-
-    dom = define_changes(conn, xmlobj_to_define, devs, action, options.confirm)
-    if not dom:
-        # --confirm user said 'no'
-        return 0
-
-    if options.start:
-        try:
-            dom.create()
-        except libvirt.libvirtError as e:  # pragma: no cover
-            fail(
-                _("Failed starting domain '%(domain)s': %(error)s")
-                % {
-                    "domain": inactive_xmlobj.name,
-                    "error": e,
-                }
-            )
-        print_stdout(_("Domain '%s' started successfully.") % inactive_xmlobj.name)
-
-    elif vm_is_running and not performed_update:
-        print_stdout(_("Changes will take effect after the domain is fully powered off."))
-    elif defined_xml_is_unchanged(conn, dom, original_xml):
-        log.warning(
-            _(
-                "XML did not change after domain define. You may "
-                "have changed a value that libvirt is setting by default."
-            )
-        )
-
-    return 0
+    return edit_domain(conn, options, action, domain, inactive_xmlobj, active_xmlobj)
 
 
 def runcli():  # pragma: no cover
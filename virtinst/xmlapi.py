@@ -4,6 +4,9 @@
 # This work is licensed under the GNU GPLv2 or later.
 # See the COPYING file in the top-level directory.
 
+import functools
+import itertools
+
 import libxml2
 
 from . import xmlutil
@@ -29,6 +32,16 @@ class _XPathSegment(object):
         #5: nodename=finalprop, is_prop=True, fullsegment=@finalprop
     """
 
+    __slots__ = [
+        "fullsegment",
+        "nodename",
+        "condition_prop",
+        "condition_val",
+        "condition_num",
+        "is_prop",
+        "nsname",
+    ]
+
     def __init__(self, fullsegment):
         self.fullsegment = fullsegment
         self.nodename = fullsegment
@@ -60,6 +73,8 @@ class _XPath(object):
     the xpath into segments.
     """
 
+    __slots__ = ["fullxpath", "segments", "is_prop", "propname", "xpath"]
+
     def __init__(self, fullxpath):
         self.fullxpath = fullxpath
         self.segments = []
@@ -68,7 +83,7 @@ class _XPath(object):
                 # Resolve and flatten .. in xpaths
                 self.segments = self.segments[:-1]
                 continue
-            self.segments.append(_XPathSegment(s))
+            self.segments.append(_compile_segment(s))
 
         self.is_prop = self.segments[-1].is_prop
         self.propname = self.is_prop and self.segments[-1].nodename or None
@@ -84,9 +99,38 @@ class _XPath(object):
         return self.join(self.segments[:-1])
 
 
+# Every XMLProperty access goes through a handful of xpath strings, so
+# parse each one only once. _XPath and _XPathSegment objects are shared
+# between callers and must be treated as read only.
+_XPATH_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=_XPATH_CACHE_SIZE)
+def _compile_segment(fullsegment):
+    return _XPathSegment(fullsegment)
+
+
+@functools.lru_cache(maxsize=_XPATH_CACHE_SIZE)
+def _compile_xpath(fullxpath):
+    return _XPath(fullxpath)
+
+
+# Source of XMLAPI generation numbers. Values are unique across all
+# documents, so a (generation) match can't come from a different document
+_generation_counter = itertools.count(1)
+
+
 class _XMLBase(object):
     NAMESPACES = {}
 
+    def __init__(self):
+        # Changes every time the document is altered. Used by callers
+        # that cache values read from the XML
+        self.generation = next(_generation_counter)
+
+    def _mark_changed(self):
+        self.generation = next(_generation_counter)
+
     @classmethod
     def register_namespace(cls, nsname, uri):
         cls.NAMESPACES[nsname] = uri
@@ -154,12 +198,13 @@ class _XMLBase(object):
             return None
         if is_bool:
             return True
-        xpathobj = _XPath(xpath)
+        xpathobj = _compile_xpath(xpath)
         if xpathobj.is_prop:
             return self._node_get_property(node, xpathobj.propname)
         return self._node_get_text(node)
 
     def set_xpath_content(self, xpath, setval):
+        self._mark_changed()
         node = self._find(xpath)
         if setval is False:
             # Boolean False, means remove the node entirely
@@ -178,6 +223,7 @@ class _XMLBase(object):
             self._node_set_content(xpath, node, setval)
 
     def node_add_xml(self, xml, xpath):
+        self._mark_changed()
         newnode = self._node_from_xml(xml)
         parentnode = self._node_make_stub(xpath)
         self._node_add_child(xpath, parentnode, newnode)
@@ -186,6 +232,7 @@ class _XMLBase(object):
         """
         Replace the node at xpath with the passed in xml
         """
+        self._mark_changed()
         newnode = self._node_from_xml(xml)
         self._node_replace_child(xpath, newnode)
 
@@ -195,7 +242,8 @@ class _XMLBase(object):
         of whether it has children or not, and then clean up the XML
         chain
         """
-        xpathobj = _XPath(fullxpath)
+        self._mark_changed()
+        xpathobj = _compile_xpath(fullxpath)
         parentnode = self._find(xpathobj.parent_xpath())
         childnode = self._find(fullxpath)
         if parentnode is None or childnode is None:
@@ -215,7 +263,7 @@ class _XMLBase(object):
         )
 
     def _node_set_content(self, xpath, node, setval):
-        xpathobj = _XPath(xpath)
+        xpathobj = _compile_xpath(xpath)
         if setval is not None:
             setval = str(setval)
         if xpathobj.is_prop:
@@ -245,7 +293,7 @@ class _XMLBase(object):
         Even if <bar> didn't exist before. So we fill in the dependent property
         expression values
         """
-        xpathobj = _XPath(fullxpath)
+        xpathobj = _compile_xpath(fullxpath)
         parentxpath = "."
         parentnode = self._find(parentxpath)
         if not parentnode:
@@ -277,7 +325,7 @@ class _XMLBase(object):
         if it doesn't have any children or attributes, so we don't
         leave stale elements in the XML
         """
-        xpathobj = _XPath(fullxpath)
+        xpathobj = _compile_xpath(fullxpath)
         segments = xpathobj.segments[:]
         parent = None
         while segments:
@@ -333,7 +381,7 @@ class _Libxml2API(_XMLBase):
         return _Libxml2API(self._doc.children.serialize())
 
     def _find(self, fullxpath):
-        xpath = _XPath(fullxpath).xpath
+        xpath = _compile_xpath(fullxpath).xpath
         try:
             node = self._ctx.xpathEval(xpath)
         except Exception as e:
@@ -392,6 +440,7 @@ class _Libxml2API(_XMLBase):
         return newnode
 
     def node_clear(self, xpath):
+        self._mark_changed()
         node = self._find(xpath)
         if node:
             propnames = [p.name for p in (node.properties or [])]
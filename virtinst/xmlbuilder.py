@@ -198,8 +198,8 @@ class XMLChildProperty(_XMLPropertyBase):
         return "<XMLChildProperty %s %s>" % (str(self.child_class), id(self))
 
     def _get(self, xmlbuilder):
-        if self.propname not in xmlbuilder._propstore and not self.is_single:
-            xmlbuilder._propstore[self.propname] = []
+        if self.propname not in xmlbuilder._propstore:
+            xmlbuilder._parse_child_prop(self)
         return xmlbuilder._propstore[self.propname]
 
     def _fget(self, xmlbuilder):
@@ -380,10 +380,23 @@ class XMLProperty(_XMLPropertyBase):
             self._is_tracked = True
 
         if self.propname in xmlbuilder._propstore:
-            val = self._nonxml_fget(xmlbuilder)
-        else:
-            val = self._get_xml(xmlbuilder)
-        return self._convert_get_value(val)
+            return self._convert_get_value(self._nonxml_fget(xmlbuilder))
+        return self._get_xml_converted(xmlbuilder)
+
+    def _get_xml_converted(self, xmlbuilder):
+        """
+        Return the converted value from the backing XML. The result is
+        cached in the _XMLState until the XML document is altered.
+        """
+        xmlstate = xmlbuilder._xmlstate
+        generation = xmlstate.xmlapi.generation
+        cached = xmlstate.value_cache.get(self)
+        if cached and cached[0] == generation:
+            return cached[1]
+
+        ret = self._convert_get_value(self._get_xml(xmlbuilder))
+        xmlstate.value_cache[self] = (generation, ret)
+        return ret
 
     def _get_xml(self, xmlbuilder):
         """
@@ -414,6 +427,17 @@ class XMLProperty(_XMLPropertyBase):
 
 
 class _XMLState(object):
+    __slots__ = [
+        "_root_name",
+        "_namespace",
+        "_relative_object_xpath",
+        "_parent_xpath",
+        "_abs_xpath_cache",
+        "value_cache",
+        "xmlapi",
+        "is_build",
+    ]
+
     def __init__(self, root_name, parsexml, parentxmlstate, relative_object_xpath):
         self._root_name = root_name
         self._namespace = ""
@@ -431,11 +455,17 @@ class _XMLState(object):
         # it will be "./domain"
         self._parent_xpath = (parentxmlstate and parentxmlstate.abs_xpath()) or ""
 
+        # Map of relative xpath -> absolute xpath for this object
+        self._abs_xpath_cache = {}
+        # Map of XMLProperty -> (xmlapi generation, converted value)
+        self.value_cache = {}
+
         self.xmlapi = None
         self.is_build = not parsexml and not parentxmlstate
         self.parse(parsexml, parentxmlstate)
 
     def parse(self, parsexml, parentxmlstate):
+        self.value_cache = {}
         if parentxmlstate:
             self.is_build = parentxmlstate.is_build or self.is_build
             self.xmlapi = parentxmlstate.xmlapi
@@ -459,11 +489,17 @@ class _XMLState(object):
             # Ensure parsexml has the correct root node
             self.xmlapi.validate_root_name(self._root_name.split(":")[-1])
 
+    def _xpaths_changed(self):
+        self._abs_xpath_cache = {}
+        self.value_cache = {}
+
     def set_relative_object_xpath(self, xpath):
         self._relative_object_xpath = xpath or ""
+        self._xpaths_changed()
 
     def set_parent_xpath(self, xpath):
         self._parent_xpath = xpath or ""
+        self._xpaths_changed()
 
     def _join_xpath(self, x1, x2):
         if x2.startswith("."):
@@ -481,7 +517,11 @@ class _XMLState(object):
         to an absolute xpath like:
             ./devices/disk[3]/driver/@name
         """
-        return self._join_xpath(self.abs_xpath() or ".", xpath)
+        ret = self._abs_xpath_cache.get(xpath)
+        if ret is None:
+            ret = self._join_xpath(self.abs_xpath() or ".", xpath)
+            self._abs_xpath_cache[xpath] = ret
+        return ret
 
 
 class XMLBuilder(object):
@@ -545,7 +585,6 @@ class XMLBuilder(object):
         self._xmlstate = _XMLState(self.XML_NAME, parsexml, parentxmlstate, relative_object_xpath)
 
         self._validate_xmlbuilder()
-        self._initial_child_parse()
         self.xml_actions = _XMLChildList(XMLManualAction, [], self, is_xml=False)
 
     def _validate_xmlbuilder(self):
@@ -570,29 +609,57 @@ class XMLBuilder(object):
 
         setattr(self.__class__, cachekey, True)
 
-    def _initial_child_parse(self):
-        # Walk the XML tree and hand of parsing to any registered
-        # child classes
-        for xmlprop in list(self._all_child_props().values()):
-            child_class = xmlprop.child_class
-            prop_path = xmlprop.get_prop_xpath(self, child_class)
+    def _parse_child_prop(self, xmlprop):
+        """
+        Walk the XML tree and hand off parsing to the child class
+        registered with xmlprop, storing the result in _propstore.
 
-            if xmlprop.is_single:
-                obj = child_class(
-                    self.conn, parentxmlstate=self._xmlstate, relative_object_xpath=prop_path
-                )
-                xmlprop.set(self, obj)
-                continue
+        This is done on first access of the XMLChildProperty. Most users
+        only look at a handful of top level properties, so this saves
+        building an object for every device of every parsed guest.
+        """
+        child_class = xmlprop.child_class
+        prop_path = xmlprop.get_prop_xpath(self, child_class)
 
-            nodecount = self._xmlstate.xmlapi.count(self._xmlstate.make_abs_xpath(prop_path))
-            for idx in range(nodecount):
-                idxstr = "[%d]" % (idx + 1)
-                obj = child_class(
-                    self.conn,
-                    parentxmlstate=self._xmlstate,
-                    relative_object_xpath=(prop_path + idxstr),
-                )
-                xmlprop.append(self, obj)
+        if xmlprop.is_single:
+            obj = child_class(
+                self.conn, parentxmlstate=self._xmlstate, relative_object_xpath=prop_path
+            )
+            xmlprop.set(self, obj)
+            return
+
+        objs = []
+        nodecount = self._xmlstate.xmlapi.count(self._xmlstate.make_abs_xpath(prop_path))
+        for idx in range(nodecount):
+            idxstr = "[%d]" % (idx + 1)
+            obj = child_class(
+                self.conn,
+                parentxmlstate=self._xmlstate,
+                relative_object_xpath=(prop_path + idxstr),
+            )
+            objs.append(obj)
+        xmlprop.set(self, objs)
+
+    def _parsed_children(self):
+        """
+        Return all child objects that have already been instantiated.
+        Children that haven't been accessed yet will pick up the current
+        xpaths and XML state when they are parsed, so they don't need
+        any updating.
+        """
+        ret = []
+        for propname in self._all_child_props():
+            if propname in self._propstore:
+                ret.extend(xmlutil.listify(self._propstore[propname]))
+        return ret
+
+    def _parse_all_children(self):
+        """
+        Instantiate every child object in the hierarchy
+        """
+        for propname in self._all_child_props():
+            for obj in xmlutil.listify(getattr(self, propname)):
+                obj._parse_all_children()
 
     def __repr__(self):
         return "<%s %s %s>" % (self.__class__.__name__.split(".")[-1], self.XML_NAME, id(self))
@@ -605,6 +672,10 @@ class XMLBuilder(object):
         """
         Return XML string of the object
         """
+        # Children need to be parsed against the XML as it is now,
+        # before any of our pending property values are written to it
+        self._parse_all_children()
+
         xmlapi = self._xmlstate.xmlapi
         if self._xmlstate.is_build:
             xmlapi = xmlapi.copy_api()
@@ -714,9 +785,8 @@ class XMLBuilder(object):
         self._xmlstate.set_parent_xpath(parent_xpath)
         if relative_object_xpath != -1:
             self._xmlstate.set_relative_object_xpath(relative_object_xpath)
-        for propname in self._all_child_props():
-            for p in xmlutil.listify(getattr(self, propname, [])):
-                p._set_xpaths(self._xmlstate.abs_xpath())
+        for p in self._parsed_children():
+            p._set_xpaths(self._xmlstate.abs_xpath())
 
     def _set_child_xpaths(self):
         """
@@ -726,7 +796,9 @@ class XMLBuilder(object):
         """
         typecount = {}
         for propname, xmlprop in self._all_child_props().items():
-            for obj in xmlutil.listify(getattr(self, propname)):
+            if propname not in self._propstore:
+                continue
+            for obj in xmlutil.listify(self._propstore[propname]):
                 idxstr = ""
                 if not xmlprop.is_single:
                     class_type = obj.__class__
@@ -743,9 +815,8 @@ class XMLBuilder(object):
         Set new backing XML objects in ourselves and all our child props
         """
         self._xmlstate.parse(*args, **kwargs)
-        for propname in self._all_child_props():
-            for p in xmlutil.listify(getattr(self, propname, [])):
-                p._parse_with_children(None, self._xmlstate)
+        for p in self._parsed_children():
+            p._parse_with_children(None, self._xmlstate)
 
     def add_child(self, obj, idx=None):
         """